@@ -0,0 +1,91 @@
+import argparse
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def add_parser(subparsers, parents: list):
+    parser = subparsers.add_parser(
+        'clone', parents=parents,
+        help='copy new and updated extraction results from the local to the remote mongo'
+    )
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.set_defaults(run=run)
+
+
+def _cloned_doc(doc: dict, cloned_at: datetime.datetime) -> dict:
+    """
+    the remote's readers (e.g. the parquet mirror) re-sync docs by updated_at, which has to be the time the doc
+    reached the remote, the local one may be older than their last sync. the local one is kept as cloned_updated_at
+    to find docs updated since the last clone
+    """
+    return {**doc, 'updated_at': cloned_at, 'cloned_updated_at': doc.get('updated_at')}
+
+
+def run(args: argparse.Namespace, config: dict):
+    from pymongo import MongoClient, ReplaceOne
+
+    # Source database
+    source_client = MongoClient(config['mongo']['local'])
+    source_db = source_client['html_downloads']
+    source_collection = source_db['llm_feature_extract_dest']
+
+    # Destination database
+    dest_client = MongoClient(config['mongo']['remote'])
+    dest_db = dest_client['html_downloads']
+    dest_collection = dest_db['llm_feature_extract']
+
+    batch_size = args.batch_size
+    skip = 0
+
+    while True:
+
+        # max_id_in_dst = dest_collection.find_one(sort=[('_id', -1)], projection={'_id': 1})
+
+        # if max_id_in_dst is not None:
+        #     find_query = {'_id': {'$gt': max_id_in_dst['_id']}}
+        # else:
+        #     find_query = {}
+        find_query = {}
+
+        logger.info(f'Reading {batch_size} docs, skip={skip}')
+
+        source_updated_at_by_id = {
+            d['_id']: d.get('updated_at')
+            for d in
+            source_collection.find(find_query, {'_id': 1, 'updated_at': 1}).sort('_id', 1).skip(skip).limit(batch_size)
+        }
+        if not source_updated_at_by_id:
+            break
+
+        min_id = min(source_updated_at_by_id)
+        max_id = max(source_updated_at_by_id)
+
+        dest_cloned_updated_at_by_id = {
+            d['_id']: d.get('cloned_updated_at')
+            for d in
+            dest_collection.find({'_id': {'$gte': min_id, '$lte': max_id}}, {'_id': 1, 'cloned_updated_at': 1})
+        }
+
+        missing_ids = set(source_updated_at_by_id) - set(dest_cloned_updated_at_by_id)
+        # updated in place locally (merged field groups, resolved symbols, post metadata) since the last clone
+        updated_ids = {
+            _id for _id, cloned_updated_at in dest_cloned_updated_at_by_id.items()
+            if source_updated_at_by_id.get(_id) is not None and source_updated_at_by_id[_id] != cloned_updated_at
+        }
+
+        if missing_ids or updated_ids:
+            logger.info(f'Writing {len(missing_ids)} missing and {len(updated_ids)} updated docs, skip={skip}')
+            cloned_at = datetime.datetime.now(datetime.timezone.utc)
+            dest_collection.bulk_write(
+                [
+                    ReplaceOne({'_id': doc['_id']}, _cloned_doc(doc, cloned_at), upsert=True)
+                    for doc in source_collection.find({'_id': {'$in': list(missing_ids | updated_ids)}})
+                ],
+                ordered=False
+            )
+
+        skip += batch_size
+
+    logger.info('Done')
@@ -0,0 +1,30 @@
+import logging
+import os
+
+
+def setup_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler()
+        ]
+    )
+
+
+def resolve_config_path(config_path: str | None) -> str:
+    if config_path is not None:
+        return config_path
+
+    # scripts used to be run from the scripts dir with ../config.toml, the cli is run from the root dir
+    for candidate in ('config.toml', '../config.toml'):
+        if os.path.exists(candidate):
+            return candidate
+
+    raise FileNotFoundError('config.toml not found, copy config-template.toml to config.toml or pass --config')
+
+
+def load_config(config_path: str | None) -> dict:
+    import toml
+
+    return toml.load(resolve_config_path(config_path))
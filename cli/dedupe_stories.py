@@ -0,0 +1,90 @@
+import argparse
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def add_parser(subparsers, parents: list):
+    parser = subparsers.add_parser(
+        'dedupe-stories', parents=parents,
+        help='cluster near-duplicate (syndicated) articles by summary embedding similarity'
+    )
+    parser.add_argument('--start', type=datetime.date.fromisoformat, required=True, help='publish date, ISO format')
+    parser.add_argument('--end', type=datetime.date.fromisoformat, required=True, help='exclusive publish date')
+    parser.add_argument('--window-hours', type=float, default=48, help='max publish time distance of duplicates')
+    parser.add_argument('--threshold', type=float, default=0.92, help='min cosine similarity of duplicates')
+    parser.add_argument('--block-size', type=int, default=4_096)
+    parser.add_argument('--mmap-path', help='memory-map the loaded embeddings to this .npy file to bound memory')
+    parser.add_argument(
+        '--embedding-store',
+        action='store_true',
+        help='read embeddings from the local embedding store (see export-embeddings) instead of mongo'
+    )
+    parser.set_defaults(run=run)
+
+
+def load_embeddings_from_store(root_dir: str, start: datetime.datetime, end_excl: datetime.datetime):
+    import polars as pl
+    from bson import ObjectId
+
+    from embeddings.embedding_store import EmbeddingStore, RowSelection
+
+    store = EmbeddingStore(root_dir)
+    index = store.read_index().filter(
+        pl.col('publish_time').dt.replace_time_zone(None).is_between(start, end_excl, closed='left')
+    )
+
+    embeddings = RowSelection(store.open_matrix(), index['row'].to_numpy())
+    publish_times = index['publish_time'].dt.replace_time_zone(None).to_numpy()
+    ids = [ObjectId(_id) for _id in index['_id']]
+
+    return embeddings, publish_times, ids
+
+
+def run(args: argparse.Namespace, config: dict):
+    import more_itertools
+    import numpy as np
+    from pymongo import MongoClient, UpdateOne
+
+    from embeddings.similarity_index import BlockwiseSimilarityIndex, load_embeddings_from_mongo
+
+    client = MongoClient(config['mongo']['remote'])
+    collection = client['html_downloads']['llm_feature_extract']
+
+    start = datetime.datetime.combine(args.start, datetime.time.min)
+    end_excl = datetime.datetime.combine(args.end, datetime.time.min)
+
+    if args.embedding_store:
+        embeddings, publish_times, ids = load_embeddings_from_store(config['embedding_store']['root'], start, end_excl)
+    else:
+        embeddings, publish_times, ids = load_embeddings_from_mongo(collection, start, end_excl, args.mmap_path)
+    logger.info(f'Loaded {len(ids)} embeddings published in [{args.start}, {args.end})')
+    if not ids:
+        logger.info('No docs, nothing to cluster')
+        return
+
+    index = BlockwiseSimilarityIndex(embeddings, publish_times, ids, args.block_size)
+    cluster_roots = index.cluster_near_duplicates(datetime.timedelta(hours=args.window_hours), args.threshold)
+
+    # articles without story_cluster_id are their own story
+    collection.update_many(
+        {'publish_time': {'$gte': start, '$lt': end_excl}, 'story_cluster_id': {'$exists': True}},
+        {'$unset': {'story_cluster_id': ''}}
+    )
+
+    cluster_sizes = np.bincount(cluster_roots, minlength=len(cluster_roots))
+    clustered_rows = np.nonzero(cluster_sizes[cluster_roots] > 1)[0]
+    logger.info(
+        f'{len(clustered_rows)} articles are in {int((cluster_sizes > 1).sum())} clusters of near-duplicate stories')
+
+    for rows_batch in more_itertools.chunked(clustered_rows.tolist(), 10_000):
+        collection.bulk_write(
+            [
+                UpdateOne({'_id': ids[row]}, {'$set': {'story_cluster_id': ids[cluster_roots[row]]}})
+                for row in rows_batch
+            ],
+            ordered=False
+        )
+
+    logger.info('Done')
@@ -0,0 +1,115 @@
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def add_parser(subparsers, parents: list):
+    parser = subparsers.add_parser(
+        'embed', parents=parents,
+        help='calculate missing summary embeddings of extraction results'
+    )
+    parser.add_argument('--batch-size', type=int, default=1_000)
+    parser.add_argument(
+        '--backend',
+        choices=['grpc', 'local'],
+        default='grpc',
+        help='grpc: remote embedding server. local: in-process sentence-transformers on CPU'
+    )
+    parser.add_argument('--local-model', help='sentence-transformers model, defaults to [embedding_local] model_name')
+    parser.add_argument('--threads', type=int, help='torch CPU threads of the local backend')
+    parser.add_argument(
+        '--pipelined',
+        action='store_true',
+        help='overlap mongo reads, embedding calls and bulk writes, walking _id with a single watermark cursor'
+    )
+    parser.add_argument('--queue-size', type=int, default=4, help='batches buffered between pipelined stages')
+    parser.set_defaults(run=run)
+
+
+def build_embedding_backend(args: argparse.Namespace, config: dict):
+    if args.backend == 'local':
+        from embeddings.sentence_transformer_backend import SentenceTransformerEmbeddingBackend
+
+        return SentenceTransformerEmbeddingBackend(
+            args.local_model or config['embedding_local']['model_name'],
+            num_threads=args.threads,
+        )
+
+    from embeddings.embedding_calc import GrpcEmbeddingClient
+
+    config_embedding_server = config['embedding_server']
+    return GrpcEmbeddingClient(
+        config_embedding_server['host'],
+        compression_level=config_embedding_server.get('compression_level', 3),
+        dictionary_path=config_embedding_server.get('zstd_dictionary_path') or None,
+    )
+
+
+def run(args: argparse.Namespace, config: dict):
+    import time
+
+    import numpy as np
+    from pymongo import MongoClient, UpdateOne
+
+    client = MongoClient(config['mongo']['remote'])
+    db = client['html_downloads']
+    collection = db['llm_feature_extract']
+
+    batch_size = args.batch_size
+
+    embedding_backend = build_embedding_backend(args, config)
+
+    if args.pipelined:
+        from embeddings.embedding_pipeline import PipelinedSummaryEmbedder
+
+        embedded_count = PipelinedSummaryEmbedder(
+            collection, embedding_backend, batch_size, args.queue_size
+        ).run()
+        logger.info(f'Done, embedded {embedded_count} summaries')
+        return
+
+    while True:
+
+        find_query = {'summary_embeddings': {'$exists': False}}
+
+        logger.info(f'Reading {batch_size} docs')
+
+        summary_docs = list(
+            collection
+            .find(find_query, {"summary": 1})
+            .sort('_id', 1)
+            .limit(batch_size)
+        )
+
+        if not summary_docs:
+            break
+
+        upsert_operations = []
+
+        summary_part_only_list = list(d['summary'] for d in summary_docs)
+        start_time = time.perf_counter()
+        embeddings_docs = embedding_backend.calc_embeddings(summary_part_only_list)
+        elapsed = time.perf_counter() - start_time
+        logger.info(
+            f'{embedding_backend.name} embedded {len(summary_part_only_list)} summaries in {elapsed:.2f}s, '
+            f'{len(summary_part_only_list) / elapsed:.1f} texts/s')
+
+        for embedding, orig_doc in zip(embeddings_docs, summary_docs):
+            embedding: np.ndarray
+            upsert_operations.append(
+                UpdateOne(
+                    {'_id': orig_doc['_id']},
+                    {'$set': {'summary_embeddings': embedding.tolist()}},
+                )
+            )
+
+        if upsert_operations:
+            logger.info(f'Writing {len(summary_docs)} missing summary embeddings')
+
+            collection.bulk_write(
+                upsert_operations,
+                ordered=False
+            )
+
+    logger.info('Done')
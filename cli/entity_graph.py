@@ -0,0 +1,48 @@
+import argparse
+import datetime as dt
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def add_parser(subparsers, parents: list):
+    parser = subparsers.add_parser(
+        'entity-graph', parents=parents,
+        help='incrementally build the entity relationship graph index, optionally query an entity\'s neighbours'
+    )
+    parser.add_argument('--root', help='index root dir, defaults to [entity_graph] root in the config')
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.add_argument('--no-sync', action='store_true', help='only query the saved index')
+    parser.add_argument('--entity', help='entity to list the neighbours of')
+    parser.add_argument('--days', type=int, help='only relationships of articles published in the last N days')
+    parser.add_argument('--entity-types', nargs='+', help='neighbour entity_type filter, e.g. company')
+    parser.add_argument('--min-strength', type=float, default=0.0)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.set_defaults(run=run)
+
+
+def run(args: argparse.Namespace, config: dict):
+    from feature_export.entity_graph import EntityGraphIndex
+
+    root = args.root or config['entity_graph']['root']
+    index = EntityGraphIndex.load(root)
+
+    if not args.no_sync:
+        from pymongo import MongoClient
+
+        client = MongoClient(config['mongo']['remote'])
+        collection = client['html_downloads']['llm_feature_extract']
+
+        added_count = index.sync(collection, args.batch_size)
+        index.save(root)
+        logger.info(f'Added or replaced {added_count} docs, {len(index.entity_names)} entities, {index.edge_count} edges')
+
+    if args.entity:
+        start = dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=args.days) if args.days else None
+        for neighbour in index.neighbours(
+                args.entity, start=start, min_strength=args.min_strength, entity_types=args.entity_types,
+                limit=args.limit):
+            logger.info(
+                f'{neighbour.entity} ({neighbour.entity_type}): {neighbour.edge_count} edges, '
+                f'max strength {neighbour.max_strength:.2f}, last seen {neighbour.last_seen}, '
+                f'{", ".join(neighbour.relations)}')
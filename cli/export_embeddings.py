@@ -0,0 +1,28 @@
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def add_parser(subparsers, parents: list):
+    parser = subparsers.add_parser(
+        'export-embeddings', parents=parents,
+        help='incrementally append summary embeddings to the local memory-mapped embedding store'
+    )
+    parser.add_argument('--root', help='store root dir, defaults to [embedding_store] root in the config')
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.set_defaults(run=run)
+
+
+def run(args: argparse.Namespace, config: dict):
+    from pymongo import MongoClient
+
+    from embeddings.embedding_store import EmbeddingStore
+
+    client = MongoClient(config['mongo']['remote'])
+    collection = client['html_downloads']['llm_feature_extract']
+
+    store = EmbeddingStore(args.root or config['embedding_store']['root'])
+    appended_count = store.sync(collection, args.batch_size)
+
+    logger.info(f'Done, appended {appended_count} embeddings')
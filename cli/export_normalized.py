@@ -0,0 +1,28 @@
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def add_parser(subparsers, parents: list):
+    parser = subparsers.add_parser(
+        'export-normalized', parents=parents,
+        help='incrementally export extraction results as flat parquet tables keyed by url'
+    )
+    parser.add_argument('--root', help='export root dir, defaults to [normalized_export] root in the config')
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.set_defaults(run=run)
+
+
+def run(args: argparse.Namespace, config: dict):
+    from pymongo import MongoClient
+
+    from feature_export.normalized_export import NormalizedFeatureExport
+
+    client = MongoClient(config['mongo']['remote'])
+    collection = client['html_downloads']['llm_feature_extract']
+
+    export = NormalizedFeatureExport(args.root or config['normalized_export']['root'], args.batch_size)
+    exported_count = export.sync(collection)
+
+    logger.info(f'Done, exported {exported_count} new and updated docs')
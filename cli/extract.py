@@ -0,0 +1,238 @@
+import argparse
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def add_parser(subparsers, parents: list):
+    parser = subparsers.add_parser(
+        'extract', parents=parents,
+        help='LLM feature extraction of news articles'
+    )
+    parser.add_argument(
+        '--mode',
+        choices=['range', 'sharded', 'field-groups', 'replay-dead-letters', 'live-tail', 'replay-responses'],
+        default='range',
+        help='range: one process over [start, end). sharded: claim day shards of [start, end) with other workers. '
+             'field-groups: re-extract missing/outdated field groups. replay-dead-letters: retry failed docs. '
+             'live-tail: extract newly downloaded docs as they land, [start, end) is backfilled when idle. '
+             'replay-responses: re-parse the responses recorded in [llm_response_log] root for the saved docs '
+             '(of [start, end) if given) without calling the LLM, written to --replay-dest'
+    )
+    parser.add_argument('--start', type=datetime.date.fromisoformat, help='start date, ISO format')
+    parser.add_argument('--end', type=datetime.date.fromisoformat, help='exclusive end date, ISO format')
+    parser.add_argument('--shard-days', type=int, default=1)
+    parser.add_argument('--worker-id', help='defaults to <hostname>-<pid>')
+    parser.add_argument('--field-groups', nargs='+', help='field groups to re-extract, defaults to all')
+    parser.add_argument('--max-failure-count', type=int, help='only replay docs which failed at most this many times')
+    parser.add_argument(
+        '--lookback-minutes',
+        type=int,
+        default=60,
+        help='live-tail: re-read docs downloaded this far before the latest stored doc (or now if none was stored '
+             'within it), docs which were in flight when the last run stopped are extracted, stored ones skipped'
+    )
+    parser.add_argument('--concurrency', type=int, default=5, help='live-tail: docs extracted at a time')
+    parser.add_argument(
+        '--db-pool-size',
+        type=int,
+        default=8,
+        help='mongo and clickhouse connections (and clickhouse I/O threads) shared by concurrent reads and writes'
+    )
+    parser.add_argument(
+        '--prefilter',
+        action='store_true',
+        help='skip articles without tickers and financial keywords before the LLM, by default every article is sent'
+    )
+    parser.add_argument(
+        '--no-symbol-resolution',
+        action='store_true',
+        help='write extracted symbols as is, even if [symbol_master] paths are configured'
+    )
+    parser.add_argument(
+        '--replay-dest',
+        help='replay-responses: mongo collection the replayed docs overwrite, '
+             'defaults to [llm_response_log] replay_dest'
+    )
+    parser.add_argument('--test-single-write', action='store_true')
+    parser.set_defaults(run=run)
+
+
+def get_llm_provider():
+    try:
+        from proprietary_setup import llm_provider
+    except ImportError:
+        raise RuntimeError('proprietary_setup.llm_provider is required for LLM extraction')
+    return llm_provider
+
+
+def build_llm_provider(config: dict):
+    """
+    :return: the proprietary llm provider, or a router over its llm wrappers if [model_routing] is enabled
+    """
+    from feature_extractor.model_routing import LatencyAwareLlmRouter, ModelRoute
+
+    config_model_routing = config.get('model_routing', {})
+    if not config_model_routing.get('enabled'):
+        return get_llm_provider()
+
+    try:
+        from proprietary_setup import llm_wrappers
+    except ImportError:
+        raise RuntimeError('proprietary_setup.llm_wrappers, one per configured model and api key, '
+                           'is required for model routing')
+
+    return LatencyAwareLlmRouter(
+        llm_wrappers,
+        routes=[ModelRoute(**route) for route in config_model_routing.get('routes', [])],
+        max_error_rate=config_model_routing.get('max_error_rate', 0.2),
+        explore_rate=config_model_routing.get('explore_rate', 0.05),
+    )
+
+
+def build_symbol_resolver(config: dict):
+    """
+    :return: resolver over the configured symbol master files, None if none are configured
+    """
+    from feature_extractor.symbol_resolution import SymbolMasterResolver
+
+    config_symbol_master = config.get('symbol_master', {})
+    if not config_symbol_master.get('paths'):
+        return None
+    return SymbolMasterResolver(config_symbol_master['paths'], config_symbol_master.get('default_exchange') or None)
+
+
+def build_feature_extractor(args: argparse.Namespace, config: dict):
+    from feature_extractor.feature_extract import (
+        GeminiFinancialNewsDataExtractor, HedgePolicy, ReplayFinancialNewsDataExtractor
+    )
+    from feature_extractor.llm_response_log import LlmResponseLog
+
+    config_response_log = config.get('llm_response_log', {})
+    if args.mode == 'replay-responses':
+        if not config_response_log.get('root'):
+            raise ValueError('[llm_response_log] root is required to replay responses')
+        return ReplayFinancialNewsDataExtractor.from_log(config_response_log['root'])
+
+    response_log = None
+    if config_response_log.get('record') and config_response_log.get('root'):
+        response_log = LlmResponseLog(
+            config_response_log['root'], config_response_log.get('max_records_per_file', 10_000))
+    hedge_policy = None
+    config_hedging = config.get('llm_hedging', {})
+    if config_hedging.get('enabled'):
+        hedge_policy = HedgePolicy(**{key: value for key, value in config_hedging.items() if key != 'enabled'})
+
+    return GeminiFinancialNewsDataExtractor(
+        build_llm_provider(config), response_log=response_log, hedge_policy=hedge_policy)
+
+
+def build_extractor_pipeline(args: argparse.Namespace, config: dict):
+    import clickhouse_connect
+    from clickhouse_connect.driver import AsyncClient
+    from clickhouse_connect.driver.httputil import get_pool_manager
+    from pymongo import AsyncMongoClient, MongoClient
+    from pymongo.errors import OperationFailure
+
+    from feature_extractor.extractor_pipelines import ExtractorPipeline
+    from feature_extractor.raw_html_reading import (
+        AsyncClickhouseRawHtmlReader, AsyncMongoFeatureResultRepo, MongoFeatureResultRepo
+    )
+    from feature_extractor.relevance_prefilter import KeywordRelevancePrefilter
+
+    # the sync client is for shard coordination and index creation, the pipeline uses the async one
+    mongo_client = MongoClient(config['mongo']['local'])
+    async_mongo_client = AsyncMongoClient(config['mongo']['local'], maxPoolSize=args.db_pool_size)
+
+    config_clickhouse = config['clickhouse']
+    ch_client = clickhouse_connect.get_client(
+        username=config_clickhouse['username'],
+        password=config_clickhouse['password'],
+        database=config_clickhouse['database'],
+        # concurrent queries aren't allowed within a session
+        autogenerate_session_id=False,
+        pool_mgr=get_pool_manager(maxsize=args.db_pool_size),
+    )
+    ch_html_reader = AsyncClickhouseRawHtmlReader(AsyncClient(client=ch_client, executor_threads=args.db_pool_size))
+
+    # mongo_raw_html_reader = ThreadPoolRawHtmlReader(MongoRawHtmlReader(mongo_client))
+
+    feature_result_repo = AsyncMongoFeatureResultRepo(async_mongo_client)
+
+    # writes are upserts by url, the unique index makes concurrent writers of one url store it once
+    try:
+        MongoFeatureResultRepo(mongo_client).ensure_url_index()
+    except OperationFailure as e:
+        # e.g. duplicate urls stored before writes were upserts, they have to be removed to create the index
+        logger.warning(f'Unique url index not created, concurrent writers may store a url twice until the '
+                       f'duplicate urls are removed: {e}')
+
+    symbol_resolver = None if args.no_symbol_resolution else build_symbol_resolver(config)
+    if symbol_resolver is not None:
+        MongoFeatureResultRepo(mongo_client).ensure_symbol_indexes()
+
+    extractor_pipeline = ExtractorPipeline(
+        raw_html_reader=ch_html_reader,
+        feature_extractor=build_feature_extractor(args, config),
+        feature_result_repo=feature_result_repo,
+        test_single_write=args.test_single_write,
+        relevance_prefilter=KeywordRelevancePrefilter() if args.prefilter else None,
+        symbol_resolver=symbol_resolver,
+    )
+
+    return extractor_pipeline, mongo_client
+
+
+def run(args: argparse.Namespace, config: dict):
+    import asyncio
+
+    if args.mode in ('range', 'sharded') and (args.start is None or args.end is None):
+        raise ValueError(f'--start and --end are required in {args.mode} mode')
+
+    extractor_pipeline, mongo_client = build_extractor_pipeline(args, config)
+
+    if args.mode == 'range':
+        logger.info(f'running pipeline for dates [{args.start}, {args.end})')
+        asyncio.run(extractor_pipeline.run(args.start, args.end))
+
+    elif args.mode == 'sharded':
+        from feature_extractor.shard_coordination import MongoShardCoordinator, ShardedExtractorWorker
+
+        shard_coordinator = MongoShardCoordinator(mongo_client)
+
+        # every worker may run with the same dates, shard creation is idempotent
+        created_count = shard_coordinator.create_shards(args.start, args.end, args.shard_days)
+        logger.info(f'created {created_count} new shards for dates [{args.start}, {args.end})')
+
+        worker = ShardedExtractorWorker(extractor_pipeline, shard_coordinator, args.worker_id)
+        logger.info(f'running worker {worker.worker_id}')
+        asyncio.run(worker.run())
+
+    elif args.mode == 'field-groups':
+        logger.info(f'running field group re-extraction for {args.field_groups or "all field groups"}')
+        asyncio.run(extractor_pipeline.run_field_group_reextraction(args.field_groups))
+
+    elif args.mode == 'replay-dead-letters':
+        logger.info('replaying dead-lettered docs')
+        asyncio.run(extractor_pipeline.replay_dead_letters(args.max_failure_count))
+
+    elif args.mode == 'replay-responses':
+        from feature_extractor.raw_html_reading import AsyncMongoFeatureResultRepo
+
+        replay_dest = args.replay_dest or config.get('llm_response_log', {}).get('replay_dest')
+        if not replay_dest:
+            raise ValueError('--replay-dest or [llm_response_log] replay_dest is required to replay responses')
+        replay_result_repo = AsyncMongoFeatureResultRepo(
+            extractor_pipeline.feature_result_repo.async_mongo_client, replay_dest)
+
+        logger.info(f'replaying recorded responses into {replay_dest}')
+        asyncio.run(extractor_pipeline.replay_recorded_responses(replay_result_repo, args.start, args.end))
+
+    elif args.mode == 'live-tail':
+        from feature_extractor.live_tail import LiveTailExtractorWorker
+
+        worker = LiveTailExtractorWorker(extractor_pipeline, concurrency=args.concurrency)
+        logger.info('tailing newly downloaded docs' + (
+            f', backfilling [{args.start}, {args.end})' if args.start is not None and args.end is not None else ''))
+        asyncio.run(worker.run(datetime.timedelta(minutes=args.lookback_minutes), args.start, args.end))
@@ -0,0 +1,77 @@
+import argparse
+import logging
+
+from cli import (
+    clone, dedupe_stories, embed, entity_graph, export_embeddings, export_normalized, extract, mirror_features,
+    news_reactions, ohlc, post_metadata, resample_bars, resolve_symbols, train_zstd_dict
+)
+from cli.config import setup_logging, load_config
+
+logger = logging.getLogger(__name__)
+
+# command modules only import argparse-level dependencies at module level,
+# heavy stacks (LLM clients, trafilatura, polars, duckdb, grpc, ...) are imported inside each command's run
+COMMANDS = [
+    extract,
+    clone,
+    post_metadata,
+    embed,
+    ohlc,
+    mirror_features,
+    export_embeddings,
+    dedupe_stories,
+    train_zstd_dict,
+    resample_bars,
+    news_reactions,
+    export_normalized,
+    entity_graph,
+    resolve_symbols,
+]
+
+
+def build_common_parser(default) -> argparse.ArgumentParser:
+    common_parser = argparse.ArgumentParser(add_help=False)
+    common_parser.add_argument(
+        '--config',
+        default=default if default is argparse.SUPPRESS else None,
+        help='path to config.toml, defaults to ./config.toml or ../config.toml'
+    )
+    common_parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        default=default if default is argparse.SUPPRESS else False,
+        help='parse arguments and config, log what would run and exit without connecting to any db'
+    )
+    return common_parser
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='feature-extract',
+        description='ETL between MongoDB, DuckDB and ClickhouseDB, LLM feature extraction and OHLCV downloads',
+        parents=[build_common_parser(default=None)]
+    )
+
+    # common options are accepted both before and after the command,
+    # SUPPRESS keeps the subcommand from overwriting a value given before the command
+    subcommand_common_parser = build_common_parser(default=argparse.SUPPRESS)
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command in COMMANDS:
+        command.add_parser(subparsers, [subcommand_common_parser])
+
+    return parser
+
+
+def main(argv: list[str] | None = None):
+    args = build_parser().parse_args(argv)
+
+    setup_logging()
+    config = load_config(args.config)
+
+    if args.dry_run:
+        command_args = {k: v for k, v in vars(args).items() if k not in ('run', 'config', 'dry_run')}
+        logger.info(f'dry run, would run: {command_args}')
+        return
+
+    args.run(args, config)
@@ -0,0 +1,28 @@
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def add_parser(subparsers, parents: list):
+    parser = subparsers.add_parser(
+        'mirror-features', parents=parents,
+        help='incrementally mirror extraction results from mongo into local date partitioned parquet'
+    )
+    parser.add_argument('--root', help='mirror root dir, defaults to [feature_mirror] root in the config')
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.set_defaults(run=run)
+
+
+def run(args: argparse.Namespace, config: dict):
+    from pymongo import MongoClient
+
+    from feature_export.parquet_mirror import ParquetFeatureMirror
+
+    client = MongoClient(config['mongo']['remote'])
+    collection = client['html_downloads']['llm_feature_extract']
+
+    mirror = ParquetFeatureMirror(args.root or config['feature_mirror']['root'], args.batch_size)
+    mirrored_count = mirror.sync(collection)
+
+    logger.info(f'Done, mirrored {mirrored_count} new and updated docs')
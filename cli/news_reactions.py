@@ -0,0 +1,52 @@
+import argparse
+import datetime as dt
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def add_parser(subparsers, parents: list):
+    parser = subparsers.add_parser(
+        'news-reactions', parents=parents,
+        help='forward returns and volume shocks after each article for the symbols of its financial events'
+    )
+    parser.add_argument('--start', type=dt.date.fromisoformat, required=True, help='first NY publish date')
+    parser.add_argument('--end', type=dt.date.fromisoformat, required=True, help='last NY publish date, inclusive')
+    parser.add_argument('--horizons', nargs='+', default=['5m', '30m', '1h', '1d'], help='polars durations')
+    parser.add_argument('--session', choices=['regular', 'extended'], default='regular')
+    parser.add_argument('--baseline-sessions', type=int, default=20)
+    parser.add_argument('--symbols-per-batch', type=int, default=50)
+    parser.add_argument('--root', help='feature mirror root dir, defaults to [feature_mirror] root in the config')
+    parser.add_argument('--out', required=True, help='output parquet path')
+    parser.set_defaults(run=run)
+
+
+def run(args: argparse.Namespace, config: dict):
+    import polars as pl
+    from pymongo import MongoClient
+
+    from feature_export.news_reactions import compute_news_reactions_batched, explode_article_symbols
+    from feature_export.parquet_mirror import scan_feature_mirror
+    from ohlc_downloader.trading_calendar import NyseTradingCalendar
+
+    mongo_client = MongoClient(config['mongo']['remote'])
+    minute_mongo_ohlc_collection = mongo_client['html_downloads']['minute_ohlc_data']
+
+    articles_df = explode_article_symbols(
+        scan_feature_mirror(args.root or config['feature_mirror']['root'])
+        .filter(pl.col('publish_date').is_between(args.start, args.end))
+    ).collect()
+    logger.info(f'{len(articles_df)} article symbols published {args.start} - {args.end}')
+
+    reactions_df = compute_news_reactions_batched(
+        articles_df,
+        minute_mongo_ohlc_collection,
+        NyseTradingCalendar(),
+        args.horizons,
+        args.session,
+        args.baseline_sessions,
+        args.symbols_per_batch
+    )
+    reactions_df.write_parquet(args.out)
+
+    logger.info(f'Done, wrote {len(reactions_df)} reactions to {args.out}')
@@ -0,0 +1,345 @@
+import argparse
+import datetime as dt
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def add_parser(subparsers, parents: list):
+    parser = subparsers.add_parser(
+        'ohlc', parents=parents,
+        help='download minute OHLCV bars for symbols mentioned in news'
+    )
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument(
+        '--local-features',
+        action='store_true',
+        help='discover symbols from the local parquet feature mirror (see mirror-features) instead of motherduck'
+    )
+    parser.add_argument(
+        '--mongo-symbols',
+        action='store_true',
+        help='discover symbols with the indexed listings of resolved extraction results (see resolve-symbols) '
+             'instead of unnesting financial events'
+    )
+    parser.set_defaults(run=run)
+
+
+def get_ohlc_downloader():
+    try:
+        from proprietary_setup import ohlc_downloader
+    except ImportError:
+        raise RuntimeError('proprietary_setup.ohlc_downloader is required for downloading OHLC data')
+    return ohlc_downloader
+
+
+# symbols of the local parquet mirror are nested structs rather than json
+LOCAL_FEATURES_SYMBOL_QUERY = """
+        SELECT
+          publish_time_NY,
+          upper(event.symbol.symbol) AS symbol,
+          upper(unnest(event.symbol.stock_exchanges)) AS exchange
+        FROM (
+          SELECT
+            timezone('America/New_York', publish_time_ny) AS publish_time_NY,
+            unnest(financial_event_with_symbols) AS event
+          FROM llm_feature_extract_local
+        )
+"""
+
+MOTHERDUCK_FEATURES_SYMBOL_QUERY = """
+        SELECT 
+          publish_time_NY,
+          (financial_event_with_symbols->>'$[*].symbol.symbol').unnest().upper() AS symbol,
+          (financial_event_with_symbols->>'$[*].symbol.stock_exchanges[*]').unnest().upper() AS exchange
+        FROM llm_feature_extract_date_ny
+"""
+
+
+def create_symbol_month_queue(duckdb_conn, local_features: bool = False) -> int:
+    """
+    computes the symbol/month universe once into a temp table, instead of re-running the query per batch
+    :return: number of symbol/month pairs
+    """
+    symbol_query = LOCAL_FEATURES_SYMBOL_QUERY if local_features else MOTHERDUCK_FEATURES_SYMBOL_QUERY
+
+    query = f"""
+    CREATE OR REPLACE TEMP TABLE symbol_month_queue AS
+    WITH
+      q1 AS ({symbol_query})
+
+    SELECT
+    distinct
+      symbol,
+      CAST(date_trunc('month', publish_time_NY) AS DATE) AS truncated_month
+    FROM q1
+    WHERE
+      symbol IN (SELECT * FROM clean_symbols)
+      AND exchange IN ('NASDAQ')
+    """
+
+    duckdb_conn.execute(query)
+
+    return duckdb_conn.execute("SELECT COUNT(*) FROM symbol_month_queue").fetchone()[0]
+
+
+def create_symbol_month_queue_from_listings(duckdb_conn, feature_collection, exchange: str = 'NASDAQ') -> int:
+    """
+    symbol/month universe from the multikey indexed listings field ('NASDAQ:AAPL'), the symbols are already
+    validated against the symbol master, so no clean_symbols filter is needed
+    :return: number of symbol/month pairs
+    """
+    feature_collection.create_index('listings')
+
+    listing_prefix = {'$regex': f'^{exchange}:'}
+    pipeline = [
+        # anchored prefix regex, uses the listings index bounds
+        {'$match': {'listings': listing_prefix}},
+        {'$project': {'publish_time': 1, 'listings': 1}},
+        {'$unwind': '$listings'},
+        {'$match': {'listings': listing_prefix}},
+        {
+            '$group': {
+                '_id': {
+                    'symbol': {'$substrBytes': ['$listings', len(exchange) + 1, -1]},
+                    'month': {
+                        '$dateToString': {
+                            'date': '$publish_time', 'format': '%Y-%m-01', 'timezone': 'America/New_York'
+                        }
+                    }
+                }
+            }
+        },
+    ]
+
+    symbols, months = [], []
+    for doc in feature_collection.aggregate(pipeline, allowDiskUse=True):
+        symbols.append(doc['_id']['symbol'])
+        months.append(dt.date.fromisoformat(doc['_id']['month']))
+
+    duckdb_conn.execute("CREATE OR REPLACE TEMP TABLE symbol_month_queue (symbol VARCHAR, truncated_month DATE)")
+    if symbols:
+        duckdb_conn.execute(
+            "INSERT INTO symbol_month_queue SELECT unnest(?::VARCHAR[]), unnest(?::DATE[])",
+            [symbols, months]
+        )
+
+    return len(symbols)
+
+
+def get_complete_symbol_months(
+        minute_mongo_ohlc_dest_collection,
+        trading_calendar,
+        symbols: list[str],
+        today: dt.date,
+        ohlc_coverage_collection=None
+) -> tuple[list[str], list[dt.date]]:
+    """
+    single aggregation collecting the stored NY session days per symbol/month.
+    a month is complete when it is over and every session of it has stored bars or is covered,
+    i.e. was downloaded without (complete) bars, see record_covered_sessions
+    :return: (symbols, NY months) of complete pairs, as parallel lists
+    """
+    from dateutil.relativedelta import relativedelta
+
+    pipeline = [
+        {'$match': {'symbol': {'$in': symbols}}},
+        {
+            '$group': {
+                '_id': {
+                    'symbol': '$symbol',
+                    'date': {
+                        '$dateToString': {
+                            'date': '$timestamp', 'format': '%Y-%m-%d', 'timezone': 'America/New_York'
+                        }
+                    }
+                }
+            }
+        },
+        {
+            '$group': {
+                '_id': {'symbol': '$_id.symbol', 'month': {'$substrBytes': ['$_id.date', 0, 7]}},
+                'dates': {'$push': '$_id.date'},
+            }
+        },
+    ]
+
+    # (symbol, month) -> sessions with stored bars or covered
+    done_sessions = {}
+    for doc in minute_mongo_ohlc_dest_collection.aggregate(pipeline, allowDiskUse=True):
+        month = dt.date.fromisoformat(doc['_id']['month'] + '-01')
+        done_sessions.setdefault((doc['_id']['symbol'], month), set()).update(
+            dt.date.fromisoformat(date) for date in doc['dates'])
+
+    if ohlc_coverage_collection is not None:
+        # months without any stored bar, e.g. before a listing, are only in the coverage
+        for doc in ohlc_coverage_collection.find({'symbol': {'$in': symbols}}, {'symbol': 1, 'session': 1}):
+            session = doc['session'].date()
+            done_sessions.setdefault((doc['symbol'], session.replace(day=1)), set()).add(session)
+
+    complete_symbols, complete_months = [], []
+    for (symbol, month), sessions in done_sessions.items():
+        month_end_excl = month + relativedelta(months=1)
+        if month_end_excl > today:
+            continue
+        if not sessions.issuperset(trading_calendar.sessions(month, month_end_excl)):
+            continue
+        complete_symbols.append(symbol)
+        complete_months.append(month)
+
+    return complete_symbols, complete_months
+
+
+def create_pending_symbol_month_queue(
+        duckdb_conn,
+        minute_mongo_ohlc_dest_collection,
+        trading_calendar,
+        ohlc_coverage_collection=None
+) -> int:
+    """
+    removes complete pairs from symbol_month_queue with an anti-join,
+    partially saved and current months stay pending and are narrowed down to their gaps while downloading
+    :return: number of pending symbol/month pairs
+    """
+    symbols = [row[0] for row in duckdb_conn.execute("SELECT DISTINCT symbol FROM symbol_month_queue").fetchall()]
+    complete_symbols, complete_months = get_complete_symbol_months(
+        minute_mongo_ohlc_dest_collection, trading_calendar, symbols, dt.date.today(), ohlc_coverage_collection)
+
+    duckdb_conn.execute(
+        "CREATE OR REPLACE TEMP TABLE complete_symbol_month (symbol VARCHAR, truncated_month DATE)")
+    if complete_symbols:
+        duckdb_conn.execute(
+            "INSERT INTO complete_symbol_month SELECT unnest(?::VARCHAR[]), unnest(?::DATE[])",
+            [complete_symbols, complete_months]
+        )
+
+    duckdb_conn.execute(
+        """
+        CREATE OR REPLACE TEMP TABLE pending_symbol_month AS
+        SELECT symbol, truncated_month
+        FROM symbol_month_queue
+        ANTI JOIN complete_symbol_month USING (symbol, truncated_month)
+        """
+    )
+
+    return duckdb_conn.execute("SELECT COUNT(*) FROM pending_symbol_month").fetchone()[0]
+
+
+def iterate_df_with_column_names(df):
+    for row in df.iter_rows():
+        yield list(zip(df.columns, row))
+
+
+async def download(args: argparse.Namespace, config: dict):
+    import duckdb
+    from dateutil.relativedelta import relativedelta
+    from pymongo import MongoClient, InsertOne
+    from pymongo.errors import BulkWriteError
+
+    from ohlc_downloader.ohlc_downloaders import BarchartBatchDownloader
+    from ohlc_downloader.ohlc_gaps import build_gap_download_requests, record_covered_sessions
+    from ohlc_downloader.trading_calendar import NyseTradingCalendar
+
+    ohlc_downloader = get_ohlc_downloader()
+
+    motherduck_token = config['motherduck']['token']
+    duckdb_conn = duckdb.connect(f'md:my_db?motherduck_token={motherduck_token}')
+
+    if args.local_features:
+        from feature_export.parquet_mirror import register_duckdb_view
+
+        # clean_symbols still comes from motherduck, the features are scanned locally
+        register_duckdb_view(duckdb_conn, config['feature_mirror']['root'])
+
+    mongo_client = MongoClient(config['mongo']['remote'])
+    minute_mongo_ohlc_dest_collection = mongo_client['html_downloads']['minute_ohlc_data']
+    # sessions the vendor has no or only some bars for, so they aren't requested again
+    ohlc_coverage_collection = mongo_client['html_downloads']['minute_ohlc_coverage']
+    ohlc_coverage_collection.create_index([('symbol', 1), ('session', 1)], unique=True)
+
+    batch_downloader = BarchartBatchDownloader()
+    trading_calendar = NyseTradingCalendar()
+
+    batch_size = args.batch_size
+
+    logger.info('Starting')
+
+    if args.mongo_symbols:
+        feature_collection = mongo_client['html_downloads']['llm_feature_extract']
+        queue_count = create_symbol_month_queue_from_listings(duckdb_conn, feature_collection)
+    else:
+        queue_count = create_symbol_month_queue(duckdb_conn, args.local_features)
+    pending_count = create_pending_symbol_month_queue(
+        duckdb_conn, minute_mongo_ohlc_dest_collection, trading_calendar, ohlc_coverage_collection)
+    logger.info(f'{pending_count} of {queue_count} symbol/month pairs are not complete yet')
+
+    pending_cursor = duckdb_conn.execute(
+        "SELECT symbol, truncated_month FROM pending_symbol_month ORDER BY symbol, truncated_month")
+
+    downloaded_count = 0
+
+    async with ohlc_downloader as downloader:
+        while True:
+
+            symbol_with_month_list = pending_cursor.fetchmany(batch_size)
+            if not symbol_with_month_list:
+                break
+
+            logger.info(f'Running batch of {len(symbol_with_month_list)} pairs, {downloaded_count} pairs done')
+            downloaded_count += len(symbol_with_month_list)
+
+            symbol_ranges = [
+                (symbol, month_dt, month_dt + relativedelta(months=1))
+                for symbol, month_dt in symbol_with_month_list
+            ]
+            ohlc_download_requests = build_gap_download_requests(
+                minute_mongo_ohlc_dest_collection, trading_calendar, symbol_ranges,
+                ohlc_coverage_collection=ohlc_coverage_collection)
+
+            for request in ohlc_download_requests:
+                logger.info(f'Adding [{request.symbol}, {request.start_dt} - {request.end_dt}) to download list')
+
+            if not ohlc_download_requests:
+                continue
+
+            logger.info(f'Downloading {len(ohlc_download_requests)} missing spans')
+
+            download_results = await batch_downloader.download_batch(downloader, ohlc_download_requests)
+
+            if not download_results:
+                continue
+
+            mongo_insert_ops = []
+
+            logger.info(f'Inserting into mongo {len(download_results)} results')
+
+            for result in download_results:
+                for row_with_col in iterate_df_with_column_names(result.df):
+                    row_dict = dict(row_with_col)
+                    row_dict['symbol'] = result.symbol
+                    insert_op = InsertOne(row_dict)
+                    mongo_insert_ops.append(insert_op)
+
+            if mongo_insert_ops:
+                try:
+                    minute_mongo_ohlc_dest_collection.bulk_write(
+                        mongo_insert_ops,
+                        ordered=False
+                    )
+                except BulkWriteError as bwe:
+                    for error in bwe.details['writeErrors']:
+                        if error['code'] == 11000:  # Duplicate key error code
+                            continue  # ignore duplicate key errors
+                        raise bwe
+
+            # after the bars, a crash in between only re-downloads the spans
+            covered_count = record_covered_sessions(ohlc_coverage_collection, trading_calendar, download_results)
+            logger.info(f'Recorded {covered_count} sessions without (complete) bars as covered')
+
+    logger.info('Done')
+
+
+def run(args: argparse.Namespace, config: dict):
+    import asyncio
+
+    asyncio.run(download(args, config))
@@ -0,0 +1,77 @@
+import argparse
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def add_parser(subparsers, parents: list):
+    parser = subparsers.add_parser(
+        'post-metadata', parents=parents,
+        help='copy article metadata from clickhouse onto the extraction results in mongo'
+    )
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.add_argument('--mongo', choices=['local', 'remote'], default='local')
+    parser.set_defaults(run=run)
+
+
+def _post_metadata_update(metadata: dict, updated_at: datetime.datetime) -> list[dict]:
+    """
+    update pipeline which only sets updated_at if the metadata changed, every run posts all docs
+    and the parquet mirror re-syncs the docs by updated_at. values are $literal, titles may start with $
+    """
+    changed = {'$or': [{'$ne': [f'${field}', {'$literal': value}]} for field, value in metadata.items()]}
+    return [
+        {'$set': {'updated_at': {'$cond': [changed, {'$literal': updated_at}, '$updated_at']}}},
+        {'$set': {field: {'$literal': value} for field, value in metadata.items()}},
+    ]
+
+
+def run(args: argparse.Namespace, config: dict):
+    import clickhouse_connect
+    from pymongo import MongoClient, UpdateOne
+
+    from feature_extractor.raw_html_reading import ClickhouseRawHtmlReader
+
+    source_client = MongoClient(config['mongo'][args.mongo])
+    source_db = source_client['html_downloads']
+    source_collection = source_db['llm_feature_extract_dest' if args.mongo == 'local' else 'llm_feature_extract']
+
+    config_clickhouse = config['clickhouse']
+    ch_client = clickhouse_connect.get_client(
+        username=config_clickhouse['username'],
+        password=config_clickhouse['password'],
+        database=config_clickhouse['database']
+    )
+    ch_html_reader = ClickhouseRawHtmlReader(ch_client)
+
+    batch_size = args.batch_size
+    skip = 0
+
+    while True:
+        logger.info(f'Reading {batch_size} docs, skip={skip}')
+        docs = list(ch_html_reader.read_all(skip, batch_size))
+        if not docs:
+            break
+
+        updated_at = datetime.datetime.now(datetime.timezone.utc)
+        update_operations = [
+            UpdateOne(
+                {'url': doc['url']},
+                _post_metadata_update({
+                    'article_title': doc['articleTitle'],
+                    'publish_time': doc['publishTime'],
+                    'provided_by': doc['providedBy'],
+                    'site_provided_tags': doc['tags'],
+                }, updated_at),
+                upsert=True
+            )
+            for doc in docs
+        ]
+
+        logger.info(f'Writing {len(update_operations)} docs, skip={skip}')
+        source_collection.bulk_write(update_operations, ordered=False)
+
+        skip += batch_size
+
+    logger.info('Done')
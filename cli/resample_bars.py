@@ -0,0 +1,47 @@
+import argparse
+import datetime as dt
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEFRAMES = ['5m', '15m', '1h', '1d']
+
+
+def add_parser(subparsers, parents: list):
+    parser = subparsers.add_parser(
+        'resample-bars', parents=parents,
+        help='resample minute OHLCV bars into the per symbol/month bar cache'
+    )
+    parser.add_argument('--symbols', nargs='+', required=True)
+    parser.add_argument('--start-month', type=dt.date.fromisoformat, required=True, help='YYYY-MM-01')
+    parser.add_argument('--end-month', type=dt.date.fromisoformat, required=True, help='YYYY-MM-01, inclusive')
+    parser.add_argument('--timeframes', nargs='+', default=DEFAULT_TIMEFRAMES, help='polars durations')
+    parser.add_argument('--sessions', nargs='+', choices=['regular', 'extended'], default=['regular'])
+    parser.add_argument('--root', help='cache root dir, defaults to [bar_cache] root in the config')
+    parser.set_defaults(run=run)
+
+
+def run(args: argparse.Namespace, config: dict):
+    from dateutil.relativedelta import relativedelta
+    from pymongo import MongoClient
+
+    from ohlc_downloader.bar_resampling import ResampledBarCache
+    from ohlc_downloader.trading_calendar import NyseTradingCalendar
+
+    mongo_client = MongoClient(config['mongo']['remote'])
+    minute_mongo_ohlc_collection = mongo_client['html_downloads']['minute_ohlc_data']
+
+    cache = ResampledBarCache(
+        args.root or config['bar_cache']['root'],
+        minute_mongo_ohlc_collection,
+        NyseTradingCalendar()
+    )
+    timeframes = [(every, session) for session in args.sessions for every in args.timeframes]
+
+    for symbol in args.symbols:
+        month = args.start_month.replace(day=1)
+        while month <= args.end_month:
+            cache.get_bars(symbol, month, timeframes)
+            month += relativedelta(months=1)
+
+    logger.info('Done')
@@ -0,0 +1,30 @@
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def add_parser(subparsers, parents: list):
+    parser = subparsers.add_parser(
+        'resolve-symbols', parents=parents,
+        help='canonicalize the symbols of stored extraction results and add the indexed symbols / listings fields'
+    )
+    parser.add_argument('--batch-size', type=int, default=1_000)
+    parser.set_defaults(run=run)
+
+
+def run(args: argparse.Namespace, config: dict):
+    from pymongo import MongoClient
+
+    from cli.extract import build_symbol_resolver
+    from feature_extractor.raw_html_reading import MongoFeatureResultRepo
+    from feature_extractor.symbol_resolution import backfill_symbol_fields
+
+    symbol_resolver = build_symbol_resolver(config)
+    if symbol_resolver is None:
+        raise ValueError('[symbol_master] paths must be configured to resolve symbols')
+
+    mongo_client = MongoClient(config['mongo']['local'])
+    updated_count = backfill_symbol_fields(symbol_resolver, MongoFeatureResultRepo(mongo_client), args.batch_size)
+
+    logger.info(f'Done, resolved symbols of {updated_count} docs')
@@ -0,0 +1,46 @@
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DICTIONARY_PATH = 'embeddings/zstd_dictionaries/summaries.dict'
+
+
+def add_parser(subparsers, parents: list):
+    parser = subparsers.add_parser(
+        'train-zstd-dict', parents=parents,
+        help='train a zstd dictionary for embedding requests from a sample of stored summaries'
+    )
+    parser.add_argument('--sample-size', type=int, default=20_000)
+    parser.add_argument('--dict-size', type=int, default=112_640, help='dictionary size in bytes')
+    parser.add_argument('--out', default=DEFAULT_DICTIONARY_PATH)
+    parser.set_defaults(run=run)
+
+
+def sample_summaries(config: dict, sample_size: int) -> list[str]:
+    from pymongo import MongoClient
+
+    client = MongoClient(config['mongo']['remote'])
+    collection = client['html_downloads']['llm_feature_extract']
+
+    return [
+        doc['summary']
+        for doc in collection.aggregate([
+            {'$match': {'summary': {'$type': 'string'}}},
+            {'$sample': {'size': sample_size}},
+            {'$project': {'_id': 0, 'summary': 1}},
+        ])
+    ]
+
+
+def run(args: argparse.Namespace, config: dict):
+    from embeddings.embedding_calc import train_zstd_dictionary
+
+    summaries = sample_summaries(config, args.sample_size)
+    logger.info(f'Training a {args.dict_size} bytes dictionary on {len(summaries)} summaries')
+
+    dictionary = train_zstd_dictionary(summaries, args.dict_size)
+    with open(args.out, 'wb') as f:
+        f.write(dictionary)
+
+    logger.info(f'Wrote dictionary to {args.out}, set [embedding_server] zstd_dictionary_path to use it')
@@ -1,14 +1,24 @@
+import logging
+import threading
+import time
+
 import zstandard as zstd
 import numpy as np
 import io
 import json
 
 import grpc
+from interfaces.embedding_backend import IEmbeddingBackend
 from . import embedding_pb2
 from . import embedding_pb2_grpc
 
-compressor = zstd.ZstdCompressor()
-decompressor = zstd.ZstdDecompressor()
+logger = logging.getLogger(__name__)
+
+DEFAULT_COMPRESSION_LEVEL = 3
+DEFAULT_DICTIONARY_SIZE = 112_640
+
+# status codes of requests which were too large for the server, retried with fewer texts
+_OVERSIZE_STATUS_CODES = {grpc.StatusCode.RESOURCE_EXHAUSTED, grpc.StatusCode.INVALID_ARGUMENT}
 
 
 def bytes_as_np_ndarray(bytes_data):
@@ -16,33 +26,155 @@ def bytes_as_np_ndarray(bytes_data):
     return np.load(memory_file)
 
 
-class GrpcEmbeddingClient:
-    def __init__(self, host):
+def train_zstd_dictionary(texts: list[str], dict_size: int = DEFAULT_DICTIONARY_SIZE) -> bytes:
+    """
+    trains a dictionary on json encoded texts, the same encoding as the request payloads.
+    the server has to decompress requests with the same dictionary, zstd frames carry the dictionary id.
+    """
+    samples = [json.dumps(text).encode('utf-8') for text in texts]
+    return zstd.train_dictionary(dict_size, samples).as_bytes()
+
+
+def load_zstd_dictionary(path: str) -> zstd.ZstdCompressionDict:
+    with open(path, 'rb') as f:
+        return zstd.ZstdCompressionDict(f.read())
+
+
+class ZstdCodec:
+    """
+    zstd (de)compression contexts must not be shared between threads, so each thread gets its own.
+    requests are compressed with the optional dictionary, responses (numpy floats) are decompressed without one.
+    """
+
+    def __init__(self, level: int = DEFAULT_COMPRESSION_LEVEL, dictionary: zstd.ZstdCompressionDict | None = None):
+        self.level = level
+        self.dictionary = dictionary
+        if self.dictionary is not None:
+            # precomputes the dictionary's compression tables once for all threads
+            self.dictionary.precompute_compress(level=level)
+        self._local = threading.local()
+
+    def _contexts(self) -> tuple[zstd.ZstdCompressor, zstd.ZstdDecompressor]:
+        contexts = getattr(self._local, 'contexts', None)
+        if contexts is None:
+            contexts = (
+                zstd.ZstdCompressor(level=self.level, dict_data=self.dictionary),
+                zstd.ZstdDecompressor(),
+            )
+            self._local.contexts = contexts
+        return contexts
+
+    def compress(self, data: bytes) -> bytes:
+        return self._contexts()[0].compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._contexts()[1].decompress(data)
+
+
+class GrpcEmbeddingClient(IEmbeddingBackend):
+    """
+    accepts any number of texts and splits them into requests bounded by text count and by utf-8 bytes.
+    the next request is compressed while the current one is in flight, and the texts per request
+    adapt to the observed server latency: grown while below target_latency_seconds, shrunk above it.
+    """
+
+    def __init__(
+            self,
+            host,
+            max_texts_per_request: int = 1_000,
+            min_texts_per_request: int = 16,
+            max_bytes_per_request: int = 2_000_000,
+            target_latency_seconds: float = 2.0,
+            compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+            dictionary_path: str | None = None
+    ):
         self.host = host
         self.port = str(50051)
+        self.max_texts_per_request = max_texts_per_request
+        self.min_texts_per_request = min_texts_per_request
+        self.max_bytes_per_request = max_bytes_per_request
+        self.target_latency_seconds = target_latency_seconds
+        self.codec = ZstdCodec(
+            compression_level,
+            load_zstd_dictionary(dictionary_path) if dictionary_path else None
+        )
+
+        self.texts_per_request = max_texts_per_request
+        self._stub = None
 
-    def calc_embeddings(self, texts: list[str]):
-        assert len(texts) <= 1_000, 'Too many texts to embed'
+    @property
+    def stub(self):
+        if self._stub is None:
+            channel = grpc.insecure_channel(f'{self.host}:{self.port}')
+            self._stub = embedding_pb2_grpc.EmbeddingServiceStub(channel)
+        return self._stub
 
-        channel = grpc.insecure_channel(f'{self.host}:{self.port}')
-        stub = embedding_pb2_grpc.EmbeddingServiceStub(channel)
+    def _next_request_end(self, texts: list[str], start: int) -> int:
+        end = start
+        request_bytes = 0
+        while end < len(texts) and end - start < self.texts_per_request:
+            request_bytes += len(texts[end].encode('utf-8'))
+            if request_bytes > self.max_bytes_per_request and end > start:
+                break
+            end += 1
+        return end
 
-        # Example data to send
+    def _adapt_request_size(self, latency_seconds: float, request_text_count: int):
+        if latency_seconds > self.target_latency_seconds:
+            scaled = int(request_text_count * self.target_latency_seconds / latency_seconds)
+            self.texts_per_request = max(self.min_texts_per_request, scaled)
+        elif latency_seconds < self.target_latency_seconds / 2 and request_text_count >= self.texts_per_request:
+            self.texts_per_request = min(self.max_texts_per_request, int(self.texts_per_request * 1.25) + 1)
+
+    def _build_request(self, texts: list[str]):
         texts_bytes = bytes(
             json.dumps(texts),
             'utf-8'
         )
-        texts_bytes_compressed = compressor.compress(texts_bytes)
+        texts_bytes_compressed = self.codec.compress(texts_bytes)
 
-        # Create a request
-        request = embedding_pb2.EmbeddingRequest(
+        return embedding_pb2.EmbeddingRequest(
             embeddingsListBinary=texts_bytes_compressed
         )
 
-        # Call the CalculateEmbeddings method
-        response = stub.CalculateEmbeddings(request)
+    def _parse_response(self, response) -> np.ndarray:
         embeddings_bytes_compressed = response.embeddingsListBinary
-        embeddings_bytes = decompressor.decompress(embeddings_bytes_compressed)
-        embeddings = bytes_as_np_ndarray(embeddings_bytes)
+        embeddings_bytes = self.codec.decompress(embeddings_bytes_compressed)
+        return bytes_as_np_ndarray(embeddings_bytes)
+
+    def calc_embeddings(self, texts: list[str]) -> np.ndarray:
+        results = []
+
+        start = 0
+        end = self._next_request_end(texts, start)
+        request = self._build_request(texts[start:end])
+
+        while start < len(texts):
+            send_time = time.perf_counter()
+            response_future = self.stub.CalculateEmbeddings.future(request)
+
+            # pipelining: compress the next request while the current one is in flight
+            next_start = end
+            next_end = self._next_request_end(texts, next_start)
+            next_request = self._build_request(texts[next_start:next_end]) if next_start < len(texts) else None
+
+            try:
+                response = response_future.result()
+            except grpc.RpcError as e:
+                if e.code() not in _OVERSIZE_STATUS_CODES or end - start <= 1:
+                    raise
+                self.texts_per_request = max(1, (end - start) // 2)
+                logger.info(f'Request of {end - start} texts rejected ({e.code()}), retrying with fewer texts')
+                end = self._next_request_end(texts, start)
+                request = self._build_request(texts[start:end])
+                continue
+
+            self._adapt_request_size(time.perf_counter() - send_time, end - start)
+            results.append(self._parse_response(response))
+
+            start, end, request = next_start, next_end, next_request
+
+        if not results:
+            return np.empty((0, 0), dtype=np.float32)
 
-        return embeddings
+        return np.concatenate(results)
@@ -0,0 +1,156 @@
+import logging
+import queue
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from pymongo import UpdateOne
+from pymongo.errors import CursorNotFound
+
+from interfaces.embedding_backend import IEmbeddingBackend
+
+if TYPE_CHECKING:
+    from pymongo.collection import Collection
+
+logger = logging.getLogger(__name__)
+
+_END_OF_STREAM = object()
+
+
+class PipelinedSummaryEmbedder:
+    """
+    backfills summary_embeddings with mongo reads, embedding calls and bulk writes overlapped:
+    a reader thread walks _id with a watermark cursor (one query, re-opened past the watermark if it times out),
+    the calling thread embeds and a writer thread bulk writes. the bounded queues between them keep memory
+    bounded while the embedding backend never waits on mongo as long as reads and writes keep up.
+    """
+
+    def __init__(
+            self,
+            collection: "Collection",
+            embedding_backend: IEmbeddingBackend,
+            batch_size: int = 1_000,
+            queue_size: int = 4
+    ):
+        self.collection = collection
+        self.embedding_backend = embedding_backend
+        self.batch_size = batch_size
+        self.read_queue = queue.Queue(maxsize=queue_size)
+        self.write_queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.errors = []
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self.stop_event.is_set():
+            try:
+                return q.get(timeout=1)
+            except queue.Empty:
+                continue
+        return _END_OF_STREAM
+
+    def _read(self, start_after_id):
+        watermark_id = start_after_id
+        try:
+            while True:
+                query = {'summary_embeddings': {'$exists': False}}
+                if watermark_id is not None:
+                    query['_id'] = {'$gt': watermark_id}
+
+                cursor = self.collection.find(query, {'summary': 1}).sort('_id', 1).batch_size(self.batch_size)
+
+                batch = []
+                try:
+                    for doc in cursor:
+                        batch.append(doc)
+                        if len(batch) == self.batch_size:
+                            if not self._put(self.read_queue, batch):
+                                return
+                            watermark_id = batch[-1]['_id']
+                            batch = []
+                except CursorNotFound:
+                    # the cursor timed out while the queue was full, continue past the last queued doc
+                    logger.info(f'Cursor timed out, re-opening after _id {watermark_id}')
+                    continue
+
+                if batch:
+                    self._put(self.read_queue, batch)
+                break
+        except Exception as e:
+            self.errors.append(e)
+            self.stop_event.set()
+        finally:
+            self._put(self.read_queue, _END_OF_STREAM)
+
+    def _write(self):
+        written_count = 0
+        try:
+            while True:
+                item = self._get(self.write_queue)
+                if item is _END_OF_STREAM:
+                    break
+                summary_docs, embeddings_docs = item
+
+                self.collection.bulk_write(
+                    [
+                        UpdateOne(
+                            {'_id': orig_doc['_id']},
+                            {'$set': {'summary_embeddings': embedding.tolist()}},
+                        )
+                        for embedding, orig_doc in zip(embeddings_docs, summary_docs)
+                    ],
+                    ordered=False
+                )
+                written_count += len(summary_docs)
+                logger.info(f'Wrote {written_count} summary embeddings')
+        except Exception as e:
+            self.errors.append(e)
+            self.stop_event.set()
+
+    def run(self, start_after_id=None) -> int:
+        """
+        :return: number of embedded summaries
+        """
+        reader = threading.Thread(target=self._read, args=(start_after_id,), name='embedding-reader', daemon=True)
+        writer = threading.Thread(target=self._write, name='embedding-writer', daemon=True)
+        reader.start()
+        writer.start()
+
+        embedded_count = 0
+        try:
+            while True:
+                summary_docs = self._get(self.read_queue)
+                if summary_docs is _END_OF_STREAM:
+                    break
+
+                start_time = time.perf_counter()
+                embeddings_docs = self.embedding_backend.calc_embeddings([d['summary'] for d in summary_docs])
+                elapsed = time.perf_counter() - start_time
+                embedded_count += len(summary_docs)
+                logger.info(
+                    f'{self.embedding_backend.name} embedded {len(summary_docs)} summaries in {elapsed:.2f}s, '
+                    f'{len(summary_docs) / elapsed:.1f} texts/s, queued reads: {self.read_queue.qsize()}')
+
+                if not self._put(self.write_queue, (summary_docs, embeddings_docs)):
+                    break
+        except BaseException:
+            self.stop_event.set()
+            raise
+        finally:
+            self._put(self.write_queue, _END_OF_STREAM)
+            writer.join()
+            self.stop_event.set()
+            reader.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+        return embedded_count
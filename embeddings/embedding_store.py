@@ -0,0 +1,259 @@
+import datetime
+import json
+import logging
+import os
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import polars as pl
+    from pymongo.collection import Collection
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE_NAME = 'manifest.json'
+# _ids are generated by concurrent writers, a doc committed after a sync may have an _id below its watermark
+LATE_ID_OVERLAP = datetime.timedelta(minutes=10)
+
+
+class ShardedMatrix:
+    """
+    read-only row view over several memory-mapped shards, without concatenating (copying) them.
+    supports integer, slice and integer array row indexing
+    """
+
+    def __init__(self, shards: list[np.ndarray]):
+        assert shards, 'at least one shard is required'
+        self.shards = shards
+        self.offsets = np.cumsum([0] + [len(shard) for shard in shards])
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return int(self.offsets[-1]), self.shards[0].shape[1]
+
+    @property
+    def dtype(self):
+        return self.shards[0].dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, rows):
+        if isinstance(rows, (int, np.integer)):
+            shard_index = int(np.searchsorted(self.offsets, rows, side='right')) - 1
+            return self.shards[shard_index][rows - self.offsets[shard_index]]
+
+        rows = np.arange(len(self))[rows] if isinstance(rows, slice) else np.asarray(rows)
+        out = np.empty((len(rows), self.shape[1]), dtype=self.dtype)
+        shard_indexes = np.searchsorted(self.offsets, rows, side='right') - 1
+        for shard_index in np.unique(shard_indexes):
+            mask = shard_indexes == shard_index
+            out[mask] = self.shards[shard_index][rows[mask] - self.offsets[shard_index]]
+        return out
+
+
+class RowSelection:
+    """
+    view of a subset of rows of a matrix (or ShardedMatrix), rows are read lazily
+    """
+
+    def __init__(self, matrix, rows: np.ndarray):
+        self.matrix = matrix
+        self.rows = np.asarray(rows)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return len(self.rows), self.matrix.shape[1]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, rows):
+        return self.matrix[self.rows[rows]]
+
+
+class EmbeddingStore:
+    """
+    append-only float32 .npy shards of summary_embeddings, opened memory-mapped, plus a parquet sidecar index
+    mapping _id / url / publish_time to global row numbers.
+    shards are preallocated with shard_rows rows, the manifest records how many rows of each are valid,
+    so rows written after the last manifest update (e.g. a crashed sync) are ignored and overwritten.
+    """
+
+    def __init__(self, root_dir: str, shard_rows: int = 262_144):
+        self.root_dir = root_dir
+        self.shard_rows = shard_rows
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.root_dir, MANIFEST_FILE_NAME)
+
+    def read_manifest(self) -> dict:
+        if not os.path.exists(self.manifest_path):
+            return {'dim': None, 'shard_rows': self.shard_rows, 'shards': [], 'index_parts': [], 'last_id': None}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def write_manifest(self, manifest: dict):
+        manifest['updated_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _open_shard_for_write(self, manifest: dict) -> tuple[np.ndarray, int]:
+        """
+        :return: (writable memmap of the last shard with free rows, its shard number)
+        """
+        shards = manifest['shards']
+        if shards and shards[-1]['rows'] < manifest['shard_rows']:
+            shard_number = len(shards) - 1
+            path = os.path.join(self.root_dir, shards[-1]['file'])
+            return np.load(path, mmap_mode='r+'), shard_number
+
+        shard_number = len(shards)
+        file_name = f'shard-{shard_number:05d}.npy'
+        shard = np.lib.format.open_memmap(
+            os.path.join(self.root_dir, file_name),
+            mode='w+',
+            dtype=np.float32,
+            shape=(manifest['shard_rows'], manifest['dim'])
+        )
+        shards.append({'file': file_name, 'rows': 0})
+        return shard, shard_number
+
+    def append(self, embeddings: np.ndarray, ids: list, urls: list[str], publish_times: list):
+        import polars as pl
+
+        os.makedirs(self.root_dir, exist_ok=True)
+        manifest = self.read_manifest()
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if manifest['dim'] is None:
+            manifest['dim'] = embeddings.shape[1]
+        assert embeddings.shape[1] == manifest['dim'], f"embedding dim {embeddings.shape[1]} != {manifest['dim']}"
+
+        global_rows = []
+        written = 0
+        while written < len(embeddings):
+            shard, shard_number = self._open_shard_for_write(manifest)
+            shard_info = manifest['shards'][shard_number]
+
+            count = min(manifest['shard_rows'] - shard_info['rows'], len(embeddings) - written)
+            shard[shard_info['rows']:shard_info['rows'] + count] = embeddings[written:written + count]
+            shard.flush()
+            del shard
+
+            first_global_row = shard_number * manifest['shard_rows'] + shard_info['rows']
+            global_rows.extend(range(first_global_row, first_global_row + count))
+
+            shard_info['rows'] += count
+            written += count
+
+        index_part_name = f'index-{ids[0]}-{ids[-1]}.parquet'
+        pl.DataFrame(
+            {
+                '_id': [str(_id) for _id in ids],
+                'url': urls,
+                'publish_time': publish_times,
+                'row': global_rows,
+            },
+            schema={
+                '_id': pl.String,
+                'url': pl.String,
+                'publish_time': pl.Datetime('us', 'UTC'),
+                'row': pl.Int64,
+            },
+            strict=False
+        ).write_parquet(os.path.join(self.root_dir, index_part_name))
+
+        manifest['index_parts'].append(index_part_name)
+        # appends of late docs (see sync) are below the watermark
+        manifest['last_id'] = max(manifest['last_id'] or '', str(ids[-1]))
+        self.write_manifest(manifest)
+
+    def open_matrix(self) -> ShardedMatrix | np.ndarray:
+        """
+        zero-copy: a memmap when there is a single shard, otherwise a ShardedMatrix over the memmaps
+        """
+        manifest = self.read_manifest()
+        shards = [
+            np.load(os.path.join(self.root_dir, shard_info['file']), mmap_mode='r')[:shard_info['rows']]
+            for shard_info in manifest['shards']
+        ]
+        if not shards:
+            return np.empty((0, manifest['dim'] or 0), dtype=np.float32)
+        return shards[0] if len(shards) == 1 else ShardedMatrix(shards)
+
+    def read_index(self) -> "pl.DataFrame":
+        """
+        :return: columns _id, url, publish_time, row. sorted by row
+        """
+        import polars as pl
+
+        manifest = self.read_manifest()
+        if not manifest['index_parts']:
+            return pl.DataFrame(schema={
+                '_id': pl.String, 'url': pl.String, 'publish_time': pl.Datetime('us', 'UTC'), 'row': pl.Int64})
+
+        return pl.concat([
+            pl.read_parquet(os.path.join(self.root_dir, index_part))
+            for index_part in manifest['index_parts']
+        ]).sort('row')
+
+    def sync(self, collection: "Collection", batch_size: int = 10_000) -> int:
+        """
+        appends summary_embeddings of docs with _id past the store's watermark, re-reading LATE_ID_OVERLAP
+        before it (docs already in the store are skipped).
+        stops at the first doc without embeddings, since embeddings are backfilled in _id order
+        :return: number of appended embeddings
+        """
+        import polars as pl
+        from bson import ObjectId
+
+        last_id = self.read_manifest()['last_id']
+        stored_ids = set()
+        if last_id:
+            overlap_start = ObjectId.from_datetime(ObjectId(last_id).generation_time - LATE_ID_OVERLAP)
+            query = {'_id': {'$gt': overlap_start}}
+            stored_ids = set(self.read_index().filter(pl.col('_id') > str(overlap_start))['_id'])
+        else:
+            query = {}
+
+        cursor = (
+            collection
+            .find(query, {'summary_embeddings': 1, 'url': 1, 'publish_time': 1})
+            .sort('_id', 1)
+            .batch_size(batch_size)
+        )
+
+        appended_count = 0
+        batch = []
+
+        for doc in cursor:
+            if str(doc['_id']) in stored_ids:
+                continue
+            if 'summary_embeddings' not in doc:
+                logger.info(f"Doc {doc['_id']} has no summary embeddings yet, stopping")
+                break
+            batch.append(doc)
+            if len(batch) == batch_size:
+                self._append_docs(batch)
+                appended_count += len(batch)
+                logger.info(f'Appended {appended_count} embeddings')
+                batch = []
+
+        if batch:
+            self._append_docs(batch)
+            appended_count += len(batch)
+
+        return appended_count
+
+    def _append_docs(self, docs: list[dict]):
+        self.append(
+            np.array([doc['summary_embeddings'] for doc in docs], dtype=np.float32),
+            [doc['_id'] for doc in docs],
+            [doc.get('url') for doc in docs],
+            [doc.get('publish_time') for doc in docs],
+        )
@@ -0,0 +1,84 @@
+import logging
+
+import numpy as np
+
+from interfaces.embedding_backend import IEmbeddingBackend
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_token_count(text: str) -> int:
+    # ~4 characters per token for english text, plus the special tokens
+    return len(text) // 4 + 2
+
+
+class SentenceTransformerEmbeddingBackend(IEmbeddingBackend):
+    """
+    in-process CPU embeddings, no RPC hop. texts are sorted by length and batched by padded token count,
+    so short texts aren't padded up to the longest text of the whole call.
+    """
+
+    def __init__(
+            self,
+            model_name: str,
+            num_threads: int | None = None,
+            max_batch_tokens: int = 16_384,
+            max_batch_size: int = 256,
+            normalize_embeddings: bool = False
+    ):
+        self.model_name = model_name
+        self.num_threads = num_threads
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.normalize_embeddings = normalize_embeddings
+        self._model = None
+
+    @property
+    def model(self):
+        # sentence-transformers pulls in torch, so it is only loaded on first use
+        if self._model is None:
+            import torch
+            from sentence_transformers import SentenceTransformer
+
+            if self.num_threads is not None:
+                torch.set_num_threads(self.num_threads)
+            self._model = SentenceTransformer(self.model_name, device='cpu')
+            logger.info(f'Loaded {self.model_name} with {torch.get_num_threads()} threads')
+        return self._model
+
+    def _length_sorted_batches(self, texts: list[str]) -> list[np.ndarray]:
+        max_seq_length = self.model.max_seq_length
+        token_counts = np.array([min(estimate_token_count(text), max_seq_length) for text in texts])
+        order = np.argsort(token_counts, kind='stable')
+
+        batches = []
+        batch_start = 0
+        for position in range(1, len(order) + 1):
+            batch_size = position - batch_start
+            if position == len(order):
+                batches.append(order[batch_start:position])
+                break
+
+            # texts are sorted, so the next text would be the longest of the batch and set its padded length
+            padded_tokens_with_next = (batch_size + 1) * token_counts[order[position]]
+            if batch_size >= self.max_batch_size or padded_tokens_with_next > self.max_batch_tokens:
+                batches.append(order[batch_start:position])
+                batch_start = position
+
+        return batches
+
+    def calc_embeddings(self, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        embeddings = np.empty((len(texts), self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        for batch_indexes in self._length_sorted_batches(texts):
+            embeddings[batch_indexes] = self.model.encode(
+                [texts[i] for i in batch_indexes],
+                batch_size=len(batch_indexes),
+                convert_to_numpy=True,
+                normalize_embeddings=self.normalize_embeddings,
+            )
+
+        return embeddings
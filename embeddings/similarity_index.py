@@ -0,0 +1,240 @@
+import dataclasses
+import datetime
+import logging
+from typing import Iterator, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class SimilarMatch:
+    id: object
+    similarity: float
+    publish_time: np.datetime64
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class BlockwiseSimilarityIndex:
+    """
+    exact cosine similarity between embeddings published within a time window of each other.
+    rows are visited in publish time order, block by block, so memory stays bounded by block_size ** 2
+    similarities plus two blocks of vectors, regardless of how many vectors there are.
+    embeddings may be a np.memmap, only the rows of the current blocks are read.
+    """
+
+    def __init__(
+            self,
+            embeddings: np.ndarray,
+            publish_times: np.ndarray,
+            ids: Sequence,
+            block_size: int = 4_096,
+            normalized: bool = False
+    ):
+        assert len(embeddings) == len(publish_times) == len(ids), 'embeddings, publish_times and ids must align'
+        self.embeddings = embeddings
+        self.ids = ids
+        self.block_size = block_size
+        self.normalized = normalized
+
+        publish_times = np.asarray(publish_times, dtype='datetime64[s]')
+        self.order = np.argsort(publish_times, kind='stable')
+        self.sorted_publish_times = publish_times[self.order]
+        self.sorted_seconds = self.sorted_publish_times.astype(np.int64)
+
+    def __len__(self):
+        return len(self.order)
+
+    def _block(self, start: int, end: int) -> np.ndarray:
+        # sorting the row numbers keeps memmap reads sequential
+        rows = self.order[start:end]
+        read_order = np.argsort(rows)
+        block = np.empty((len(rows), self.embeddings.shape[1]), dtype=np.float32)
+        block[read_order] = self.embeddings[rows[read_order]]
+        return block if self.normalized else l2_normalize(block)
+
+    def iter_similar_pairs(
+            self, window: datetime.timedelta, threshold: float) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        yields batches of (row_a, row_b, similarity) with row_a published no later than row_b,
+        at most window apart and similarity >= threshold. rows are indexes into the constructor's arrays
+        """
+        window_seconds = int(window.total_seconds())
+        n = len(self)
+
+        for query_start in range(0, n, self.block_size):
+            query_end = min(query_start + self.block_size, n)
+            query_block = self._block(query_start, query_end)
+            query_seconds = self.sorted_seconds[query_start:query_end]
+
+            candidates_end = int(np.searchsorted(
+                self.sorted_seconds, query_seconds[-1] + window_seconds, side='right'))
+
+            for candidate_start in range(query_start, candidates_end, self.block_size):
+                candidate_end = min(candidate_start + self.block_size, candidates_end)
+                candidate_block = (
+                    query_block if candidate_start == query_start and candidate_end == query_end
+                    else self._block(candidate_start, candidate_end)
+                )
+                candidate_seconds = self.sorted_seconds[candidate_start:candidate_end]
+
+                similarities = query_block @ candidate_block.T
+
+                mask = similarities >= threshold
+                mask &= (candidate_seconds[None, :] - query_seconds[:, None]) <= window_seconds
+                # each pair once: the candidate must come after the query in publish time order
+                mask &= (np.arange(candidate_start, candidate_end)[None, :]
+                         > np.arange(query_start, query_end)[:, None])
+
+                query_positions, candidate_positions = np.nonzero(mask)
+                if len(query_positions) == 0:
+                    continue
+
+                yield (
+                    self.order[query_positions + query_start],
+                    self.order[candidate_positions + candidate_start],
+                    similarities[query_positions, candidate_positions],
+                )
+
+    def cluster_near_duplicates(self, window: datetime.timedelta, threshold: float) -> np.ndarray:
+        """
+        connected components of the near-duplicate graph, e.g. one syndicated story
+        :return: per row, the row of the earliest published article of its cluster
+        """
+        parent = np.arange(len(self))
+        # position in publish time order, the root of a cluster is kept as its earliest article
+        sorted_position = np.empty(len(self), dtype=np.int64)
+        sorted_position[self.order] = np.arange(len(self))
+
+        def find(row: int) -> int:
+            while parent[row] != row:
+                parent[row] = parent[parent[row]]
+                row = parent[row]
+            return row
+
+        pair_count = 0
+        for rows_a, rows_b, _ in self.iter_similar_pairs(window, threshold):
+            pair_count += len(rows_a)
+            for row_a, row_b in zip(rows_a.tolist(), rows_b.tolist()):
+                root_a, root_b = find(row_a), find(row_b)
+                if root_a == root_b:
+                    continue
+                if sorted_position[root_a] < sorted_position[root_b]:
+                    parent[root_b] = root_a
+                else:
+                    parent[root_a] = root_b
+
+        logger.info(f'Found {pair_count} near-duplicate pairs')
+
+        return np.array([find(row) for row in range(len(self))], dtype=np.int64)
+
+    def query(
+            self,
+            vectors: np.ndarray,
+            publish_times: np.ndarray,
+            window: datetime.timedelta,
+            threshold: float = 0.0,
+            top_k: int = 10,
+            query_ids: Sequence | None = None
+    ) -> list[list[SimilarMatch]]:
+        """
+        related articles published within window (before or after) of each query vector's publish time.
+        matches with the query's own id are excluded when query_ids are given
+        """
+        vectors = l2_normalize(vectors)
+        query_seconds = np.asarray(publish_times, dtype='datetime64[s]').astype(np.int64)
+        window_seconds = int(window.total_seconds())
+
+        best_similarities = np.full((len(vectors), top_k), -np.inf, dtype=np.float32)
+        best_positions = np.full((len(vectors), top_k), -1, dtype=np.int64)
+
+        candidates_start = int(np.searchsorted(self.sorted_seconds, query_seconds.min() - window_seconds, side='left'))
+        candidates_end = int(np.searchsorted(self.sorted_seconds, query_seconds.max() + window_seconds, side='right'))
+
+        for candidate_start in range(candidates_start, candidates_end, self.block_size):
+            candidate_end = min(candidate_start + self.block_size, candidates_end)
+            candidate_seconds = self.sorted_seconds[candidate_start:candidate_end]
+
+            similarities = vectors @ self._block(candidate_start, candidate_end).T
+            out_of_window = np.abs(candidate_seconds[None, :] - query_seconds[:, None]) > window_seconds
+            similarities[out_of_window | (similarities < threshold)] = -np.inf
+
+            if query_ids is not None:
+                candidate_ids = np.empty(candidate_end - candidate_start, dtype=object)
+                candidate_ids[:] = [self.ids[row] for row in self.order[candidate_start:candidate_end]]
+                similarities[np.asarray(query_ids, dtype=object)[:, None] == candidate_ids[None, :]] = -np.inf
+
+            merged_similarities = np.concatenate([best_similarities, similarities], axis=1)
+            merged_positions = np.concatenate(
+                [best_positions, np.broadcast_to(np.arange(candidate_start, candidate_end), similarities.shape)],
+                axis=1)
+            top = np.argpartition(-merged_similarities, top_k - 1, axis=1)[:, :top_k]
+            best_similarities = np.take_along_axis(merged_similarities, top, axis=1)
+            best_positions = np.take_along_axis(merged_positions, top, axis=1)
+
+        results = []
+        for similarities_row, positions_row in zip(best_similarities, best_positions):
+            matches = []
+            for index in np.argsort(-similarities_row):
+                if not np.isfinite(similarities_row[index]):
+                    break
+                row = self.order[positions_row[index]]
+                matches.append(SimilarMatch(
+                    self.ids[row], float(similarities_row[index]), self.sorted_publish_times[positions_row[index]]))
+            results.append(matches)
+
+        return results
+
+
+def load_embeddings_from_mongo(
+        collection,
+        start: datetime.datetime,
+        end_excl: datetime.datetime,
+        out_path: str | None = None,
+        batch_size: int = 10_000
+) -> tuple[np.ndarray, np.ndarray, list]:
+    """
+    streams summary_embeddings of docs published in [start, end_excl) into a preallocated float32 matrix,
+    a memory-mapped .npy at out_path when given
+    :return: (embeddings, publish_times, _ids)
+    """
+    query = {
+        'publish_time': {'$gte': start, '$lt': end_excl},
+        'summary_embeddings': {'$exists': True},
+    }
+
+    count = collection.count_documents(query)
+    first_doc = collection.find_one(query, {'summary_embeddings': 1})
+    if first_doc is None:
+        return np.empty((0, 0), dtype=np.float32), np.empty(0, dtype='datetime64[s]'), []
+    dim = len(first_doc['summary_embeddings'])
+
+    if out_path is not None:
+        embeddings = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float32, shape=(count, dim))
+    else:
+        embeddings = np.empty((count, dim), dtype=np.float32)
+    publish_times = np.empty(count, dtype='datetime64[s]')
+    ids = []
+
+    cursor = collection.find(query, {'summary_embeddings': 1, 'publish_time': 1}).batch_size(batch_size)
+    row = 0
+    for doc in cursor:
+        # docs inserted after counting are left for the next run
+        if row == count:
+            break
+        embeddings[row] = doc['summary_embeddings']
+        publish_times[row] = np.datetime64(doc['publish_time'], 's')
+        ids.append(doc['_id'])
+        row += 1
+
+        if row % 100_000 == 0:
+            logger.info(f'Loaded {row} of {count} embeddings')
+
+    return embeddings[:row], publish_times[:row], ids
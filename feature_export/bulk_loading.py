@@ -0,0 +1,154 @@
+import contextlib
+import dataclasses
+import gc
+import logging
+import os
+from typing import Iterator, TYPE_CHECKING
+
+import more_itertools
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from feature_export.parquet_mirror import docs_to_df, feature_mirror_schema
+from feature_extractor.field_structure_definitions import FinancialNewsExtractedData
+
+if TYPE_CHECKING:
+    import polars as pl
+    from pymongo.collection import Collection
+
+logger = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    """
+    a batch allocates hundreds of thousands of containers, each allocation threshold crossed triggers a cyclic gc pass
+    over all of them, which took most of the validation time. models built from records have no reference cycles
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+@dataclasses.dataclass
+class ExtractedDataBatch:
+    ids: list[str]
+    urls: list[str]
+    data: list[BaseModel]
+    # records which failed validation, e.g. legacy docs missing a field group
+    invalid_urls: list[str]
+
+
+class ExtractedDataBulkLoader:
+    """
+    streams stored extraction results from mongo or the parquet mirror and validates them batch_size records
+    at a time with one TypeAdapter(list[model]) call, the adapter's validator is built once per loader.
+    iter_mongo(validate=False) constructs the models without validation, for records the pipeline validated
+    when writing them.
+    the columnar methods skip model construction altogether and return polars frames in the mirror schema
+    """
+
+    def __init__(self, model: type[BaseModel] = FinancialNewsExtractedData, batch_size: int = 5_000):
+        self.model = model
+        self.batch_size = batch_size
+        self.adapter = TypeAdapter(list[model])
+
+    @property
+    def mongo_projection(self) -> dict:
+        # only the model's fields, summary_embeddings alone would dominate the transfer
+        return {'url': 1, **{field: 1 for field in self.model.model_fields}}
+
+    def validate_batch(self, records: list[dict]) -> ExtractedDataBatch:
+        ids = [str(record.get('_id')) for record in records]
+        urls = [record.get('url') for record in records]
+
+        with _gc_paused():
+            try:
+                return ExtractedDataBatch(ids, urls, self.adapter.validate_python(records), [])
+            except ValidationError as e:
+                # the first item of each error location is the record's index in the batch
+                invalid_indexes = {error['loc'][0] for error in e.errors()}
+
+            valid_indexes = [i for i in range(len(records)) if i not in invalid_indexes]
+            return ExtractedDataBatch(
+                [ids[i] for i in valid_indexes],
+                [urls[i] for i in valid_indexes],
+                self.adapter.validate_python([records[i] for i in valid_indexes]),
+                [urls[i] for i in sorted(invalid_indexes)],
+            )
+
+    def validate_frame(self, df: "pl.DataFrame") -> ExtractedDataBatch:
+        """
+        validates the json polars writes for the frame, no python dicts are built for the records
+        """
+        fields = [field for field in self.model.model_fields if field in df.columns]
+        with _gc_paused():
+            try:
+                data = self.adapter.validate_json(df.select(fields).write_json())
+                return ExtractedDataBatch(df['_id'].to_list(), df['url'].to_list(), data, [])
+            except ValidationError:
+                pass
+
+        # validate_batch finds the invalid records
+        return self.validate_batch(df.to_dicts())
+
+    def construct_batch(self, records: list[dict]) -> ExtractedDataBatch:
+        """
+        model_construct without validation, nested models stay the stored dicts and lists
+        """
+        with _gc_paused():
+            return ExtractedDataBatch(
+                [str(record.get('_id')) for record in records],
+                [record.get('url') for record in records],
+                [self.model.model_construct(**record) for record in records],
+                [],
+            )
+
+    def _iter_mongo_records(self, collection: "Collection", query: dict | None) -> Iterator[list[dict]]:
+        cursor = collection.find(query or {}, self.mongo_projection).batch_size(self.batch_size)
+        return more_itertools.chunked(cursor, self.batch_size)
+
+    def iter_mongo(
+            self, collection: "Collection", query: dict | None = None, validate: bool = True
+    ) -> Iterator[ExtractedDataBatch]:
+        for records in self._iter_mongo_records(collection, query):
+            if not validate:
+                yield self.construct_batch(records)
+                continue
+            batch = self.validate_batch(records)
+            if batch.invalid_urls:
+                logger.info(f'{len(batch.invalid_urls)} of {len(records)} records failed validation')
+            yield batch
+
+    def iter_parquet(self, root_dir: str) -> Iterator[ExtractedDataBatch]:
+        """
+        :param root_dir: parquet feature mirror root, see ParquetFeatureMirror
+        """
+        for df in self.iter_parquet_columnar(root_dir):
+            yield self.validate_frame(df)
+
+    def iter_mongo_columnar(self, collection: "Collection", query: dict | None = None) -> Iterator["pl.DataFrame"]:
+        """
+        non-validating fast path, one polars frame (mirror schema) per batch
+        """
+        schema = feature_mirror_schema()
+        for records in self._iter_mongo_records(collection, query):
+            yield docs_to_df(records, schema)
+
+    def iter_parquet_columnar(self, root_dir: str) -> Iterator["pl.DataFrame"]:
+        """
+        non-validating fast path, zero-copy slices of batch_size rows of each mirror part file
+        """
+        import polars as pl
+
+        for partition_dir in sorted(os.listdir(root_dir)):
+            partition_path = os.path.join(root_dir, partition_dir)
+            if not os.path.isdir(partition_path):
+                continue
+            for part_file in sorted(os.listdir(partition_path)):
+                if not part_file.endswith('.parquet'):
+                    continue
+                yield from pl.read_parquet(os.path.join(partition_path, part_file)).iter_slices(self.batch_size)
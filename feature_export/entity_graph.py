@@ -0,0 +1,392 @@
+import dataclasses
+import datetime
+import json
+import logging
+import os
+import re
+import unicodedata
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from pymongo.collection import Collection
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+MANIFEST_FILE_NAME = 'manifest.json'
+VOCABULARY_FILE_NAME = 'vocabulary.json'
+# _ids are generated by concurrent writers, a doc committed after a sync may have an _id below its watermark
+LATE_ID_OVERLAP = datetime.timedelta(minutes=10)
+
+# per edge arrays, saved as {name}.npy next to indptr.npy
+EDGE_ARRAYS = {
+    'neighbour': np.int32,
+    'time': 'datetime64[us]',
+    'strength': np.float32,
+    'relation': np.int32,
+    'article': np.int32,
+    'outgoing': np.bool_,
+}
+
+_CORPORATE_SUFFIXES = re.compile(
+    r'(,?\s+(inc|incorporated|corp|corporation|co|company|ltd|limited|llc|plc|ag|sa|nv|group|holdings))+$'
+)
+_NON_WORD = re.compile(r'[^\w&]+')
+
+
+def normalize_entity_name(name: str) -> str:
+    """
+    case, unicode form, punctuation, whitespace and trailing corporate suffixes are ignored,
+    e.g. 'Apple Inc.' and 'APPLE' intern to the same entity
+    """
+    name = unicodedata.normalize('NFKC', name).casefold()
+    name = _NON_WORD.sub(' ', name).strip()
+    stripped = _CORPORATE_SUFFIXES.sub('', name).strip()
+    # keep names which consist only of a suffix ('The Company')
+    return stripped or name
+
+
+@dataclasses.dataclass
+class EntityNeighbour:
+    entity: str
+    entity_type: str
+    edge_count: int
+    max_strength: float
+    mean_strength: float
+    last_seen: datetime.datetime
+    relations: list[str]
+
+
+class EntityGraphIndex:
+    """
+    relationships of all articles as a graph of interned entity ids. edges are kept in both directions
+    in CSR form (indptr + per edge arrays), sorted by entity and time, so an entity's neighbourhood in a time
+    window is a binary search in its slice. edges added since the last query are merged in on the next query.
+    saved as .npy arrays which are memory-mapped on load, plus the vocabularies and the _id and updated_at
+    watermarks as json. articles are keyed by url, an updated article's edges replace its earlier ones
+    """
+
+    def __init__(self):
+        self.entity_ids: dict[str, int] = {}
+        self.entity_names: list[str] = []
+        self.entity_types: list[str] = []
+        self.relation_ids: dict[str, int] = {}
+        self.relation_names: list[str] = []
+        self.urls: list[str] = []
+        # url -> article id, removed articles' urls are left in urls
+        self.article_ids: dict[str, int] = {}
+        self.last_id: str | None = None
+        self.last_updated_at: datetime.datetime | None = None
+
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.edges = {name: np.empty(0, dtype=dtype) for name, dtype in EDGE_ARRAYS.items()}
+        # (source, target, microseconds since epoch, strength, relation, article)
+        self._pending_edges: list[tuple[int, int, int, float, int, int]] = []
+        # article ids whose edges are dropped on the next merge
+        self._removed_articles: set[int] = set()
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.edges['neighbour']) + 2 * len(self._pending_edges)
+
+    def intern_entity(self, name: str, entity_type: str | None = None) -> int:
+        key = normalize_entity_name(name)
+        entity_id = self.entity_ids.get(key)
+        if entity_id is None:
+            entity_id = len(self.entity_names)
+            self.entity_ids[key] = entity_id
+            self.entity_names.append(name)
+            self.entity_types.append(entity_type or '')
+        elif entity_type and not self.entity_types[entity_id]:
+            self.entity_types[entity_id] = entity_type
+        return entity_id
+
+    def _intern_relation(self, relation: str) -> int:
+        relation = relation.strip().casefold()
+        relation_id = self.relation_ids.get(relation)
+        if relation_id is None:
+            relation_id = len(self.relation_names)
+            self.relation_ids[relation] = relation_id
+            self.relation_names.append(relation)
+        return relation_id
+
+    def lookup_entity(self, name: str) -> int | None:
+        return self.entity_ids.get(normalize_entity_name(name))
+
+    def add_article(self, url: str, publish_time: datetime.datetime, entities: list[dict], relationships: list[dict]):
+        """
+        :param publish_time: utc, naive (as read from mongo) or aware
+        :param entities: Entity dicts of the extraction result
+        :param relationships: Relationship dicts of the extraction result
+        """
+        if publish_time.tzinfo is not None:
+            publish_time = publish_time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+        publish_time_us = (publish_time - _EPOCH) // datetime.timedelta(microseconds=1)
+
+        article_id = len(self.urls)
+        self.urls.append(url)
+        self.article_ids[url] = article_id
+
+        for entity in entities or []:
+            self.intern_entity(entity['entity'], entity.get('entity_type'))
+
+        for relationship in relationships or []:
+            source_id = self.intern_entity(relationship['source_entity'])
+            target_id = self.intern_entity(relationship['target_entity'])
+            if source_id == target_id:
+                continue
+
+            descriptions = relationship.get('relationship_descriptions_condensed') \
+                or relationship.get('relationship_descriptions') or ['']
+            self._pending_edges.append((
+                source_id,
+                target_id,
+                publish_time_us,
+                relationship.get('relationship_strength') or 0.0,
+                self._intern_relation(descriptions[0]),
+                article_id,
+            ))
+
+    def remove_article(self, url: str) -> bool:
+        """
+        drops the article's edges on the next merge, e.g. before adding its re-extracted relationships
+        :return: False if the article isn't in the index
+        """
+        article_id = self.article_ids.pop(url, None)
+        if article_id is None:
+            return False
+        self._removed_articles.add(article_id)
+        return True
+
+    def _ensure_csr(self):
+        if not self._pending_edges and not self._removed_articles:
+            return
+
+        pending_edges = [edge for edge in self._pending_edges if edge[5] not in self._removed_articles]
+        columns = list(zip(*pending_edges)) if pending_edges else [()] * 6
+        source, target = np.array(columns[0], dtype=np.int32), np.array(columns[1], dtype=np.int32)
+        time = np.array(columns[2], dtype=np.int64).view('datetime64[us]')
+        strength = np.array(columns[3], dtype=np.float32)
+        relation, article = np.array(columns[4], dtype=np.int32), np.array(columns[5], dtype=np.int32)
+
+        entity_count = len(self.entity_names)
+        existing_source = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int32), np.diff(self.indptr))
+        existing_edges = self.edges
+        if self._removed_articles:
+            kept = ~np.isin(self.edges['article'], np.fromiter(self._removed_articles, dtype=np.int32))
+            existing_source = existing_source[kept]
+            existing_edges = {name: np.asarray(array)[kept] for name, array in self.edges.items()}
+        self._pending_edges = []
+        self._removed_articles = set()
+
+        # both directions, so neighbourhoods don't depend on which side the llm put an entity
+        merged = {
+            'neighbour': np.concatenate([existing_edges['neighbour'], target, source]),
+            'time': np.concatenate([existing_edges['time'], time, time]),
+            'strength': np.concatenate([existing_edges['strength'], strength, strength]),
+            'relation': np.concatenate([existing_edges['relation'], relation, relation]),
+            'article': np.concatenate([existing_edges['article'], article, article]),
+            'outgoing': np.concatenate([
+                existing_edges['outgoing'], np.ones(len(source), dtype=np.bool_), np.zeros(len(source), dtype=np.bool_)
+            ]),
+        }
+        merged_source = np.concatenate([existing_source, source, target])
+
+        order = np.lexsort((merged['time'], merged_source))
+        self.edges = {name: merged[name][order].astype(dtype) for name, dtype in EDGE_ARRAYS.items()}
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(merged_source, minlength=entity_count))])
+
+    def neighbours(
+            self,
+            entity: str,
+            start: datetime.datetime | None = None,
+            end_excl: datetime.datetime | None = None,
+            min_strength: float = 0.0,
+            entity_types: list[str] | None = None,
+            limit: int | None = None
+    ) -> list[EntityNeighbour]:
+        """
+        entities related to the given one in articles published in [start, end_excl) (utc),
+        ordered by number of relating edges
+        :param entity_types: case insensitive entity_type filter, e.g. ['company']
+        """
+        self._ensure_csr()
+
+        entity_id = self.lookup_entity(entity)
+        if entity_id is None or entity_id >= len(self.indptr) - 1:
+            return []
+
+        row_start, row_end = self.indptr[entity_id], self.indptr[entity_id + 1]
+        times = self.edges['time'][row_start:row_end]
+        if start is not None:
+            row_start += np.searchsorted(times, _to_datetime64(start), side='left')
+        if end_excl is not None:
+            row_end = self.indptr[entity_id] + np.searchsorted(times, _to_datetime64(end_excl), side='left')
+        if row_end <= row_start:
+            return []
+
+        neighbour = np.asarray(self.edges['neighbour'][row_start:row_end])
+        strength = np.asarray(self.edges['strength'][row_start:row_end])
+        time = np.asarray(self.edges['time'][row_start:row_end])
+        relation = np.asarray(self.edges['relation'][row_start:row_end])
+
+        mask = strength >= min_strength
+        neighbour, strength, time, relation = neighbour[mask], strength[mask], time[mask], relation[mask]
+        if len(neighbour) == 0:
+            return []
+
+        unique_neighbours, inverse, counts = np.unique(neighbour, return_inverse=True, return_counts=True)
+        max_strength = np.full(len(unique_neighbours), -np.inf, dtype=np.float32)
+        np.maximum.at(max_strength, inverse, strength)
+        strength_sum = np.bincount(inverse, weights=strength, minlength=len(unique_neighbours))
+        last_seen = np.full(len(unique_neighbours), np.datetime64('NaT'), dtype='datetime64[us]')
+        # edges are sorted by time, so the last write per neighbour is the latest
+        last_seen[inverse] = time
+
+        # distinct (neighbour, relation) pairs, grouped by neighbour
+        relation_pairs = np.unique(np.stack([inverse, relation], axis=1), axis=0)
+        relation_bounds = np.searchsorted(relation_pairs[:, 0], np.arange(len(unique_neighbours) + 1))
+
+        order = np.argsort(-counts, kind='stable')
+        allowed_types = {entity_type.casefold() for entity_type in entity_types} if entity_types is not None else None
+
+        results = []
+        for i in order:
+            entity_id = unique_neighbours[i]
+            if allowed_types is not None and self.entity_types[entity_id].casefold() not in allowed_types:
+                continue
+            results.append(EntityNeighbour(
+                entity=self.entity_names[entity_id],
+                entity_type=self.entity_types[entity_id],
+                edge_count=int(counts[i]),
+                max_strength=float(max_strength[i]),
+                mean_strength=float(strength_sum[i] / counts[i]),
+                last_seen=last_seen[i].astype(datetime.datetime),
+                relations=[
+                    self.relation_names[r] for r in relation_pairs[relation_bounds[i]:relation_bounds[i + 1], 1]
+                ],
+            ))
+            if limit is not None and len(results) == limit:
+                break
+        return results
+
+    def save(self, root_dir: str):
+        self._ensure_csr()
+        os.makedirs(root_dir, exist_ok=True)
+
+        for name, array in {'indptr': self.indptr, **self.edges}.items():
+            tmp_path = os.path.join(root_dir, f'{name}.tmp.npy')
+            np.save(tmp_path, np.asarray(array))
+            os.replace(tmp_path, os.path.join(root_dir, f'{name}.npy'))
+
+        vocabulary_path = os.path.join(root_dir, VOCABULARY_FILE_NAME)
+        with open(vocabulary_path + '.tmp', 'w') as f:
+            json.dump({
+                'entity_names': self.entity_names,
+                'entity_types': self.entity_types,
+                'relation_names': self.relation_names,
+                'urls': self.urls,
+            }, f)
+        os.replace(vocabulary_path + '.tmp', vocabulary_path)
+
+        # the manifest is written last, it is what makes a saved index valid
+        manifest_path = os.path.join(root_dir, MANIFEST_FILE_NAME)
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump({
+                'last_id': self.last_id,
+                'last_updated_at': self.last_updated_at.isoformat() if self.last_updated_at else None,
+                'entity_count': len(self.entity_names),
+                'edge_count': len(self.edges['neighbour']),
+                'updated_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            }, f, indent=2)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+    @classmethod
+    def load(cls, root_dir: str, mmap: bool = True) -> "EntityGraphIndex":
+        """
+        :param mmap: memory-map the edge arrays (read only until the next edges are merged in)
+        """
+        index = cls()
+        manifest_path = os.path.join(root_dir, MANIFEST_FILE_NAME)
+        if not os.path.exists(manifest_path):
+            return index
+
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        with open(os.path.join(root_dir, VOCABULARY_FILE_NAME)) as f:
+            vocabulary = json.load(f)
+
+        index.last_id = manifest['last_id']
+        if manifest.get('last_updated_at'):
+            index.last_updated_at = datetime.datetime.fromisoformat(manifest['last_updated_at'])
+        index.entity_names = vocabulary['entity_names']
+        index.entity_types = vocabulary['entity_types']
+        index.relation_names = vocabulary['relation_names']
+        index.urls = vocabulary['urls']
+        # a re-added article's id is the later one
+        index.article_ids = {url: i for i, url in enumerate(index.urls)}
+        index.entity_ids = {normalize_entity_name(name): i for i, name in enumerate(index.entity_names)}
+        index.relation_ids = {name: i for i, name in enumerate(index.relation_names)}
+
+        mmap_mode = 'r' if mmap else None
+        index.indptr = np.load(os.path.join(root_dir, 'indptr.npy'), mmap_mode=mmap_mode)
+        index.edges = {
+            name: np.load(os.path.join(root_dir, f'{name}.npy'), mmap_mode=mmap_mode) for name in EDGE_ARRAYS
+        }
+        return index
+
+    def sync(self, collection: "Collection", batch_size: int = 10_000) -> int:
+        """
+        adds the relationships of docs with _id past the index's watermark, re-reading LATE_ID_OVERLAP before it
+        (articles already in the index are skipped), and replaces those of docs updated since the last sync,
+        e.g. by field group re-extraction
+        :return: number of added or replaced docs
+        """
+        from bson import ObjectId
+
+        from feature_export.parquet_mirror import UPDATED_AT_SKEW_MARGIN
+
+        projection = {'url': 1, 'publish_time': 1, 'entities': 1, 'relationships': 1}
+        sync_started_at = datetime.datetime.now(datetime.timezone.utc) - UPDATED_AT_SKEW_MARGIN
+        synced_count = 0
+
+        if self.last_id:
+            collection.create_index('updated_at')
+            # docs updated before updated_at was written are only found after their next update
+            updated_query = {'updated_at': {'$gt': self.last_updated_at} if self.last_updated_at else {'$exists': True}}
+            for doc in collection.find(updated_query, projection).batch_size(batch_size):
+                if not self.remove_article(doc['url']):
+                    # not added yet, the _id pass adds it
+                    continue
+                if doc.get('publish_time') is not None:
+                    self.add_article(doc['url'], doc['publish_time'], doc.get('entities'), doc.get('relationships'))
+                synced_count += 1
+            logger.info(f'Replaced {synced_count} updated docs')
+
+        if self.last_id:
+            overlap_start = ObjectId.from_datetime(ObjectId(self.last_id).generation_time - LATE_ID_OVERLAP)
+            query = {'_id': {'$gt': overlap_start}}
+        else:
+            query = {}
+        cursor = collection.find(query, projection).sort('_id', 1).batch_size(batch_size)
+
+        for doc in cursor:
+            if doc['url'] not in self.article_ids and doc.get('publish_time') is not None:
+                self.add_article(doc['url'], doc['publish_time'], doc.get('entities'), doc.get('relationships'))
+                synced_count += 1
+                if synced_count % batch_size == 0:
+                    logger.info(f'Added {synced_count} docs, {self.edge_count} edges')
+            self.last_id = max(self.last_id or '', str(doc['_id']))
+
+        self.last_updated_at = sync_started_at
+        return synced_count
+
+
+def _to_datetime64(value: datetime.datetime) -> np.datetime64:
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return np.datetime64(value, 'us')
@@ -0,0 +1,265 @@
+import datetime as dt
+import logging
+import warnings
+from typing import TYPE_CHECKING
+
+import more_itertools
+
+from ohlc_downloader.bar_resampling import (
+    EXTENDED_CLOSE, EXTENDED_OPEN, REGULAR_OPEN, SessionType, filter_session_bars, load_minute_bars_for_symbols
+)
+from ohlc_downloader.trading_calendar import ITradingCalendar
+
+if TYPE_CHECKING:
+    import polars as pl
+    from pymongo.collection import Collection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HORIZONS = ['5m', '30m', '1h', '1d']
+
+# as-of matches further away than this (long weekends included) are treated as missing prices
+MAX_BAR_DISTANCE = '5d'
+
+
+def explode_article_symbols(features_lf: "pl.LazyFrame") -> "pl.LazyFrame":
+    """
+    one row per (article, symbol) of financial_event_with_symbols, in the nested schema of the parquet mirror
+    :return: columns _id, symbol, publish_time (America/New_York)
+    """
+    import polars as pl
+
+    return (
+        features_lf
+        .select('_id', 'publish_time', 'financial_event_with_symbols')
+        .explode('financial_event_with_symbols')
+        .select(
+            '_id',
+            pl.col('publish_time').dt.convert_time_zone('America/New_York'),
+            pl.col('financial_event_with_symbols').struct.field('symbol').struct.field('symbol')
+            .str.to_uppercase().alias('symbol'),
+        )
+        .drop_nulls(['publish_time', 'symbol'])
+        .unique(['_id', 'symbol'])
+    )
+
+
+def classify_publish_session(articles_df: "pl.DataFrame", trading_calendar: ITradingCalendar) -> "pl.Series":
+    """
+    :return: pre_market, regular, after_hours or closed (weekends, holidays and overnight) per article
+    """
+    import polars as pl
+
+    dates = articles_df['publish_time'].dt.date().unique().to_list()
+    sessions = pl.DataFrame(
+        {
+            'publish_date': [date for date in dates if trading_calendar.is_session(date)],
+        },
+        schema={'publish_date': pl.Date}
+    ).with_columns(
+        pl.col('publish_date').map_elements(trading_calendar.session_close, return_dtype=pl.Time).alias('close')
+    )
+
+    publish_clock = pl.col('publish_time').dt.time()
+
+    return (
+        articles_df
+        .select('publish_time')
+        .with_columns(pl.col('publish_time').dt.date().alias('publish_date'))
+        .join(sessions, on='publish_date', how='left', maintain_order='left')
+        .select(
+            pl.when(pl.col('close').is_null()).then(pl.lit('closed'))
+            .when(publish_clock < EXTENDED_OPEN).then(pl.lit('closed'))
+            .when(publish_clock < REGULAR_OPEN).then(pl.lit('pre_market'))
+            .when(publish_clock < pl.col('close')).then(pl.lit('regular'))
+            .when(publish_clock < EXTENDED_CLOSE).then(pl.lit('after_hours'))
+            .otherwise(pl.lit('closed'))
+            .alias('publish_session')
+        )
+        .to_series()
+    )
+
+
+def prepare_bars(
+        minute_df: "pl.DataFrame",
+        trading_calendar: ITradingCalendar,
+        session: SessionType,
+        baseline_sessions: int
+) -> tuple["pl.DataFrame", "pl.DataFrame"]:
+    """
+    :return: (session bars with bar_end and per symbol cumulative volume / bar count sorted by timestamp,
+    per symbol/date average volume per bar over the previous baseline_sessions sessions)
+    """
+    import polars as pl
+
+    bars_df = (
+        filter_session_bars(minute_df, trading_calendar, session)
+        .sort('symbol', 'timestamp')
+        .with_columns(
+            # minute bars are labelled with their start, a bar's close is known at its end
+            (pl.col('timestamp') + dt.timedelta(minutes=1)).alias('bar_end'),
+            pl.col('volume').cum_sum().over('symbol').alias('cum_volume'),
+            pl.int_range(1, pl.len() + 1).over('symbol').alias('cum_bar_count'),
+        )
+    )
+
+    baseline_df = (
+        bars_df
+        .group_by('symbol', pl.col('timestamp').dt.date().alias('date'))
+        .agg(pl.col('volume').sum(), pl.len().alias('bar_count'))
+        .sort('symbol', 'date')
+        .with_columns(
+            # sums over the previous baseline_sessions sessions, excluding the session itself
+            (
+                (pl.col('volume').cum_sum().shift(1) - pl.col('volume').cum_sum().shift(baseline_sessions + 1))
+                .fill_null(pl.col('volume').cum_sum().shift(1))
+                / (pl.col('bar_count').cum_sum().shift(1) - pl.col('bar_count').cum_sum().shift(baseline_sessions + 1))
+                .fill_null(pl.col('bar_count').cum_sum().shift(1))
+            ).over('symbol').alias('baseline_bar_volume')
+        )
+        .select('symbol', 'date', 'baseline_bar_volume')
+        .sort('date')
+    )
+
+    return bars_df.sort('timestamp'), baseline_df
+
+
+def compute_news_reactions(
+        articles_df: "pl.DataFrame",
+        minute_df: "pl.DataFrame",
+        trading_calendar: ITradingCalendar,
+        horizons: list[str] = DEFAULT_HORIZONS,
+        session: SessionType = 'regular',
+        baseline_sessions: int = 20
+) -> "pl.DataFrame":
+    """
+    forward returns and volume shocks of all (article, symbol) rows in one vectorized pass of as-of joins.
+    the base price is the close of the last bar completed before the publish time, the reaction starts at the
+    first bar at or after it, so pre-market and after-hours publishes react from the next bar of the session
+    (the next open for session='regular'). horizons are polars durations added to the reaction start, the price
+    at a horizon is the close of the last bar completed by then.
+    volume_shock is the horizon's volume per bar over the average volume per bar of the previous sessions
+    :param articles_df: columns _id, symbol, publish_time (America/New_York), see explode_article_symbols
+    :param minute_df: minute bars with a symbol column, see load_minute_bars_for_symbols
+    """
+    with warnings.catch_warnings():
+        # every as-of join sorts both sides by its key first, polars can't verify that per 'by' group
+        warnings.filterwarnings('ignore', message='Sortedness of columns cannot be checked')
+        return _compute_news_reactions(articles_df, minute_df, trading_calendar, horizons, session, baseline_sessions)
+
+
+def _compute_news_reactions(
+        articles_df: "pl.DataFrame",
+        minute_df: "pl.DataFrame",
+        trading_calendar: ITradingCalendar,
+        horizons: list[str],
+        session: SessionType,
+        baseline_sessions: int
+) -> "pl.DataFrame":
+    import polars as pl
+
+    bars_df, baseline_df = prepare_bars(minute_df, trading_calendar, session, baseline_sessions)
+
+    reactions_df = (
+        articles_df
+        .with_columns(classify_publish_session(articles_df, trading_calendar))
+        .sort('publish_time')
+        .join_asof(
+            bars_df.select('symbol', 'bar_end', pl.col('close').alias('base_close')),
+            left_on='publish_time', right_on='bar_end', by='symbol',
+            strategy='backward', tolerance=MAX_BAR_DISTANCE
+        )
+        .drop('bar_end')
+        .join_asof(
+            bars_df.select(
+                'symbol',
+                pl.col('timestamp').alias('reaction_start'),
+                (pl.col('cum_volume') - pl.col('volume')).alias('start_cum_volume'),
+                (pl.col('cum_bar_count') - 1).alias('start_cum_bar_count'),
+            ),
+            left_on='publish_time', right_on='reaction_start', by='symbol',
+            strategy='forward', tolerance=MAX_BAR_DISTANCE, coalesce=False
+        )
+        .with_columns(pl.col('reaction_start').dt.date().alias('reaction_date'))
+        .sort('reaction_date')
+        .join_asof(
+            baseline_df, left_on='reaction_date', right_on='date', by='symbol', strategy='backward'
+        )
+        .drop('reaction_date', 'date')
+    )
+
+    horizon_bars_df = bars_df.select('symbol', 'bar_end', 'close', 'cum_volume', 'cum_bar_count')
+
+    for horizon in horizons:
+        reactions_df = (
+            reactions_df
+            .with_columns(pl.col('reaction_start').dt.offset_by(horizon).alias('_horizon_time'))
+            .sort('_horizon_time')
+            .join_asof(
+                horizon_bars_df, left_on='_horizon_time', right_on='bar_end', by='symbol',
+                strategy='backward', tolerance=MAX_BAR_DISTANCE
+            )
+            .with_columns(
+                # no bar completed between the reaction start and the horizon
+                (pl.col('cum_bar_count') - pl.col('start_cum_bar_count')).alias('_horizon_bar_count'),
+                (pl.col('cum_volume') - pl.col('start_cum_volume')).alias(f'volume_{horizon}'),
+            )
+            .with_columns(
+                pl.when(pl.col('_horizon_bar_count') > 0)
+                .then(pl.col('close') / pl.col('base_close') - 1)
+                .alias(f'return_{horizon}'),
+                pl.when(pl.col('_horizon_bar_count') > 0)
+                .then(pl.col(f'volume_{horizon}'))
+                .alias(f'volume_{horizon}'),
+            )
+            .with_columns(
+                (
+                    pl.col(f'volume_{horizon}')
+                    / (pl.col('_horizon_bar_count') * pl.col('baseline_bar_volume'))
+                ).alias(f'volume_shock_{horizon}')
+            )
+            .drop('_horizon_time', 'bar_end', 'close', 'cum_volume', 'cum_bar_count', '_horizon_bar_count')
+        )
+
+    return (
+        reactions_df
+        .drop('start_cum_volume', 'start_cum_bar_count')
+        .sort('publish_time', '_id', 'symbol')
+    )
+
+
+def compute_news_reactions_batched(
+        articles_df: "pl.DataFrame",
+        minute_mongo_ohlc_collection: "Collection",
+        trading_calendar: ITradingCalendar,
+        horizons: list[str] = DEFAULT_HORIZONS,
+        session: SessionType = 'regular',
+        baseline_sessions: int = 20,
+        symbols_per_batch: int = 50
+) -> "pl.DataFrame":
+    """
+    loads the minute bars of symbols_per_batch symbols at a time (one mongo query per batch), covering the
+    articles' publish times plus the baseline lookback and the horizons
+    """
+    import polars as pl
+
+    if articles_df.is_empty():
+        return articles_df
+
+    # calendar days generously covering baseline_sessions sessions before and the longest horizon after
+    start = articles_df['publish_time'].min() - dt.timedelta(days=baseline_sessions * 2 + 10)
+    end_excl = articles_df['publish_time'].max() + dt.timedelta(days=10)
+    end_excl = max([end_excl, *(pl.select(pl.lit(end_excl).dt.offset_by(horizon)).item() for horizon in horizons)])
+
+    symbols = sorted(articles_df['symbol'].unique().to_list())
+    results = []
+
+    for symbols_batch in more_itertools.chunked(symbols, symbols_per_batch):
+        minute_df = load_minute_bars_for_symbols(minute_mongo_ohlc_collection, symbols_batch, start, end_excl)
+        batch_articles_df = articles_df.filter(pl.col('symbol').is_in(symbols_batch))
+        results.append(
+            compute_news_reactions(batch_articles_df, minute_df, trading_calendar, horizons, session, baseline_sessions)
+        )
+        logger.info(f'Computed reactions of {len(batch_articles_df)} article symbols, {len(minute_df)} minute bars')
+
+    return pl.concat(results).sort('publish_time', '_id', 'symbol')
@@ -0,0 +1,121 @@
+import logging
+import os
+from typing import TYPE_CHECKING
+
+from feature_export.parquet_mirror import ParquetFeatureMirror, docs_to_df
+
+if TYPE_CHECKING:
+    import polars as pl
+
+logger = logging.getLogger(__name__)
+
+ARTICLE_COLUMNS = [
+    'url', '_id', 'download_time', 'publish_time', 'publish_time_ny', 'publish_date', 'article_title',
+    'summary', 'main_company', 'article_language', 'model_name',
+]
+
+# normalized table name -> list field of the extraction result, one row per list item
+LIST_TABLES = {
+    'events': 'financial_event_with_symbols',
+    'keywords': 'keywords',
+    'sentiments': 'sentiments',
+    'entities': 'entities',
+    'relationships': 'relationships',
+    'external_links': 'external_links',
+}
+
+NORMALIZED_TABLES = ['articles', *LIST_TABLES]
+
+# item fields which would collide with the url key
+ITEM_FIELD_RENAMES = {
+    'external_links': {'url': 'link_url'},
+}
+
+
+def _unnest_all(df: "pl.DataFrame") -> "pl.DataFrame":
+    import polars as pl
+
+    struct_columns = [name for name, dtype in df.schema.items() if isinstance(dtype, pl.Struct)]
+    while struct_columns:
+        df = df.unnest(struct_columns)
+        struct_columns = [name for name, dtype in df.schema.items() if isinstance(dtype, pl.Struct)]
+    return df
+
+
+def normalize_list_field(df: "pl.DataFrame", field: str) -> "pl.DataFrame":
+    """
+    one row per item of a list field, keyed by url and the item's position in the list.
+    item structs are flattened, e.g. events get financial_event, symbol and stock_exchanges columns
+    """
+    import polars as pl
+
+    item_dtype = df.schema[field].inner
+    renames = ITEM_FIELD_RENAMES.get(field, {})
+    item_field_names = [renames.get(item_field.name, item_field.name) for item_field in item_dtype.fields]
+
+    return _unnest_all(
+        df
+        .select(
+            'url',
+            pl.col(field).list.eval(pl.element().struct.rename_fields(item_field_names)),
+            pl.int_ranges(pl.col(field).list.len()).cast(pl.List(pl.Int32)).alias('position'),
+        )
+        .explode(field, 'position')
+        # empty and missing lists explode to a null row
+        .filter(pl.col('position').is_not_null())
+        .select('url', 'position', field)
+    )
+
+
+def normalize_docs(df: "pl.DataFrame") -> dict[str, "pl.DataFrame"]:
+    """
+    :param df: nested extraction results, see docs_to_df
+    :return: normalized table name -> flat table keyed by url
+    """
+    tables = {'articles': df.select(ARTICLE_COLUMNS)}
+    for table_name, field in LIST_TABLES.items():
+        tables[table_name] = normalize_list_field(df, field)
+    return tables
+
+
+class NormalizedFeatureExport(ParquetFeatureMirror):
+    """
+    incremental export of the llm_feature_extract collection into flat parquet tables keyed by url:
+    {root}/articles, events, keywords, sentiments, entities, relationships and external_links.
+    docs are streamed batch_size at a time with the mirror's _id and updated_at watermarks, each batch is normalized
+    and written as one part file per table, so memory stays bounded by the batch size
+    """
+
+    key_column = 'url'
+
+    def write_batch(self, docs: list[dict], part_suffix: str = ''):
+        tables = normalize_docs(docs_to_df(docs, self.schema))
+        first_id, last_id = str(docs[0]['_id']), str(docs[-1]['_id'])
+
+        # deterministic file names, a re-run after a crash overwrites the batch's files (see ParquetFeatureMirror)
+        for table_name, table_df in tables.items():
+            table_dir = os.path.join(self.root_dir, table_name)
+            os.makedirs(table_dir, exist_ok=True)
+
+            path = os.path.join(table_dir, f'part-{first_id}-{last_id}{part_suffix}.parquet')
+            tmp_path = path + '.tmp'
+            table_df.write_parquet(tmp_path)
+            os.replace(tmp_path, path)
+
+
+def register_normalized_duckdb_views(duckdb_conn, root_dir: str, view_prefix: str = 'llm_feature_'):
+    """
+    one TEMP VIEW per normalized table, e.g. llm_feature_events
+    """
+    for table_name in NORMALIZED_TABLES:
+        parquet_glob = os.path.join(root_dir, table_name, '*.parquet')
+        duckdb_conn.execute(
+            f"""CREATE OR REPLACE TEMP VIEW {view_prefix}{table_name} AS
+                SELECT * FROM read_parquet('{parquet_glob}', union_by_name = true)"""
+        )
+
+
+def scan_normalized_table(root_dir: str, table_name: str) -> "pl.LazyFrame":
+    import polars as pl
+
+    return pl.scan_parquet(os.path.join(root_dir, table_name, '*.parquet'))
@@ -0,0 +1,270 @@
+import datetime
+import glob
+import json
+import logging
+import os
+import types
+import typing
+from typing import Iterator, Literal, TYPE_CHECKING
+
+import more_itertools
+from pydantic import BaseModel
+
+from feature_extractor.field_structure_definitions import FinancialNewsExtractedData
+
+if TYPE_CHECKING:
+    import polars as pl
+    from pymongo.collection import Collection
+
+logger = logging.getLogger(__name__)
+
+NULL_PARTITION_VALUE = '__HIVE_DEFAULT_PARTITION__'
+WATERMARK_FILE_NAME = '_watermark.json'
+DUCKDB_VIEW_NAME = 'llm_feature_extract_local'
+UPDATED_AT_SKEW_MARGIN = datetime.timedelta(minutes=5)
+
+
+def pydantic_annotation_to_polars_dtype(annotation) -> "pl.DataType":
+    import polars as pl
+
+    origin = typing.get_origin(annotation)
+
+    if origin is list:
+        return pl.List(pydantic_annotation_to_polars_dtype(typing.get_args(annotation)[0]))
+    if origin is Literal or annotation is str:
+        return pl.String
+    if origin in (typing.Union, types.UnionType):
+        # optional fields, the mirror columns are nullable anyway
+        non_none_args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        return pydantic_annotation_to_polars_dtype(non_none_args[0])
+    if annotation is float:
+        return pl.Float64
+    if annotation is int:
+        return pl.Int64
+    if annotation is bool:
+        return pl.Boolean
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return pl.Struct({
+            name: pydantic_annotation_to_polars_dtype(field.annotation)
+            for name, field in annotation.model_fields.items()
+        })
+
+    raise ValueError(f'No polars dtype for annotation {annotation}')
+
+
+def feature_mirror_schema() -> "pl.Schema":
+    """
+    nested lists of the extracted data (events, symbols, entities, ...) are kept as arrow list/struct columns
+    """
+    import polars as pl
+
+    return pl.Schema({
+        '_id': pl.String,
+        'url': pl.String,
+        'download_time': pl.Datetime('us', 'UTC'),
+        'publish_time': pl.Datetime('us', 'UTC'),
+        'article_title': pl.String,
+        **{
+            name: pydantic_annotation_to_polars_dtype(field.annotation)
+            for name, field in FinancialNewsExtractedData.model_fields.items()
+        },
+        # flat canonical symbols, null for docs written without a symbol resolver
+        'symbols': pl.List(pl.String),
+        'listings': pl.List(pl.String),
+        'model_name': pl.String,
+    })
+
+
+def _is_struct_list(dtype: "pl.DataType") -> bool:
+    import polars as pl
+
+    return isinstance(dtype, pl.List) and isinstance(dtype.inner, pl.Struct)
+
+
+def docs_to_df(docs: list[dict], schema: "pl.Schema") -> "pl.DataFrame":
+    import polars as pl
+
+    columns = []
+    for name, dtype in schema.items():
+        values = [str(doc['_id']) for doc in docs] if name == '_id' else [doc.get(name) for doc in docs]
+        if _is_struct_list(dtype):
+            # polars builds structs from python dicts row by row, decoding the column's json in rust is several
+            # times faster
+            columns.append(pl.Series(name, [json.dumps(value) for value in values]).str.json_decode(dtype))
+        else:
+            columns.append(pl.Series(name, values, dtype=dtype, strict=False))
+
+    # naive datetimes from mongo are utc
+    return pl.DataFrame(columns).with_columns(
+        pl.col('publish_time').dt.convert_time_zone('America/New_York').alias('publish_time_ny'),
+    ).with_columns(
+        pl.col('publish_time_ny').dt.date().alias('publish_date'),
+    )
+
+
+class ParquetFeatureMirror:
+    """
+    incremental, date partitioned (by publish date in NY) local parquet mirror of the llm_feature_extract collection.
+    new docs are found with an _id watermark and updated docs (merged field groups, resolved symbols, post metadata)
+    with an updated_at watermark, so each sync only reads docs added or updated since the last one.
+    the earlier rows of an updated doc are removed from the part files before its new row is written
+    """
+
+    # identifies a doc's rows in the part files
+    key_column = '_id'
+
+    def __init__(self, root_dir: str, batch_size: int = 10_000):
+        self.root_dir = root_dir
+        self.batch_size = batch_size
+        self.schema = feature_mirror_schema()
+
+    @property
+    def watermark_path(self) -> str:
+        return os.path.join(self.root_dir, WATERMARK_FILE_NAME)
+
+    def read_watermark(self) -> tuple[str | None, datetime.datetime | None]:
+        """
+        :return: the last mirrored _id, and the updated_at up to which updates were mirrored
+        (None for mirrors synced before updates were tracked)
+        """
+        if not os.path.exists(self.watermark_path):
+            return None, None
+        with open(self.watermark_path) as f:
+            watermark = json.load(f)
+        last_updated_at = watermark.get('last_updated_at')
+        return watermark['last_id'], datetime.datetime.fromisoformat(last_updated_at) if last_updated_at else None
+
+    def write_watermark(self, last_id: str, last_updated_at: datetime.datetime | None):
+        tmp_path = self.watermark_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'last_id': last_id,
+                'last_updated_at': last_updated_at.isoformat() if last_updated_at else None,
+                'updated_at': datetime.datetime.now(datetime.timezone.utc).isoformat()
+            }, f)
+        os.replace(tmp_path, self.watermark_path)
+
+    def sync(self, collection: "Collection") -> int:
+        """
+        :return: number of mirrored new and updated docs
+        """
+        from bson import ObjectId
+
+        os.makedirs(self.root_dir, exist_ok=True)
+
+        last_id, last_updated_at = self.read_watermark()
+        # updated_at is set by the writers' clocks, the margin mirrors updates of skewed writers twice instead of never
+        sync_started_at = datetime.datetime.now(datetime.timezone.utc) - UPDATED_AT_SKEW_MARGIN
+
+        logger.info(f'Mirroring docs with _id > {last_id}')
+        new_query = {'_id': {'$gt': ObjectId(last_id)}} if last_id else {}
+
+        mirrored_count = 0
+        for docs in self._iter_batches(collection, new_query):
+            self.write_batch(docs)
+            self.write_watermark(str(docs[-1]['_id']), last_updated_at)
+            mirrored_count += len(docs)
+            logger.info(f'Mirrored {mirrored_count} docs')
+
+        if last_id:
+            collection.create_index('updated_at')
+            # docs updated before updated_at was written are only found after their next update
+            logger.info(f'Mirroring docs with _id <= {last_id} updated after {last_updated_at}')
+            updated_query = {
+                '_id': {'$lte': ObjectId(last_id)},
+                'updated_at': {'$gt': last_updated_at} if last_updated_at else {'$exists': True},
+            }
+            # the earlier rows of all updated docs are removed at once, so each part file is rewritten at most once.
+            # an update may change the partition (publish_time), so earlier rows are looked up in all files
+            updated_keys = [
+                str(doc[self.key_column]) for doc in collection.find(updated_query, {self.key_column: 1})
+            ]
+            if updated_keys:
+                removed_count = self.remove_mirrored_rows(updated_keys)
+                logger.info(f'Removed {removed_count} earlier rows of {len(updated_keys)} updated docs')
+
+            # the files of earlier syncs may have the same first and last _id, a suffix keeps them apart
+            part_suffix = f'-updated-{sync_started_at:%Y%m%dT%H%M%S}'
+
+            for docs in self._iter_batches(collection, updated_query):
+                self.write_batch(docs, part_suffix)
+                mirrored_count += len(docs)
+                logger.info(f'Mirrored {mirrored_count} docs')
+
+        new_last_id, _ = self.read_watermark()
+        if new_last_id:
+            # a crash before this re-reads the updates, the removal makes that idempotent
+            self.write_watermark(new_last_id, sync_started_at)
+
+        return mirrored_count
+
+    def _iter_batches(self, collection: "Collection", query: dict) -> Iterator[list[dict]]:
+        cursor = (
+            collection
+            .find(query, {'summary_embeddings': 0})
+            .sort('_id', 1)
+            .batch_size(self.batch_size)
+        )
+        return more_itertools.chunked(cursor, self.batch_size)
+
+    def part_file_paths(self) -> list[str]:
+        return sorted(glob.glob(os.path.join(self.root_dir, '*', '*.parquet')))
+
+    def remove_mirrored_rows(self, keys: list[str]) -> int:
+        """
+        rewrites the part files with rows of the given keys without them, reading only the key column of the others
+        :return: number of removed rows
+        """
+        import polars as pl
+
+        keys = pl.Series(keys, dtype=pl.String)
+        removed_count = 0
+        for path in self.part_file_paths():
+            stale = pl.read_parquet(path, columns=[self.key_column])[self.key_column].is_in(keys)
+            stale_count = stale.sum()
+            if not stale_count:
+                continue
+
+            df = pl.read_parquet(path).filter(~stale)
+            if df.is_empty():
+                os.remove(path)
+            else:
+                tmp_path = path + '.tmp'
+                df.write_parquet(tmp_path)
+                os.replace(tmp_path, path)
+            removed_count += stale_count
+
+        return removed_count
+
+    def write_batch(self, docs: list[dict], part_suffix: str = ''):
+        df = docs_to_df(docs, self.schema)
+        first_id, last_id = str(docs[0]['_id']), str(docs[-1]['_id'])
+
+        # file names are deterministic per batch, so re-running after a crash before the watermark was written
+        # overwrites the batch's files instead of duplicating them
+        for (publish_date,), partition_df in df.partition_by('publish_date', as_dict=True).items():
+            partition_value = publish_date.isoformat() if publish_date is not None else NULL_PARTITION_VALUE
+            partition_dir = os.path.join(self.root_dir, f'publish_date={partition_value}')
+            os.makedirs(partition_dir, exist_ok=True)
+
+            path = os.path.join(partition_dir, f'part-{first_id}-{last_id}{part_suffix}.parquet')
+            tmp_path = path + '.tmp'
+            partition_df.drop('publish_date').write_parquet(tmp_path)
+            os.replace(tmp_path, path)
+
+
+def register_duckdb_view(duckdb_conn, root_dir: str, view_name: str = DUCKDB_VIEW_NAME):
+    parquet_glob = os.path.join(root_dir, '*', '*.parquet')
+    duckdb_conn.execute(
+        f"""CREATE OR REPLACE TEMP VIEW {view_name} AS
+            SELECT * FROM read_parquet('{parquet_glob}', hive_partitioning = true, union_by_name = true)"""
+    )
+
+
+def scan_feature_mirror(root_dir: str) -> "pl.LazyFrame":
+    import polars as pl
+
+    return pl.scan_parquet(
+        os.path.join(root_dir, '*', '*.parquet'),
+        hive_partitioning=True,
+    )
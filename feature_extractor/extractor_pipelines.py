@@ -1,84 +1,348 @@
 import asyncio
+import datetime
 import logging
+from typing import Awaitable, Callable
 
 import more_itertools
 
-from feature_extractor.raw_html_reading import IRawHtmlReader, IFeatureResultRepo
-from feature_extractor.feature_extract import IFinancialNewsDataExtractor, FinancialNewsExtractResult
+from feature_extractor.raw_html_reading import IAsyncRawHtmlReader, IAsyncFeatureResultRepo
+from feature_extractor.feature_extract import (
+    IFinancialNewsDataExtractor, FinancialNewsExtractResult, ExtractionFailedError, ReplayMissError,
+    classify_extraction_error
+)
+from feature_extractor.field_structure_definitions import (
+    FIELD_GROUP_VERSIONS, FieldGroupName, get_outdated_field_groups
+)
+from feature_extractor.relevance_prefilter import IRelevancePrefilter
+from feature_extractor.symbol_resolution import ISymbolResolver, resolve_extracted_symbols
 
 logger = logging.getLogger(__name__)
 
 
+class WriteFenceError(Exception):
+    """
+    raised instead of writing when the write fence reports that this worker no longer owns its work,
+    e.g. its shard lease expired and another worker may have claimed the shard
+    """
+
+
 class ExtractorPipeline:
     def __init__(
             self,
-            raw_html_reader: IRawHtmlReader,
+            raw_html_reader: IAsyncRawHtmlReader,
             feature_extractor: IFinancialNewsDataExtractor,
-            feature_result_repo: IFeatureResultRepo,
-            test_single_write: bool = False
+            feature_result_repo: IAsyncFeatureResultRepo,
+            test_single_write: bool = False,
+            relevance_prefilter: IRelevancePrefilter | None = None,
+            symbol_resolver: ISymbolResolver | None = None
     ):
         self.raw_html_reader = raw_html_reader
         self.feature_extractor = feature_extractor
         self.feature_result_repo = feature_result_repo
         self.test_single_write = test_single_write
+        self.relevance_prefilter = relevance_prefilter
+        self.symbol_resolver = symbol_resolver
 
-    async def run(self, start_date, end_date_excl):
+    async def run(self, start_date, end_date_excl, write_fence: Callable[[], Awaitable[bool]] | None = None):
+        """
+        :param write_fence: checked before every write, see extract_and_write_chunk
+        """
 
         limit = 100
         chunk_size = 5 if not self.test_single_write else 1
 
-        dt_of_last_saved_url = self.feature_result_repo.get_dt_of_last_saved_url(start_date, end_date_excl)
+        dt_of_last_saved_url = await self.feature_result_repo.get_dt_of_last_saved_url(start_date, end_date_excl)
 
         if dt_of_last_saved_url:
-            skip = self.raw_html_reader.get_initial_skip_page(start_date, end_date_excl, dt_of_last_saved_url)
+            skip = await self.raw_html_reader.get_initial_skip_page(start_date, end_date_excl, dt_of_last_saved_url)
         else:
             skip = 0
 
+        # the next page is read while the current one is extracted, so reads overlap with LLM requests
+        next_page = asyncio.create_task(self.read_new_docs(start_date, end_date_excl, skip, limit))
+        try:
+            while True:
+                docs, new_docs = await next_page
+                if not docs:
+                    break
+                skip += limit
+                next_page = asyncio.create_task(self.read_new_docs(start_date, end_date_excl, skip, limit))
+
+                if self.relevance_prefilter is not None:
+                    new_docs = await self.apply_prefilter(new_docs)
+
+                for i, chunk in enumerate(more_itertools.chunked(new_docs, chunk_size)):
+                    await self.extract_and_write_chunk(chunk, i, write_fence)
+                    if self.test_single_write:
+                        break
+
+                if self.test_single_write:
+                    break
+        finally:
+            next_page.cancel()
+
+    async def read_new_docs(self, start_date, end_date_excl, skip, limit) -> tuple[list, list]:
+        """
+        :return: the page of docs and those of them which are neither saved nor dead-lettered yet
+        """
+        docs = await self.raw_html_reader.read(start_date, end_date_excl, skip, limit)
+        if not docs:
+            return docs, []
+        new_urls = set(await self.feature_result_repo.get_non_saved_urls(
+            [doc["url"] for doc in docs], exclude_dead_letters=True))
+        return docs, [doc for doc in docs if doc["url"] in new_urls]
+
+    async def apply_prefilter(self, docs: list) -> list:
+        """
+        scores docs with the relevance prefilter, records every decision and returns only the docs to send to the LLM
+        """
+        if not docs:
+            return docs
+
+        decided_at = datetime.datetime.now(datetime.timezone.utc)
+        docs_to_extract = []
+        decision_records = []
+
+        for doc in docs:
+            decision = self.relevance_prefilter.decide(
+                doc.get("articleTitle", ""),
+                doc[self.raw_html_reader.content_column_name]
+            )
+            if decision.action == "extract":
+                docs_to_extract.append(doc)
+
+            decision_records.append({
+                "url": doc["url"],
+                "download_time": doc[self.raw_html_reader.download_time_column_name],
+                "publish_time": doc.get("publishTime"),
+                "action": decision.action,
+                "score": decision.score,
+                "symbols": decision.symbols,
+                "matched_keywords": decision.matched_keywords,
+                "prefilter_name": self.relevance_prefilter.name,
+                "decided_at": decided_at,
+            })
+
+        await self.feature_result_repo.write_prefilter_decisions(decision_records)
+
+        logger.info(
+            f"Prefilter kept {len(docs_to_extract)} of {len(docs)} docs for extraction")
+
+        return docs_to_extract
+
+    async def replay_dead_letters(self, max_failure_count: int | None = None):
+        """
+        re-extracts dead-lettered docs. docs which fail again stay dead-lettered with their failure count increased
+        """
+        limit = 100
+        chunk_size = 5 if not self.test_single_write else 1
+
+        after_id = None
+
         while True:
-            docs = list(self.raw_html_reader.read(start_date, end_date_excl, skip, limit))
-            if not docs:
+            dead_letters = await self.feature_result_repo.get_dead_letters(after_id, limit, max_failure_count)
+            if not dead_letters:
                 break
-            all_urls = [doc["url"] for doc in docs]
-            new_urls = self.feature_result_repo.get_non_saved_urls(all_urls)
-            new_docs = [doc for doc in docs if doc["url"] in new_urls]
+            after_id = dead_letters[-1]["_id"]
 
-            for i, chunk in enumerate(more_itertools.chunked(new_docs, chunk_size)):
-                feature_docs, failed = await self.extract_chunk(chunk, i)
+            urls = [dead_letter["url"] for dead_letter in dead_letters]
+            new_urls = set(await self.feature_result_repo.get_non_saved_urls(urls))
+            already_saved_urls = [url for url in urls if url not in new_urls]
+            if already_saved_urls:
+                await self.feature_result_repo.delete_dead_letters(already_saved_urls)
 
-                writeable_docs = [
-                    self.build_writeable_doc(extracted_data, doc)
-                    for extracted_data, doc
-                    in zip(feature_docs, chunk)
-                ]
+            docs = await self.raw_html_reader.read_by_urls(list(new_urls))
+            logger.info(f"Replaying {len(docs)} dead-lettered docs")
+
+            for i, chunk in enumerate(more_itertools.chunked(docs, chunk_size)):
+                written_urls = await self.extract_and_write_chunk(chunk, i)
+                if written_urls:
+                    await self.feature_result_repo.delete_dead_letters(written_urls)
+                if self.test_single_write:
+                    return
+
+    async def replay_recorded_responses(
+            self,
+            replay_result_repo: IAsyncFeatureResultRepo,
+            start_date: datetime.date | None = None,
+            end_date_excl: datetime.date | None = None
+    ):
+        """
+        re-extracts the saved docs (of [start_date, end_date_excl) if given) with the feature extractor, a
+        ReplayFinancialNewsDataExtractor, and overwrites the results in replay_result_repo.
+        docs without a recorded response are skipped, replay failures are logged and never dead-lettered
+        """
+        limit = 100
+        chunk_size = 5 if not self.test_single_write else 1
+
+        after_id = None
+        replayed_count, miss_count, failed_count = 0, 0, 0
+
+        while True:
+            saved_docs = await self.feature_result_repo.get_saved_urls(start_date, end_date_excl, after_id, limit)
+            if not saved_docs:
+                break
+            after_id = saved_docs[-1]["_id"]
+
+            raw_docs = await self.raw_html_reader.read_by_urls([saved_doc["url"] for saved_doc in saved_docs])
+            if len(raw_docs) < len(saved_docs):
+                logger.info(f"Raw html missing for {len(saved_docs) - len(raw_docs)} docs, skipping them")
 
-                if len(writeable_docs) > 0:
-                    self.feature_result_repo.write(writeable_docs)
-                if self.test_single_write or failed:
+            for i, chunk in enumerate(more_itertools.chunked(raw_docs, chunk_size)):
+                results = await self.extract_chunk(chunk, i)
+
+                writeable_docs = []
+                for result, doc in zip(results, chunk):
+                    if isinstance(result, ReplayMissError):
+                        miss_count += 1
+                    elif isinstance(result, BaseException):
+                        logger.info(f"Error replaying response for {doc['url']}: {result}")
+                        failed_count += 1
+                    else:
+                        writeable_docs.append(self.build_writeable_doc(result, doc))
+
+                await replay_result_repo.overwrite(writeable_docs)
+                replayed_count += len(writeable_docs)
+
+                if self.test_single_write:
                     break
 
+            logger.info(f"Replayed {replayed_count} docs, {miss_count} without a recorded response, "
+                        f"{failed_count} failed")
             if self.test_single_write:
-                break
+                return
+
+    async def extract_and_write_chunk(
+            self, chunk, i, write_fence: Callable[[], Awaitable[bool]] | None = None) -> list[str]:
+        """
+        each doc succeeds or fails on its own: successful docs are written, failed docs are dead-lettered
+        :param write_fence: awaitable, returns False if the results must not be written anymore,
+        raises WriteFenceError then
+        :return: urls of written docs
+        """
+        results = await self.extract_chunk(chunk, i)
+
+        writeable_docs = []
+        dead_letters = []
+        failed_at = datetime.datetime.now(datetime.timezone.utc)
+
+        for result, doc in zip(results, chunk):
+            if isinstance(result, BaseException):
+                logger.info(f"Error extracting features for {doc['url']}: {result}")
+                dead_letters.append(self.build_dead_letter(result, doc, failed_at))
+            else:
+                writeable_docs.append(self.build_writeable_doc(result, doc))
+
+        if write_fence is not None and (writeable_docs or dead_letters) and not await write_fence():
+            raise WriteFenceError(f"Write fence closed, dropped results of {len(chunk)} docs")
 
-            skip += limit
+        if writeable_docs:
+            await self.feature_result_repo.write(writeable_docs)
+        if dead_letters:
+            await self.feature_result_repo.write_dead_letters(dead_letters)
 
-    async def extract_chunk(self, chunk, i):
+        return [doc["url"] for doc in writeable_docs]
+
+    async def extract_chunk(self, chunk, i) -> list[FinancialNewsExtractResult | BaseException]:
         tasks = []
         for j, doc in enumerate(chunk):
             logger.info(f"Extracting features for doc {j + 1} chunk {i + 1}")
             tasks.append(self.feature_extractor.extract_async(doc[self.raw_html_reader.content_column_name]))
 
-        feature_docs = []
-        failed = False
-        try:
-            feature_docs = await asyncio.gather(*tasks)
-        except Exception as e:
-            logger.info(f"Error extracting features: {e}")
-            failed = True
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    def build_dead_letter(self, error: BaseException, original_doc, failed_at: datetime.datetime):
+        if isinstance(error, ExtractionFailedError):
+            error_class, error_kind, attempts = error.error_class, error.error_kind, error.attempts
+        else:
+            error_class, error_kind, attempts = type(error).__name__, classify_extraction_error(error), 1
+
+        return {
+            "url": original_doc["url"],
+            "download_time": original_doc[self.raw_html_reader.download_time_column_name],
+            "error_class": error_class,
+            "error_kind": error_kind,
+            "error_message": str(error)[:2_000],
+            "attempts": attempts,
+            "failed_at": failed_at,
+        }
+
+    async def run_field_group_reextraction(self, field_groups: list[FieldGroupName] | None = None):
+        """
+        re-extracts only the field groups which are missing or outdated (see FIELD_GROUP_VERSIONS) in stored docs,
+        and merges them into the stored docs
+        """
+        limit = 100
+        chunk_size = 5 if not self.test_single_write else 1
+
+        if field_groups is None:
+            field_groups = list(FIELD_GROUP_VERSIONS)
+        target_versions = {field_group: FIELD_GROUP_VERSIONS[field_group] for field_group in field_groups}
+
+        after_id = None
+
+        while True:
+            stored_docs = await self.feature_result_repo.get_docs_with_outdated_field_groups(
+                target_versions, after_id, limit)
+            if not stored_docs:
+                break
+            after_id = stored_docs[-1]["_id"]
+
+            outdated_by_url = {}
+            for stored_doc in stored_docs:
+                outdated = [
+                    field_group
+                    for field_group in get_outdated_field_groups(
+                        stored_doc["field_group_versions"], stored_doc["present_fields"])
+                    if field_group in target_versions
+                ]
+                if outdated:
+                    outdated_by_url[stored_doc["url"]] = outdated
+
+            raw_docs = await self.raw_html_reader.read_by_urls(list(outdated_by_url))
+            if len(raw_docs) < len(outdated_by_url):
+                logger.info(f"Raw html missing for {len(outdated_by_url) - len(raw_docs)} docs, skipping them")
+
+            for i, chunk in enumerate(more_itertools.chunked(raw_docs, chunk_size)):
+                logger.info(f"Re-extracting field groups for chunk {i + 1}")
+                tasks = [
+                    self.feature_extractor.extract_field_groups_async(
+                        doc[self.raw_html_reader.content_column_name],
+                        outdated_by_url[doc["url"]]
+                    )
+                    for doc in chunk
+                ]
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+
+                for result, doc in zip(results, chunk):
+                    if isinstance(result, BaseException):
+                        logger.info(f"Error re-extracting field groups for {doc['url']}: {result}")
+                        continue
+                    extracted_fields = result.data.model_dump()
+                    symbol_fields = self.resolve_symbols(extracted_fields)
+                    await self.feature_result_repo.merge_field_groups(
+                        doc["url"],
+                        {**extracted_fields, **symbol_fields},
+                        {field_group: FIELD_GROUP_VERSIONS[field_group] for field_group in result.field_groups},
+                        result.model_name
+                    )
+
+                if self.test_single_write:
+                    return
 
-        return feature_docs, failed
+    def resolve_symbols(self, extracted_fields: dict) -> dict:
+        """
+        canonicalizes the symbols of extracted financial events in place
+        :return: flat symbol fields to write with the extracted fields, empty without a symbol resolver
+        """
+        if self.symbol_resolver is None:
+            return {}
+        return resolve_extracted_symbols(self.symbol_resolver, extracted_fields)
 
     def build_writeable_doc(self, extract_result: FinancialNewsExtractResult, original_doc):
         extracted_data_as_dict = extract_result.data.model_dump()
+        symbol_fields = self.resolve_symbols(extracted_data_as_dict)
+        extracted_at = datetime.datetime.now(datetime.timezone.utc)
 
         return {
             "url": original_doc["url"],
@@ -87,5 +351,10 @@ class ExtractorPipeline:
             "article_title": original_doc["articleTitle"],
             # "content": original_doc["content"],
             **extracted_data_as_dict,
-            "model_name": extract_result.model_name
+            **symbol_fields,
+            "model_name": extract_result.model_name,
+            "field_group_versions": dict(FIELD_GROUP_VERSIONS),
+            "extracted_at": extracted_at,
+            # every in-place update sets it too, the parquet mirror re-syncs docs by it
+            "updated_at": extracted_at,
         }
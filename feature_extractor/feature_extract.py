@@ -1,72 +1,463 @@
 import abc
 import asyncio
+import collections
 import dataclasses
+import datetime
 import logging
+import random
 import time
+from typing import Literal, TYPE_CHECKING
 
-import instructor
-import google.generativeai as genai
-import trafilatura
-from instructor import AsyncInstructor
+from pydantic import BaseModel, ValidationError
 
-from feature_extractor.field_structure_definitions import FinancialNewsExtractedData
+from feature_extractor.field_structure_definitions import (
+    FinancialNewsExtractedData, FieldGroupName, build_field_groups_model
+)
 from feature_extractor.llm_providers import ILlmProvider, LlmWrapper
+from feature_extractor.llm_response_log import (
+    LlmResponseRecord, completion_to_dict, completion_token_counts, hash_prompt, iter_log_records,
+    raw_completion_arguments
+)
+
+if TYPE_CHECKING:
+    from feature_extractor.llm_response_log import LlmResponseLog
 
 logger = logging.getLogger(__name__)
 
 
+ExtractionErrorKind = Literal["validation", "throttling", "other"]
+
+_THROTTLING_ERROR_CLASS_NAMES = {"ResourceExhausted", "TooManyRequests", "RateLimitError", "ServiceUnavailable"}
+_THROTTLING_ERROR_MESSAGE_PARTS = ("429", "resource exhausted", "resource_exhausted", "quota", "rate limit")
+
+
+def classify_extraction_error(error: BaseException) -> ExtractionErrorKind:
+    from instructor.exceptions import InstructorRetryException
+
+    if isinstance(error, ValidationError) or isinstance(error, InstructorRetryException):
+        return "validation"
+
+    error_message = str(error).lower()
+    if (type(error).__name__ in _THROTTLING_ERROR_CLASS_NAMES
+            or any(part in error_message for part in _THROTTLING_ERROR_MESSAGE_PARTS)):
+        return "throttling"
+
+    return "other"
+
+
+@dataclasses.dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 6
+    # instructor already re-asks the LLM on validation errors, so they are rarely fixed by retrying again
+    max_validation_attempts: int = 2
+    initial_backoff_seconds: float = 2.0
+    max_backoff_seconds: float = 120.0
+    backoff_multiplier: float = 2.0
+
+    def backoff_seconds(self, attempt: int) -> float:
+        backoff = min(
+            self.max_backoff_seconds,
+            self.initial_backoff_seconds * self.backoff_multiplier ** (attempt - 1)
+        )
+        # jitter, so that concurrent extractions don't retry in lockstep
+        return backoff * random.uniform(0.5, 1.0)
+
+
+@dataclasses.dataclass(frozen=True)
+class HedgePolicy:
+    # a hedged request is sent once the first one is slower than this percentile of observed latencies
+    latency_percentile: float = 0.95
+    min_delay_seconds: float = 5.0
+    # no hedging until this many successful requests were observed
+    min_samples: int = 20
+    latency_window: int = 500
+    # hedged requests per request, caps the extra quota use
+    max_hedge_ratio: float = 0.05
+    max_hedge_burst: float = 10.0
+
+
+class HedgeBudget:
+    """
+    token bucket of hedged requests: every request adds max_hedge_ratio tokens, every hedged request spends one
+    """
+
+    def __init__(self, hedge_policy: HedgePolicy):
+        self.hedge_policy = hedge_policy
+        self.latencies = collections.deque(maxlen=hedge_policy.latency_window)
+        self.tokens = 0.0
+        self.hedged_count = 0
+
+    def add_request(self):
+        self.tokens = min(self.hedge_policy.max_hedge_burst, self.tokens + self.hedge_policy.max_hedge_ratio)
+
+    def can_spend(self) -> bool:
+        return self.tokens >= 1.0
+
+    def try_spend(self) -> bool:
+        if not self.can_spend():
+            return False
+        self.tokens -= 1.0
+        self.hedged_count += 1
+        return True
+
+    def record_latency(self, latency_seconds: float):
+        self.latencies.append(latency_seconds)
+
+    def hedge_delay_seconds(self) -> float | None:
+        """
+        :return: None if too few latencies were observed to hedge
+        """
+        if len(self.latencies) < self.hedge_policy.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        percentile = ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_policy.latency_percentile))]
+        return max(self.hedge_policy.min_delay_seconds, percentile)
+
+
+class ExtractionFailedError(Exception):
+    def __init__(self, error_class: str, error_kind: ExtractionErrorKind, attempts: int, message: str):
+        super().__init__(f"{error_class} ({error_kind}) after {attempts} attempts: {message}")
+        self.error_class = error_class
+        self.error_kind = error_kind
+        self.attempts = attempts
+
+
 @dataclasses.dataclass
 class FinancialNewsExtractResult:
     data: FinancialNewsExtractedData
     model_name: str
 
 
+@dataclasses.dataclass
+class FinancialNewsPartialExtractResult:
+    data: BaseModel
+    model_name: str
+    field_groups: list[FieldGroupName]
+
+
+def build_extraction_messages(html_content: str) -> list[dict]:
+    """
+    chat messages of an extraction request, the article text is extracted from the html when possible
+    """
+    import trafilatura
+
+    # trafilatura.utils.check_html_lang(html_content)
+    formated_content = trafilatura.extract(
+        html_content,
+        favor_recall=True,
+        include_links=True
+    )
+    if formated_content is None:
+        text = html_content
+    else:
+        text = formated_content
+
+    return [
+        {
+            "role": "user",
+            "content": f"""
+                            you are a financial news extractor expert, extract from the following article:
+                            {text}""",
+        },
+    ]
+
+
+def estimate_token_count(messages: list[dict]) -> int:
+    # about 4 characters per token, close enough to route by article size without a tokenizer
+    return sum(len(message["content"]) for message in messages) // 4
+
+
 class IFinancialNewsDataExtractor(abc.ABC):
     async def extract_async(self, html_content: str) -> FinancialNewsExtractResult:
         pass
 
+    async def extract_field_groups_async(
+            self, html_content: str, field_groups: list[FieldGroupName]) -> FinancialNewsPartialExtractResult:
+        raise NotImplementedError
+
 
 class GeminiFinancialNewsDataExtractor(IFinancialNewsDataExtractor):
-    def __init__(self, llm_provider: ILlmProvider):
+    def __init__(
+            self,
+            llm_provider: ILlmProvider,
+            retry_policy: RetryPolicy = RetryPolicy(),
+            response_log: "LlmResponseLog | None" = None,
+            hedge_policy: "HedgePolicy | None" = None
+    ):
         self.llm_provider = llm_provider
+        self.retry_policy = retry_policy
+        # optional record of every request and response, see ReplayFinancialNewsDataExtractor
+        self.response_log = response_log
+        # optional duplicate requests for slow responses, see _request_with_hedging
+        self.hedge_policy = hedge_policy
+        self.hedge_budget = HedgeBudget(hedge_policy) if hedge_policy is not None else None
 
     async def extract_async(self, html_content: str) -> FinancialNewsExtractResult:
-        # trafilatura.utils.check_html_lang(html_content)
-        formated_content = trafilatura.extract(
-            html_content,
-            favor_recall=True,
-            include_links=True
+        financial_news_extracted_data, model_name = await self._extract_with_response_model(
+            html_content, FinancialNewsExtractedData)
+
+        return FinancialNewsExtractResult(
+            financial_news_extracted_data,
+            model_name,
         )
-        if formated_content is None:
-            text = html_content
-        else:
-            text = formated_content
+
+    async def extract_field_groups_async(
+            self, html_content: str, field_groups: list[FieldGroupName]) -> FinancialNewsPartialExtractResult:
+        partial_extracted_data, model_name = await self._extract_with_response_model(
+            html_content, build_field_groups_model(field_groups), field_groups)
+
+        return FinancialNewsPartialExtractResult(
+            partial_extracted_data,
+            model_name,
+            list(field_groups),
+        )
+
+    @staticmethod
+    def _build_response_record(
+            prompt_hash: str,
+            messages: list[dict],
+            model_name: str,
+            response_model: type[BaseModel],
+            field_groups: list[FieldGroupName] | None,
+            request_time: datetime.datetime,
+            latency_seconds: float,
+            extracted_data: BaseModel | None,
+            completion,
+            error_class: str | None = None
+    ) -> LlmResponseRecord:
+        input_tokens, output_tokens = completion_token_counts(completion)
+        return LlmResponseRecord(
+            prompt_hash=prompt_hash,
+            model_name=model_name,
+            response_model=response_model.__name__,
+            field_groups=list(field_groups) if field_groups is not None else None,
+            request_time=request_time,
+            latency_seconds=latency_seconds,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            messages=messages,
+            response_json=extracted_data.model_dump_json() if extracted_data is not None else None,
+            raw_completion=completion_to_dict(completion),
+            error_class=error_class,
+        )
+
+    async def _extract_with_response_model(
+            self,
+            html_content: str,
+            response_model: type[BaseModel],
+            field_groups: list[FieldGroupName] | None = None
+    ) -> tuple[BaseModel, str]:
+        messages = build_extraction_messages(html_content)
+        prompt_hash = hash_prompt(messages) if self.response_log is not None else None
+        input_token_count = estimate_token_count(messages)
+
+        attempt = 0
+        validation_attempts = 0
 
         while True:
-            llm_wrapper = self.llm_provider.provide_llm()
-            start_time = time.time()
+            attempt += 1
             try:
-                financial_news_extracted_data = await llm_wrapper.model.chat.completions.create(
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": f"""
-                            you are a financial news extractor expert, extract from the following article:
-                            {text}""",
-                        },
-                    ],
-                    max_retries=3,
-                    response_model=FinancialNewsExtractedData,
-                )
-
-                logger.info(
-                    f"Extracted using {llm_wrapper.model_name} LLM in {round(time.time() - start_time)} seconds")
-
-                return FinancialNewsExtractResult(
-                    financial_news_extracted_data,
-                    llm_wrapper.model_name,
-                )
+                return await self._request_with_hedging(
+                    messages, prompt_hash, input_token_count, response_model, field_groups)
             except Exception as e:
-                logger.info(f"Error extracting from LLM: {e}")
-            logger.info(f"Sleeping for 5 seconds before retrying")
-            await self.llm_provider.sleep_until_next_ready_async()
+                error_kind = classify_extraction_error(e)
+                logger.info(f"Error ({error_kind}) extracting from LLM on attempt {attempt}: {e}")
+
+                if error_kind == "validation":
+                    validation_attempts += 1
+
+                if (attempt >= self.retry_policy.max_attempts
+                        or validation_attempts >= self.retry_policy.max_validation_attempts):
+                    raise ExtractionFailedError(type(e).__name__, error_kind, attempt, str(e)) from e
+
+                backoff_seconds = self.retry_policy.backoff_seconds(attempt)
+                if error_kind == "throttling":
+                    # the sleep until a throttled llm is ready again counts towards the backoff, not on top of it
+                    slept_at = time.monotonic()
+                    await self.llm_provider.sleep_until_next_ready_async()
+                    backoff_seconds -= time.monotonic() - slept_at
+
+            if backoff_seconds > 0:
+                logger.info(f"Sleeping for {backoff_seconds:.1f} seconds before retrying")
+                await asyncio.sleep(backoff_seconds)
+
+    async def _request_with_hedging(
+            self,
+            messages: list[dict],
+            prompt_hash: str | None,
+            input_token_count: int,
+            response_model: type[BaseModel],
+            field_groups: list[FieldGroupName] | None
+    ) -> tuple[BaseModel, str]:
+        """
+        sends the request, and a duplicate one to another llm of the provider (another api key or model)
+        if it is slower than the hedge policy's latency percentile. the first valid response wins,
+        the other request is cancelled. no hedged request is sent if the provider has no other llm
+        """
+        def request(llm_wrapper: LlmWrapper):
+            return asyncio.create_task(
+                self._request(llm_wrapper, messages, prompt_hash, input_token_count, response_model, field_groups))
+
+        if self.hedge_policy is not None:
+            self.hedge_budget.add_request()
+        hedge_delay_seconds = self.hedge_budget.hedge_delay_seconds() if self.hedge_policy is not None else None
+
+        primary_llm_wrapper = self.llm_provider.provide_llm_for(input_token_count)
+        primary_task = request(primary_llm_wrapper)
+        tasks = {primary_task}
+        try:
+            if hedge_delay_seconds is None:
+                return await primary_task
+
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay_seconds)
+            if done or not self.hedge_budget.can_spend():
+                return await primary_task
+
+            # the same api key and model would only duplicate the spend and share the slow request's throttling
+            hedge_llm_wrapper = self.llm_provider.provide_hedge_llm_for(input_token_count, primary_llm_wrapper)
+            if hedge_llm_wrapper is None:
+                return await primary_task
+
+            self.hedge_budget.try_spend()
+            logger.info(f"No response after {hedge_delay_seconds:.1f} seconds, "
+                        f"sending hedged request {self.hedge_budget.hedged_count} to {hedge_llm_wrapper.model_name}")
+            tasks.add(request(hedge_llm_wrapper))
+            pending, first_error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    first_error = first_error or task.exception()
+            raise first_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _request(
+            self,
+            llm_wrapper: LlmWrapper,
+            messages: list[dict],
+            prompt_hash: str | None,
+            input_token_count: int,
+            response_model: type[BaseModel],
+            field_groups: list[FieldGroupName] | None
+    ) -> tuple[BaseModel, str]:
+        request_time = datetime.datetime.now(datetime.timezone.utc)
+        start_time = time.time()
+        try:
+            extracted_data, completion = await llm_wrapper.model.chat.completions.create_with_completion(
+                messages=messages,
+                max_retries=3,
+                response_model=response_model,
+            )
+        except asyncio.CancelledError:
+            # the hedged request lost, its latency says nothing about the model
+            self.llm_provider.record_outcome(llm_wrapper, time.time() - start_time, "cancelled", input_token_count)
+            raise
+        except Exception as e:
+            self.llm_provider.record_outcome(
+                llm_wrapper, time.time() - start_time, classify_extraction_error(e), input_token_count)
+
+            if self.response_log is not None:
+                # instructor keeps the completion of its last failed attempt, e.g. the output that failed validation
+                self.response_log.append(self._build_response_record(
+                    prompt_hash, messages, llm_wrapper.model_name, response_model, field_groups,
+                    request_time, time.time() - start_time, None, getattr(e, "last_completion", None),
+                    type(e).__name__,
+                ))
+            raise
+
+        latency_seconds = time.time() - start_time
+        logger.info(f"Extracted using {llm_wrapper.model_name} LLM in {round(latency_seconds)} seconds")
+
+        # estimated input tokens, the same unit the provider routes by
+        self.llm_provider.record_outcome(
+            llm_wrapper, latency_seconds, None, input_token_count, completion_token_counts(completion)[1])
+        if self.hedge_policy is not None:
+            self.hedge_budget.record_latency(latency_seconds)
+
+        if self.response_log is not None:
+            self.response_log.append(self._build_response_record(
+                prompt_hash, messages, llm_wrapper.model_name, response_model, field_groups,
+                request_time, latency_seconds, extracted_data, completion,
+            ))
+
+        return extracted_data, llm_wrapper.model_name
+
+
+class ReplayMissError(Exception):
+    """
+    no response was recorded for the prompt, the doc wasn't extracted while recording
+    """
+
+
+class ReplayFinancialNewsDataExtractor(IFinancialNewsDataExtractor):
+    """
+    re-parses the raw LLM output recorded by GeminiFinancialNewsDataExtractor's response log with the current
+    response models, without any LLM requests.
+    requests are matched by the hash of their prompt, field group requests fall back to a full extraction's
+    response. the latest successful response of a prompt wins
+    """
+
+    def __init__(self, responses: dict[tuple[str, tuple[str, ...] | None], tuple[str, str]]):
+        """
+        :param responses: (prompt hash, field groups or None) -> (model name, raw response json)
+        """
+        self.responses = responses
+
+    @classmethod
+    def from_log(cls, root_dir: str) -> "ReplayFinancialNewsDataExtractor":
+        responses = {}
+        for record in iter_log_records(root_dir):
+            if record.error_class is not None:
+                continue
+            # the validated output only if the raw completion's format isn't known
+            response_json = raw_completion_arguments(record.raw_completion) or record.response_json
+            if response_json is None:
+                continue
+            field_groups = tuple(record.field_groups) if record.field_groups is not None else None
+            responses[(record.prompt_hash, field_groups)] = (record.model_name, response_json)
+
+        logger.info(f"Loaded {len(responses)} recorded responses from {root_dir}")
+        return cls(responses)
+
+    async def extract_async(self, html_content: str) -> FinancialNewsExtractResult:
+        financial_news_extracted_data, model_name = self._replay(html_content, FinancialNewsExtractedData, None)
+
+        return FinancialNewsExtractResult(
+            financial_news_extracted_data,
+            model_name,
+        )
+
+    async def extract_field_groups_async(
+            self, html_content: str, field_groups: list[FieldGroupName]) -> FinancialNewsPartialExtractResult:
+        partial_extracted_data, model_name = self._replay(
+            html_content, build_field_groups_model(field_groups), tuple(field_groups))
+
+        return FinancialNewsPartialExtractResult(
+            partial_extracted_data,
+            model_name,
+            list(field_groups),
+        )
+
+    def _replay(
+            self,
+            html_content: str,
+            response_model: type[BaseModel],
+            field_groups: tuple[str, ...] | None
+    ) -> tuple[BaseModel, str]:
+        prompt_hash = hash_prompt(build_extraction_messages(html_content))
+
+        response = self.responses.get((prompt_hash, field_groups))
+        if response is None and field_groups is not None:
+            response = self.responses.get((prompt_hash, None))
+        if response is None:
+            raise ReplayMissError(f"No recorded response for prompt {prompt_hash}")
+
+        model_name, response_json = response
+        try:
+            return response_model.model_validate_json(response_json), model_name
+        except ValidationError as e:
+            raise ExtractionFailedError(type(e).__name__, "validation", 1, str(e)) from e
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, create_model
 from typing import Literal
 
 FinancialEvent = Literal[
@@ -151,3 +151,96 @@ class FinancialNewsExtractedData(BaseModel):
     relationships: list[Relationship] = Field(
         ...,
         description="*clearly identifiable* relationships between previously identified entities")
+
+
+FieldGroupName = Literal[
+    "summary",
+    "financial_events",
+    "keywords",
+    "sentiments",
+    "external_links",
+    "entities",
+]
+
+FIELD_GROUP_FIELD_NAMES: dict[FieldGroupName, list[str]] = {
+    "summary": ["summary", "main_company", "article_language"],
+    "financial_events": ["financial_event_with_symbols"],
+    "keywords": ["keywords"],
+    "sentiments": ["sentiments"],
+    "external_links": ["external_links"],
+    # relationships reference the identified entities, so both are extracted together
+    "entities": ["entities", "relationships"],
+}
+
+
+def _select_fields_model(model_name: str, field_names: list[str]) -> type[BaseModel]:
+    """
+    model of the given FinancialNewsExtractedData fields, in the order they are declared there
+    """
+    return create_model(model_name, **{
+        name: (field.annotation, field)
+        for name, field in FinancialNewsExtractedData.model_fields.items()
+        if name in field_names
+    })
+
+
+FIELD_GROUPS: dict[FieldGroupName, type[BaseModel]] = {
+    field_group: _select_fields_model(model_name, FIELD_GROUP_FIELD_NAMES[field_group])
+    for field_group, model_name in {
+        "summary": "SummaryFieldGroup",
+        "financial_events": "FinancialEventsFieldGroup",
+        "keywords": "KeywordsFieldGroup",
+        "sentiments": "SentimentsFieldGroup",
+        "external_links": "ExternalLinksFieldGroup",
+        "entities": "EntitiesFieldGroup",
+    }.items()
+}
+
+assert sorted(sum(FIELD_GROUP_FIELD_NAMES.values(), [])) == sorted(FinancialNewsExtractedData.model_fields), \
+    "every extracted field must belong to exactly one field group"
+
+# bump a group's version whenever its fields or field descriptions change,
+# stored docs with a lower version get only that group re-extracted
+FIELD_GROUP_VERSIONS: dict[FieldGroupName, int] = {
+    "summary": 1,
+    "financial_events": 1,
+    "keywords": 1,
+    "sentiments": 1,
+    "external_links": 1,
+    "entities": 1,
+}
+
+# version assumed for docs (or groups) written before field group versions were stored
+LEGACY_FIELD_GROUP_VERSION = 1
+
+
+def field_group_field_names(field_group: FieldGroupName) -> list[str]:
+    return FIELD_GROUP_FIELD_NAMES[field_group]
+
+
+def build_field_groups_model(field_groups: list[FieldGroupName]) -> type[BaseModel]:
+    if len(field_groups) == 1:
+        return FIELD_GROUPS[field_groups[0]]
+
+    # the fields keep the order of the full schema, whatever the order of the requested groups
+    return _select_fields_model(
+        "FinancialNewsPartialExtractedData",
+        [field for field_group in field_groups for field in FIELD_GROUP_FIELD_NAMES[field_group]],
+    )
+
+
+def get_outdated_field_groups(
+        stored_field_group_versions: dict[str, int] | None,
+        present_fields: set[str]
+) -> list[FieldGroupName]:
+    outdated = []
+    for field_group, current_version in FIELD_GROUP_VERSIONS.items():
+        if not all(field in present_fields for field in field_group_field_names(field_group)):
+            outdated.append(field_group)
+            continue
+
+        stored_version = (stored_field_group_versions or {}).get(field_group, LEGACY_FIELD_GROUP_VERSION)
+        if stored_version < current_version:
+            outdated.append(field_group)
+
+    return outdated
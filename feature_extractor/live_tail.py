@@ -0,0 +1,252 @@
+import asyncio
+import collections
+import dataclasses
+import datetime
+import itertools
+import logging
+
+from feature_extractor.extractor_pipelines import ExtractorPipeline
+
+logger = logging.getLogger(__name__)
+
+# lower is extracted first, newly downloaded docs go ahead of backfill work
+LIVE_PRIORITY = 0
+BACKFILL_PRIORITY = 1
+
+
+@dataclasses.dataclass(frozen=True)
+class PollPolicy:
+    min_interval_seconds: float = 1.0
+    max_interval_seconds: float = 30.0
+    backoff_multiplier: float = 1.5
+
+    def next_interval_seconds(self, interval_seconds: float, row_count: int, limit: int) -> float:
+        if row_count >= limit:
+            # a full page, more docs are waiting
+            return 0.0
+        if row_count:
+            return self.min_interval_seconds
+        # nothing new, poll less often until docs arrive again
+        return min(
+            self.max_interval_seconds,
+            max(interval_seconds, self.min_interval_seconds) * self.backoff_multiplier
+        )
+
+
+def as_utc(dt: datetime.datetime) -> datetime.datetime:
+    # clickhouse and mongo return naive UTC datetimes
+    return dt.replace(tzinfo=datetime.timezone.utc) if dt.tzinfo is None else dt
+
+
+class ExtractionLatencyTracker:
+    """
+    publish-to-extracted and download-to-extracted latencies of the last window extracted docs
+    """
+
+    def __init__(self, window: int = 1_000):
+        self.publish_latencies = collections.deque(maxlen=window)
+        self.download_latencies = collections.deque(maxlen=window)
+        self.count = 0
+
+    def record(
+            self,
+            publish_time: datetime.datetime | None,
+            download_time: datetime.datetime,
+            extracted_at: datetime.datetime
+    ):
+        if publish_time is not None:
+            self.publish_latencies.append((extracted_at - as_utc(publish_time)).total_seconds())
+        self.download_latencies.append((extracted_at - as_utc(download_time)).total_seconds())
+        self.count += 1
+
+    @staticmethod
+    def _percentiles(latencies) -> str:
+        if not latencies:
+            return "n/a"
+        ordered = sorted(latencies)
+        p50 = ordered[len(ordered) // 2]
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return f"p50 {p50:.1f}s p95 {p95:.1f}s max {ordered[-1]:.1f}s"
+
+    def summary(self) -> str:
+        return (f"publish-to-extracted {self._percentiles(self.publish_latencies)}, "
+                f"download-to-extracted {self._percentiles(self.download_latencies)}")
+
+
+class LiveTailExtractorWorker:
+    """
+    tails news.articles past a (download time, url) watermark and extracts new docs within seconds of download.
+    polling is adaptive, see PollPolicy. new docs and the optional backfill range share one priority queue,
+    where new docs always go first, and concurrency docs are extracted at a time.
+    read and repo errors back off and retry the same page, docs whose extraction raised are queued again
+    """
+
+    def __init__(
+            self,
+            extractor_pipeline: ExtractorPipeline,
+            poll_policy: PollPolicy = PollPolicy(),
+            concurrency: int = 5,
+            page_size: int = 100,
+            # backfill pages are only read while fewer docs are queued, so new docs never wait behind a backlog
+            backfill_queue_size: int = 20,
+            report_every: int = 100,
+            # a doc whose extraction or write raised is queued again up to this many times, see _extract_queued
+            max_attempts: int = 3,
+            retry_delay_seconds: float = 30.0
+    ):
+        self.extractor_pipeline = extractor_pipeline
+        self.raw_html_reader = extractor_pipeline.raw_html_reader
+        self.feature_result_repo = extractor_pipeline.feature_result_repo
+        self.poll_policy = poll_policy
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.backfill_queue_size = backfill_queue_size
+        self.report_every = report_every
+        self.max_attempts = max_attempts
+        self.retry_delay_seconds = retry_delay_seconds
+
+        self.latency_tracker = ExtractionLatencyTracker()
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        # queued or in-flight urls, so live and backfill pages don't queue a doc twice
+        self._pending_urls: set[str] = set()
+        self._sequence = itertools.count()
+        self._attempts: collections.Counter[str] = collections.Counter()
+
+    async def initial_watermark(self, lookback: datetime.timedelta) -> tuple[datetime.datetime, str]:
+        """
+        lookback before the download time of the latest stored doc, or before now if none was stored within lookback.
+        docs downloaded before the latest stored one may still have been in flight when the last run stopped,
+        re-reading the window finds them and the stored ones are skipped by get_non_saved_urls
+        """
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        last_saved = await self.feature_result_repo.get_dt_of_last_saved_url(
+            (now - lookback).date(), (now + datetime.timedelta(days=1)).date())
+        return (last_saved or now) - lookback, ""
+
+    async def run(
+            self,
+            lookback: datetime.timedelta = datetime.timedelta(hours=1),
+            backfill_start_date: datetime.date | None = None,
+            backfill_end_date_excl: datetime.date | None = None
+    ):
+        tasks = [asyncio.create_task(self._tail(*await self.initial_watermark(lookback)))]
+        if backfill_start_date is not None and backfill_end_date_excl is not None:
+            tasks.append(asyncio.create_task(self._backfill(backfill_start_date, backfill_end_date_excl)))
+        tasks.extend(asyncio.create_task(self._extract_queued(i)) for i in range(self.concurrency))
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _enqueue(self, docs: list, priority: int) -> int:
+        docs = [doc for doc in docs if doc["url"] not in self._pending_urls]
+        if not docs:
+            return 0
+        new_urls = set(await self.feature_result_repo.get_non_saved_urls(
+            [doc["url"] for doc in docs], exclude_dead_letters=True))
+        new_docs = [doc for doc in docs if doc["url"] in new_urls]
+
+        if self.extractor_pipeline.relevance_prefilter is not None:
+            new_docs = await self.extractor_pipeline.apply_prefilter(new_docs)
+
+        queued_count = 0
+        for doc in new_docs:
+            # the other producer may have queued the doc while this one awaited the repo
+            if doc["url"] in self._pending_urls:
+                continue
+            self._pending_urls.add(doc["url"])
+            self.queue.put_nowait((priority, next(self._sequence), doc))
+            queued_count += 1
+        return queued_count
+
+    async def _tail(self, after_download_time: datetime.datetime, after_url: str):
+        logger.info(f"Tailing docs downloaded after {after_download_time}")
+        interval_seconds = self.poll_policy.min_interval_seconds
+
+        while True:
+            try:
+                docs = await self.raw_html_reader.read_after(after_download_time, after_url, self.page_size)
+                if docs:
+                    queued_count = await self._enqueue(docs, LIVE_PRIORITY)
+                    # only moved once the page is queued, a failed read or enqueue polls the same page again
+                    after_download_time = docs[-1][self.raw_html_reader.download_time_column_name]
+                    after_url = docs[-1]["url"]
+                    logger.info(f"Queued {queued_count} of {len(docs)} new docs, watermark {after_download_time}")
+            except Exception as e:
+                logger.info(f"Error polling for new docs: {e}")
+                docs = []
+
+            interval_seconds = self.poll_policy.next_interval_seconds(interval_seconds, len(docs), self.page_size)
+            await asyncio.sleep(interval_seconds)
+
+    async def _backfill(self, start_date: datetime.date, end_date_excl: datetime.date):
+        skip = None
+        interval_seconds = self.poll_policy.min_interval_seconds
+
+        while True:
+            while self.queue.qsize() >= self.backfill_queue_size:
+                await asyncio.sleep(self.poll_policy.min_interval_seconds)
+
+            try:
+                if skip is None:
+                    skip = await self._initial_backfill_skip(start_date, end_date_excl)
+                docs = await self.raw_html_reader.read(start_date, end_date_excl, skip, self.page_size)
+                if not docs:
+                    logger.info(f"Queued all backfill docs of [{start_date}, {end_date_excl})")
+                    return
+                await self._enqueue(docs, BACKFILL_PRIORITY)
+            except Exception as e:
+                # the same page is read again after the backoff
+                logger.info(f"Error reading backfill docs at skip={skip}: {e}")
+                interval_seconds = self.poll_policy.next_interval_seconds(interval_seconds, 0, self.page_size)
+                await asyncio.sleep(interval_seconds)
+                continue
+
+            interval_seconds = self.poll_policy.min_interval_seconds
+            skip += self.page_size
+
+    async def _initial_backfill_skip(self, start_date: datetime.date, end_date_excl: datetime.date) -> int:
+        dt_of_last_saved_url = await self.feature_result_repo.get_dt_of_last_saved_url(start_date, end_date_excl)
+        if not dt_of_last_saved_url:
+            return 0
+        return await self.raw_html_reader.get_initial_skip_page(start_date, end_date_excl, dt_of_last_saved_url)
+
+    async def _extract_queued(self, worker_index: int):
+        while True:
+            priority, _, doc = await self.queue.get()
+            url = doc["url"]
+            try:
+                written_urls = await self.extractor_pipeline.extract_and_write_chunk([doc], worker_index)
+                if written_urls and priority == LIVE_PRIORITY:
+                    self.record_latency(doc)
+                self._done(url)
+            except Exception as e:
+                # e.g. a failed mongo write. extraction failures are dead-lettered by the pipeline instead.
+                # the tail watermark already moved past the doc, so it is queued again after a delay
+                self._attempts[url] += 1
+                if self._attempts[url] < self.max_attempts:
+                    logger.info(f"Error extracting {url}, attempt {self._attempts[url]}, retrying: {e}")
+                    asyncio.get_running_loop().call_later(
+                        self.retry_delay_seconds, self.queue.put_nowait, (priority, next(self._sequence), doc))
+                else:
+                    logger.info(f"Error extracting {url}, giving up after {self._attempts[url]} attempts, "
+                                f"a backfill range covering its download date extracts it: {e}")
+                    self._done(url)
+            finally:
+                self.queue.task_done()
+
+    def _done(self, url: str):
+        self._pending_urls.discard(url)
+        self._attempts.pop(url, None)
+
+    def record_latency(self, doc):
+        self.latency_tracker.record(
+            doc.get("publishTime"),
+            doc[self.raw_html_reader.download_time_column_name],
+            datetime.datetime.now(datetime.timezone.utc),
+        )
+        if self.latency_tracker.count % self.report_every == 0:
+            logger.info(f"Latency of the last {len(self.latency_tracker.download_latencies)} new docs: "
+                        f"{self.latency_tracker.summary()}, {self.queue.qsize()} docs queued")
@@ -1,12 +1,17 @@
 import abc
 import dataclasses
+from typing import Literal, TYPE_CHECKING
 
-from instructor import AsyncInstructor
+if TYPE_CHECKING:
+    from instructor import AsyncInstructor
+
+# feature_extract.ExtractionErrorKind, or cancelled for hedged requests which lost. None for successful requests
+OutcomeErrorKind = Literal["validation", "throttling", "other", "cancelled"] | None
 
 
 @dataclasses.dataclass(frozen=True)
 class LlmWrapper:
-    model: AsyncInstructor
+    model: "AsyncInstructor"
     model_name: str
     api_key: str
 
@@ -20,3 +25,32 @@ class ILlmProvider(abc.ABC):
     @abc.abstractmethod
     async def sleep_until_next_ready_async(self):
         raise NotImplementedError
+
+    def provide_llm_for(self, input_token_count: int) -> LlmWrapper:
+        """
+        providers which route by article size override this
+        """
+        return self.provide_llm()
+
+    def provide_hedge_llm_for(self, input_token_count: int, primary: LlmWrapper) -> LlmWrapper | None:
+        """
+        llm for a hedged duplicate of primary's request, with another api key or model
+        :return: None if the provider has no other llm
+        """
+        llm_wrapper = self.provide_llm_for(input_token_count)
+        if (llm_wrapper.model_name, llm_wrapper.api_key) == (primary.model_name, primary.api_key):
+            return None
+        return llm_wrapper
+
+    def record_outcome(
+            self,
+            llm_wrapper: LlmWrapper,
+            latency_seconds: float,
+            error_kind: OutcomeErrorKind,
+            input_token_count: int,
+            output_token_count: int | None = None
+    ) -> None:
+        """
+        called after every request, providers which route by observed performance override this
+        """
+        pass
@@ -0,0 +1,180 @@
+import atexit
+import dataclasses
+import datetime
+import hashlib
+import io
+import json
+import logging
+import os
+from typing import Iterator
+
+import zstandard as zstd
+
+logger = logging.getLogger(__name__)
+
+LOG_FILE_SUFFIX = ".jsonl.zst"
+
+
+def hash_prompt(messages: list[dict]) -> str:
+    return hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def completion_to_dict(completion) -> dict | None:
+    """
+    json-able raw completion of the openai compatible (pydantic) and google (to_dict) SDKs
+    """
+    if completion is None:
+        return None
+    if hasattr(completion, "model_dump"):
+        return completion.model_dump(mode="json")
+    if hasattr(completion, "to_dict"):
+        return completion.to_dict()
+    return {"repr": repr(completion)}
+
+
+def completion_token_counts(completion) -> tuple[int | None, int | None]:
+    """
+    :return: input and output token counts, None if the SDK doesn't report usage
+    """
+    usage = getattr(completion, "usage", None)
+    if usage is not None:
+        return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+
+    usage_metadata = getattr(completion, "usage_metadata", None)
+    if usage_metadata is not None:
+        return (
+            getattr(usage_metadata, "prompt_token_count", None),
+            getattr(usage_metadata, "candidates_token_count", None),
+        )
+
+    return None, None
+
+
+def _strip_code_fence(text: str) -> str:
+    # instructor's json modes accept the json wrapped in a markdown code block
+    start, end = text.find("{"), text.rfind("}")
+    return text[start:end + 1] if 0 <= start < end else text
+
+
+def raw_completion_arguments(raw_completion: dict | None) -> str | None:
+    """
+    the json the LLM returned for the response model, as instructor parsed it: the tool call arguments
+    or the message text of an openai compatible (choices) or google (candidates) completion
+    :return: None if the completion has no output
+    """
+    if not raw_completion:
+        return None
+
+    if raw_completion.get("choices"):
+        message = raw_completion["choices"][0].get("message") or {}
+        for tool_call in message.get("tool_calls") or []:
+            return tool_call["function"]["arguments"]
+        return _strip_code_fence(message["content"]) if message.get("content") else None
+
+    if raw_completion.get("candidates"):
+        parts = (raw_completion["candidates"][0].get("content") or {}).get("parts") or []
+        for part in parts:
+            if part.get("function_call"):
+                return json.dumps(part["function_call"].get("args") or {})
+        texts = [part["text"] for part in parts if part.get("text")]
+        return _strip_code_fence("".join(texts)) if texts else None
+
+    return None
+
+
+@dataclasses.dataclass
+class LlmResponseRecord:
+    prompt_hash: str
+    model_name: str
+    response_model: str
+    # None for full extractions
+    field_groups: list[str] | None
+    request_time: datetime.datetime
+    latency_seconds: float
+    input_tokens: int | None
+    output_tokens: int | None
+    messages: list[dict]
+    # the response model's output as validated by instructor, None for failed requests
+    response_json: str | None
+    # what the replay re-parses, see raw_completion_arguments. failed requests keep the last invalid output
+    raw_completion: dict | None
+    error_class: str | None = None
+
+    def to_json(self) -> str:
+        record = dataclasses.asdict(self)
+        record["request_time"] = self.request_time.isoformat()
+        return json.dumps(record, ensure_ascii=False, default=str)
+
+    @classmethod
+    def from_json(cls, line: str) -> "LlmResponseRecord":
+        record = json.loads(line)
+        record["request_time"] = datetime.datetime.fromisoformat(record["request_time"])
+        return cls(**record)
+
+
+class LlmResponseLog:
+    """
+    append only log of LLM requests and responses, zstd compressed jsonl files in root_dir
+    rotated every max_records_per_file records.
+    each record is flushed as a zstd block, so records written before a crash stay readable.
+    appends are synchronous, the extractor's concurrent requests all run on one event loop
+    """
+
+    def __init__(self, root_dir: str, max_records_per_file: int = 10_000, level: int = 3):
+        self.root_dir = root_dir
+        self.max_records_per_file = max_records_per_file
+        self.compressor = zstd.ZstdCompressor(level=level)
+
+        self._file = None
+        self._writer = None
+        self._file_record_count = 0
+        self._file_sequence = 0
+        self._started_at = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S")
+
+        os.makedirs(self.root_dir, exist_ok=True)
+        # ends the open file's frame, the records themselves are readable without it
+        atexit.register(self.close)
+
+    def _open_next_file(self):
+        self._file_sequence += 1
+        path = os.path.join(
+            self.root_dir, f"responses-{self._started_at}-{os.getpid()}-{self._file_sequence:05d}{LOG_FILE_SUFFIX}")
+        self._file = open(path, "wb")
+        self._writer = self.compressor.stream_writer(self._file, closefd=False)
+        self._file_record_count = 0
+        logger.info(f"Writing LLM responses to {path}")
+
+    def append(self, record: LlmResponseRecord):
+        if self._writer is None or self._file_record_count >= self.max_records_per_file:
+            self.close()
+            self._open_next_file()
+
+        self._writer.write((record.to_json() + "\n").encode("utf-8"))
+        self._writer.flush(zstd.FLUSH_BLOCK)
+        self._file_record_count += 1
+
+    def close(self):
+        if self._writer is None:
+            return
+        self._writer.flush(zstd.FLUSH_FRAME)
+        self._writer.close()
+        self._file.close()
+        self._writer, self._file = None, None
+
+
+def iter_log_records(root_dir: str) -> Iterator[LlmResponseRecord]:
+    """
+    records of all log files in root_dir, oldest file first
+    """
+    log_files = sorted(file_name for file_name in os.listdir(root_dir) if file_name.endswith(LOG_FILE_SUFFIX))
+    for file_name in log_files:
+        path = os.path.join(root_dir, file_name)
+        with open(path, "rb") as f:
+            reader = zstd.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+            lines = io.TextIOWrapper(reader, encoding="utf-8")
+            try:
+                for line in lines:
+                    yield LlmResponseRecord.from_json(line)
+            except (zstd.ZstdError, json.JSONDecodeError) as e:
+                # the last block of a file whose writer crashed may be incomplete
+                logger.warning(f"Stopped reading truncated log file {path}: {e}")
@@ -0,0 +1,227 @@
+import asyncio
+import collections
+import dataclasses
+import logging
+import random
+import time
+
+from feature_extractor.llm_providers import ILlmProvider, LlmWrapper, OutcomeErrorKind
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class ModelRoute:
+    """
+    quality constraints of a model, e.g. a small model only for short articles
+    """
+    model_name: str
+    min_input_tokens: int | None = None
+    max_input_tokens: int | None = None
+
+    def accepts(self, input_token_count: int) -> bool:
+        return ((self.min_input_tokens is None or input_token_count >= self.min_input_tokens)
+                and (self.max_input_tokens is None or input_token_count <= self.max_input_tokens))
+
+
+@dataclasses.dataclass(frozen=True)
+class RequestOutcome:
+    latency_seconds: float
+    error_kind: OutcomeErrorKind
+    input_token_count: int
+    output_token_count: int | None
+
+
+class ModelStats:
+    """
+    latency, error rate and token throughput over a model's last window requests
+    """
+
+    def __init__(self, window: int = 200):
+        self.outcomes: collections.deque[RequestOutcome] = collections.deque(maxlen=window)
+        self.in_flight = 0
+
+    def record(self, outcome: RequestOutcome):
+        self.outcomes.append(outcome)
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return sum(outcome.error_kind is not None for outcome in self.outcomes) / len(self.outcomes)
+
+    @property
+    def input_tokens_per_second(self) -> float | None:
+        successes = [outcome for outcome in self.outcomes if outcome.error_kind is None]
+        total_seconds = sum(outcome.latency_seconds for outcome in successes)
+        if not successes or total_seconds <= 0:
+            return None
+        return sum(outcome.input_token_count for outcome in successes) / total_seconds
+
+    def latency_quantile(self, q: float) -> float | None:
+        latencies = sorted(outcome.latency_seconds for outcome in self.outcomes if outcome.error_kind is None)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))]
+
+    def expected_seconds(self, input_token_count: int) -> float:
+        """
+        expected time until a valid response, failed requests are retried.
+        models without successful requests yet come first, so that every model gets tried
+        """
+        throughput = self.input_tokens_per_second
+        if throughput is None:
+            # below any observed model, concurrent first requests are spread over the untried models
+            return self.in_flight * 1e-6
+        # requests already in flight on the model share its throughput
+        return input_token_count / throughput * (1 + self.in_flight) / (1 - min(self.error_rate, 0.9))
+
+    def summary(self) -> str:
+        throughput = self.input_tokens_per_second
+        p50 = self.latency_quantile(0.5)
+        return (f"{len(self.outcomes)} requests, error rate {self.error_rate:.0%}, "
+                f"p50 {'n/a' if p50 is None else f'{p50:.1f}s'}, "
+                f"{'n/a' if throughput is None else f'{throughput:.0f}'} input tokens/s")
+
+
+class LatencyAwareLlmRouter(ILlmProvider):
+    """
+    routes each request to the model with the lowest expected time for its input token count,
+    among the models whose ModelRoute accepts it and whose error rate is at most max_error_rate.
+    explore_rate of the requests go to a random accepting model to keep the statistics of all models current.
+    api keys of a model are used round robin, a throttled (model, api key) cools down for throttle_cooldown_seconds
+    """
+
+    def __init__(
+            self,
+            llm_wrappers: list[LlmWrapper],
+            routes: list[ModelRoute] | None = None,
+            max_error_rate: float = 0.2,
+            explore_rate: float = 0.05,
+            throttle_cooldown_seconds: float = 30.0,
+            stats_window: int = 200,
+            report_every: int = 100
+    ):
+        self.wrappers_by_model: dict[str, list[LlmWrapper]] = {}
+        for llm_wrapper in llm_wrappers:
+            self.wrappers_by_model.setdefault(llm_wrapper.model_name, []).append(llm_wrapper)
+        if not self.wrappers_by_model:
+            raise ValueError("No LLMs to route to")
+
+        self.routes = {route.model_name: route for route in routes or []}
+        unknown_models = set(self.routes) - set(self.wrappers_by_model)
+        if unknown_models:
+            raise ValueError(f"Routes for unconfigured models {sorted(unknown_models)}")
+
+        self.max_error_rate = max_error_rate
+        self.explore_rate = explore_rate
+        self.throttle_cooldown_seconds = throttle_cooldown_seconds
+        self.report_every = report_every
+
+        self.stats = {model_name: ModelStats(stats_window) for model_name in self.wrappers_by_model}
+        # (model name, api key) -> monotonic time until which it is not used
+        self.cooldown_until: dict[tuple[str, str], float] = {}
+        self._next_wrapper_index = collections.Counter()
+        self._outcome_count = 0
+
+    def _ready_wrappers(self, model_name: str, now: float) -> list[LlmWrapper]:
+        return [
+            llm_wrapper
+            for llm_wrapper in self.wrappers_by_model[model_name]
+            if self.cooldown_until.get((model_name, llm_wrapper.api_key), 0.0) <= now
+        ]
+
+    def accepting_models(self, input_token_count: int) -> list[str]:
+        now = time.monotonic()
+        ready_models = [model_name for model_name in self.wrappers_by_model if self._ready_wrappers(model_name, now)]
+        # all throttled: the caller sleeps until one is ready, see sleep_until_next_ready_async
+        candidate_models = ready_models or list(self.wrappers_by_model)
+
+        accepting_models = [
+            model_name
+            for model_name in candidate_models
+            if model_name not in self.routes or self.routes[model_name].accepts(input_token_count)
+        ]
+        # an article no route accepts still has to be extracted
+        return accepting_models or candidate_models
+
+    def eligible_models(self, input_token_count: int) -> list[str]:
+        accepting_models = self.accepting_models(input_token_count)
+        healthy_models = [
+            model_name
+            for model_name in accepting_models
+            if self.stats[model_name].error_rate <= self.max_error_rate
+        ]
+        return healthy_models or accepting_models
+
+    def provide_llm(self) -> LlmWrapper:
+        return self.provide_llm_for(0)
+
+    def provide_llm_for(self, input_token_count: int) -> LlmWrapper:
+        accepting_models = self.accepting_models(input_token_count)
+
+        if len(accepting_models) > 1 and random.random() < self.explore_rate:
+            # unhealthy models are explored too, their error rate can only recover with new requests
+            model_name = random.choice(accepting_models)
+        else:
+            eligible_models = self.eligible_models(input_token_count)
+            model_name = min(
+                eligible_models,
+                key=lambda name: self.stats[name].expected_seconds(input_token_count)
+            )
+
+        llm_wrappers = self._ready_wrappers(model_name, time.monotonic()) or self.wrappers_by_model[model_name]
+        llm_wrapper = llm_wrappers[self._next_wrapper_index[model_name] % len(llm_wrappers)]
+        self._next_wrapper_index[model_name] += 1
+
+        self.stats[model_name].in_flight += 1
+        return llm_wrapper
+
+    def provide_hedge_llm_for(self, input_token_count: int, primary: LlmWrapper) -> LlmWrapper | None:
+        now = time.monotonic()
+        llm_wrappers = [
+            llm_wrapper
+            for model_name in self.eligible_models(input_token_count)
+            for llm_wrapper in self._ready_wrappers(model_name, now)
+            if (llm_wrapper.model_name, llm_wrapper.api_key) != (primary.model_name, primary.api_key)
+        ]
+        if not llm_wrappers:
+            return None
+
+        llm_wrapper = min(
+            llm_wrappers,
+            key=lambda candidate: self.stats[candidate.model_name].expected_seconds(input_token_count)
+        )
+        self.stats[llm_wrapper.model_name].in_flight += 1
+        return llm_wrapper
+
+    def record_outcome(
+            self,
+            llm_wrapper: LlmWrapper,
+            latency_seconds: float,
+            error_kind: OutcomeErrorKind,
+            input_token_count: int,
+            output_token_count: int | None = None
+    ) -> None:
+        stats = self.stats[llm_wrapper.model_name]
+        stats.in_flight = max(0, stats.in_flight - 1)
+        if error_kind == "cancelled":
+            return
+        stats.record(RequestOutcome(latency_seconds, error_kind, input_token_count, output_token_count))
+
+        if error_kind == "throttling":
+            self.cooldown_until[(llm_wrapper.model_name, llm_wrapper.api_key)] = (
+                    time.monotonic() + self.throttle_cooldown_seconds)
+
+        self._outcome_count += 1
+        if self._outcome_count % self.report_every == 0:
+            for model_name, model_stats in self.stats.items():
+                logger.info(f"Model {model_name}: {model_stats.summary()}")
+
+    async def sleep_until_next_ready_async(self):
+        now = time.monotonic()
+        if any(self._ready_wrappers(model_name, now) for model_name in self.wrappers_by_model):
+            return
+        sleep_seconds = min(self.cooldown_until.values()) - now
+        logger.info(f"All models are throttled, sleeping for {sleep_seconds:.1f} seconds")
+        await asyncio.sleep(sleep_seconds)
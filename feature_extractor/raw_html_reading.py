@@ -1,8 +1,17 @@
 import abc
+import asyncio
+import concurrent.futures
 import datetime
-from typing import Iterable, Any
+from typing import Iterable, Any, TYPE_CHECKING
 
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from feature_extractor.field_structure_definitions import LEGACY_FIELD_GROUP_VERSION, field_group_field_names
+
+if TYPE_CHECKING:
+    import clickhouse_connect.driver
+    from pymongo import AsyncMongoClient
 
 
 class IRawHtmlReader(abc.ABC):
@@ -18,6 +27,15 @@ class IRawHtmlReader(abc.ABC):
     def read_all(self, skip, limit) -> Iterable:
         raise NotImplementedError
 
+    def read_by_urls(self, urls: list[str]) -> Iterable:
+        raise NotImplementedError
+
+    def read_after(self, after_download_time: datetime.datetime, after_url: str, limit) -> Iterable:
+        """
+        docs downloaded after a (download time, url) watermark, in that order
+        """
+        raise NotImplementedError
+
     @property
     def content_column_name(self) -> str:
         raise NotImplementedError
@@ -28,9 +46,8 @@ class IRawHtmlReader(abc.ABC):
 
 
 class ClickhouseRawHtmlReader(IRawHtmlReader):
-    import clickhouse_connect
 
-    def __init__(self, clickhouse_client: clickhouse_connect.driver.Client):
+    def __init__(self, clickhouse_client: "clickhouse_connect.driver.Client"):
         self.clickhouse_client = clickhouse_client
 
     def get_initial_skip_page(self, start_date: datetime.date, end_date_excl: datetime.date,
@@ -68,6 +85,29 @@ class ClickhouseRawHtmlReader(IRawHtmlReader):
         for row in query_res.result_rows:
             yield dict(zip(col_names, row))
 
+    def read_by_urls(self, urls: list[str]) -> Iterable:
+        if not urls:
+            return
+        query_res = self.clickhouse_client.query(
+            """select * from news.articles
+               where url in {urls:Array(String)}""",
+            parameters={'urls': urls})
+        col_names = [n[0].lower() + n[1:] for n in query_res.column_names]
+        for row in query_res.result_rows:
+            yield dict(zip(col_names, row))
+
+    def read_after(self, after_download_time: datetime.datetime, after_url: str, limit) -> Iterable:
+        # keyset pagination, docs downloaded in the same second are neither skipped nor read twice
+        query_res = self.clickhouse_client.query(
+            """select * from news.articles
+               where (DownloadTime, url) > ({after_download_time:DateTime64(6)}, {after_url:String})
+               order by DownloadTime, url
+               limit {limit:UInt32}""",
+            parameters={'after_download_time': after_download_time, 'after_url': after_url, 'limit': limit})
+        col_names = [n[0].lower() + n[1:] for n in query_res.column_names]
+        for row in query_res.result_rows:
+            yield dict(zip(col_names, row))
+
     @property
     def content_column_name(self) -> str:
         return "htmlContent"
@@ -152,6 +192,9 @@ class MongoRawHtmlReader(IRawHtmlReader):
 
         return self.html_raw_collection.aggregate(pipeline)
 
+    def read_by_urls(self, urls: list[str]) -> Iterable:
+        return self.html_raw_collection.find({'url': {'$in': urls}})
+
     @property
     def content_column_name(self) -> str:
         return "content"
@@ -167,12 +210,210 @@ class IFeatureResultRepo(abc.ABC):
                                  end_date_excl: datetime.date) -> datetime.datetime | None:
         raise NotImplementedError
 
-    def get_non_saved_urls(self, urls: list[str]) -> list[str]:
+    def get_non_saved_urls(self, urls: list[str], exclude_dead_letters: bool = False) -> list[str]:
+        """
+        :param exclude_dead_letters: also leave out dead-lettered urls, they are only retried by replay_dead_letters
+        """
         raise NotImplementedError
 
     def write(self, docs_batch: list) -> None:
+        """
+        inserts docs whose url is not stored yet, docs of already stored urls are ignored
+        """
+        raise NotImplementedError
+
+    def ensure_url_index(self) -> None:
+        raise NotImplementedError
+
+    def write_prefilter_decisions(self, decisions: list[dict]) -> None:
         raise NotImplementedError
 
+    def get_docs_with_outdated_field_groups(
+            self, field_group_versions: dict[str, int], after_id, limit: int) -> list[dict]:
+        """
+        :return: arr of dict with keys _id, url, field_group_versions (None for legacy docs) and present_fields
+        """
+        raise NotImplementedError
+
+    def merge_field_groups(self, url: str, extracted_fields: dict, field_group_versions: dict[str, int],
+                           model_name: str) -> None:
+        raise NotImplementedError
+
+    def write_dead_letters(self, dead_letters: list[dict]) -> None:
+        raise NotImplementedError
+
+    def get_dead_letters(self, after_id, limit: int, max_failure_count: int | None = None) -> list[dict]:
+        raise NotImplementedError
+
+    def delete_dead_letters(self, urls: list[str]) -> None:
+        raise NotImplementedError
+
+    def ensure_symbol_indexes(self) -> None:
+        raise NotImplementedError
+
+    def get_docs_without_symbols(self, after_id, limit: int) -> list[dict]:
+        """
+        :return: arr of dict with keys _id, url and financial_event_with_symbols
+        """
+        raise NotImplementedError
+
+    def write_symbol_fields(self, symbol_fields_by_id: dict) -> None:
+        """
+        :param symbol_fields_by_id: _id -> fields to set, including the canonicalized financial_event_with_symbols
+        """
+        raise NotImplementedError
+
+
+DUPLICATE_KEY_ERROR_CODE = 11000
+
+
+def _datetime_range(start_date: datetime.date, end_date_excl: datetime.date):
+    return (
+        datetime.datetime.combine(start_date, datetime.datetime.min.time()),
+        datetime.datetime.combine(end_date_excl, datetime.datetime.min.time()),
+    )
+
+
+def _last_saved_url_pipeline(start_date: datetime.date, end_date_excl: datetime.date) -> list[dict]:
+    start_date, end_date_excl = _datetime_range(start_date, end_date_excl)
+
+    return [
+        {
+            '$match': {
+                'download_time': {
+                    '$gte': start_date,
+                    '$lt': end_date_excl
+                }
+            }
+        },
+        {'$sort': {
+            'download_time': -1
+        }
+        },
+        {'$limit': 1},
+        {
+            '$project': {
+                '_id': 0,
+                'datetime': '$download_time',
+            }
+        }
+    ]
+
+
+def _insert_new_docs_operations(docs: list[dict]) -> list[UpdateOne]:
+    # the first write of a url wins, e.g. when two workers extracted it while a shard lease moved
+    return [UpdateOne({'url': doc['url']}, {'$setOnInsert': doc}, upsert=True) for doc in docs]
+
+
+def _raise_unless_duplicate_urls(e: BulkWriteError):
+    # concurrent upserts of one url race on the unique index, the loser gets a duplicate key error
+    if any(error['code'] != DUPLICATE_KEY_ERROR_CODE for error in e.details.get('writeErrors', [])):
+        raise e
+    if e.details.get('writeConcernErrors'):
+        raise e
+
+
+def _replace_docs_operations(docs: list[dict]) -> list[ReplaceOne]:
+    return [ReplaceOne({'url': doc['url']}, doc, upsert=True) for doc in docs]
+
+
+def _saved_urls_query(start_date: datetime.date | None, end_date_excl: datetime.date | None, after_id) -> dict:
+    query = {}
+    if start_date is not None and end_date_excl is not None:
+        start_dt, end_dt_excl = _datetime_range(start_date, end_date_excl)
+        query['download_time'] = {'$gte': start_dt, '$lt': end_dt_excl}
+    if after_id is not None:
+        query['_id'] = {'$gt': after_id}
+    return query
+
+
+def _prefilter_decision_operations(decisions: list[dict]) -> list[UpdateOne]:
+    return [
+        UpdateOne({'url': decision['url']}, {'$set': decision}, upsert=True)
+        for decision in decisions
+    ]
+
+
+def _outdated_field_groups_pipeline(field_group_versions: dict[str, int], after_id, limit: int) -> list[dict]:
+    fields = [
+        field
+        for field_group in field_group_versions
+        for field in field_group_field_names(field_group)
+    ]
+
+    outdated_clauses = []
+    for field_group, version in field_group_versions.items():
+        outdated_clauses.append({f'field_group_versions.{field_group}': {'$lt': version}})
+        if version > LEGACY_FIELD_GROUP_VERSION:
+            outdated_clauses.append({f'field_group_versions.{field_group}': {'$exists': False}})
+    outdated_clauses.extend({field: {'$exists': False}} for field in fields)
+
+    match = {'$or': outdated_clauses}
+    if after_id is not None:
+        match['_id'] = {'$gt': after_id}
+
+    return [
+        {'$match': match},
+        {'$sort': {'_id': 1}},
+        {'$limit': limit},
+        {
+            '$project': {
+                'url': 1,
+                'field_group_versions': {'$ifNull': ['$field_group_versions', None]},
+                **{
+                    f'present_fields.{field}': {'$ne': [{'$type': f'${field}'}, 'missing']}
+                    for field in fields
+                }
+            }
+        }
+    ]
+
+
+def _with_present_field_set(doc: dict) -> dict:
+    doc['present_fields'] = set(field for field, present in doc['present_fields'].items() if present)
+    return doc
+
+
+def _merge_field_groups_update(extracted_fields: dict, field_group_versions: dict[str, int], model_name: str) -> dict:
+    return {
+        '$set': {
+            **extracted_fields,
+            **{
+                f'field_group_versions.{field_group}': version
+                for field_group, version in field_group_versions.items()
+            },
+            **{
+                f'field_group_model_names.{field_group}': model_name
+                for field_group in field_group_versions
+            },
+            'updated_at': datetime.datetime.now(datetime.timezone.utc),
+        }
+    }
+
+
+def _dead_letter_operations(dead_letters: list[dict]) -> list[UpdateOne]:
+    return [
+        UpdateOne(
+            {'url': dead_letter['url']},
+            {
+                '$set': dead_letter,
+                '$setOnInsert': {'first_failed_at': dead_letter['failed_at']},
+                '$inc': {'failure_count': 1, 'total_attempts': dead_letter['attempts']},
+            },
+            upsert=True
+        )
+        for dead_letter in dead_letters
+    ]
+
+
+def _dead_letters_query(after_id, max_failure_count: int | None) -> dict:
+    query = {}
+    if after_id is not None:
+        query['_id'] = {'$gt': after_id}
+    if max_failure_count is not None:
+        query['failure_count'] = {'$lte': max_failure_count}
+    return query
+
 
 class MongoFeatureResultRepo(IFeatureResultRepo):
     def __init__(self, mongo_client: MongoClient):
@@ -180,39 +421,16 @@ class MongoFeatureResultRepo(IFeatureResultRepo):
         self.html_downloads_db = self.mongo_client["html_downloads"]
         self.html_raw_collection = self.html_downloads_db["html_raw"]
         self.dest_write_collection = self.html_downloads_db["llm_feature_extract_dest"]
+        self.prefilter_decision_collection = self.html_downloads_db["llm_feature_prefilter"]
+        self.dead_letter_collection = self.html_downloads_db["llm_feature_extract_dead_letters"]
 
     def get_dt_of_last_saved_url(self, start_date: datetime.date, end_date_excl: datetime.date):
-        start_date = datetime.datetime.combine(start_date, datetime.datetime.min.time())
-        end_date_excl = datetime.datetime.combine(end_date_excl, datetime.datetime.min.time())
-
-        pipeline = [
-            {
-                '$match': {
-                    'download_time': {
-                        '$gte': start_date,
-                        '$lt': end_date_excl
-                    }
-                }
-            },
-            {'$sort': {
-                'download_time': -1
-            }
-            },
-            {'$limit': 1},
-            {
-                '$project': {
-                    '_id': 0,
-                    'datetime': '$download_time',
-                }
-            }
-        ]
-
-        res = list(self.dest_write_collection.aggregate(pipeline))
+        res = list(self.dest_write_collection.aggregate(_last_saved_url_pipeline(start_date, end_date_excl)))
         if not res:
             return None
         return res[0]['datetime']
 
-    def get_non_saved_urls(self, urls: list[str]) -> list[str]:
+    def get_non_saved_urls(self, urls: list[str], exclude_dead_letters: bool = False) -> list[str]:
         existing_urls = set(
             doc["url"]
             for doc in self.dest_write_collection.find({
@@ -220,11 +438,341 @@ class MongoFeatureResultRepo(IFeatureResultRepo):
                     "$in": urls
                 }
             }))
+        if exclude_dead_letters:
+            existing_urls.update(
+                doc["url"] for doc in self.dead_letter_collection.find({"url": {"$in": urls}}, {"url": 1}))
 
         return [url for url in urls if url not in existing_urls]
 
     def write(self, docs_batch: list) -> None:
-        processed = []
-        for doc in docs_batch:
-            processed.append(doc)
-        self.dest_write_collection.insert_many(processed)
+        if not docs_batch:
+            return
+        try:
+            self.dest_write_collection.bulk_write(_insert_new_docs_operations(docs_batch), ordered=False)
+        except BulkWriteError as e:
+            _raise_unless_duplicate_urls(e)
+
+    def ensure_url_index(self) -> None:
+        # dead letters are upserted by url and looked up by url for every page read
+        self.dead_letter_collection.create_index('url', unique=True)
+        # fails if duplicate urls are already stored, they have to be removed first
+        self.dest_write_collection.create_index('url', unique=True)
+
+    def write_prefilter_decisions(self, decisions: list[dict]) -> None:
+        if not decisions:
+            return
+        self.prefilter_decision_collection.bulk_write(_prefilter_decision_operations(decisions), ordered=False)
+
+    def get_docs_with_outdated_field_groups(
+            self, field_group_versions: dict[str, int], after_id, limit: int) -> list[dict]:
+        pipeline = _outdated_field_groups_pipeline(field_group_versions, after_id, limit)
+        return [_with_present_field_set(doc) for doc in self.dest_write_collection.aggregate(pipeline)]
+
+    def merge_field_groups(self, url: str, extracted_fields: dict, field_group_versions: dict[str, int],
+                           model_name: str) -> None:
+        self.dest_write_collection.update_one(
+            {'url': url},
+            _merge_field_groups_update(extracted_fields, field_group_versions, model_name)
+        )
+
+    def write_dead_letters(self, dead_letters: list[dict]) -> None:
+        if not dead_letters:
+            return
+        self.dead_letter_collection.bulk_write(_dead_letter_operations(dead_letters), ordered=False)
+
+    def get_dead_letters(self, after_id, limit: int, max_failure_count: int | None = None) -> list[dict]:
+        query = _dead_letters_query(after_id, max_failure_count)
+        return list(self.dead_letter_collection.find(query).sort('_id', 1).limit(limit))
+
+    def delete_dead_letters(self, urls: list[str]) -> None:
+        self.dead_letter_collection.delete_many({'url': {'$in': urls}})
+
+    def ensure_symbol_indexes(self) -> None:
+        # multikey indexes, symbol discovery filters on them instead of unnesting financial_event_with_symbols
+        self.dest_write_collection.create_index('symbols')
+        self.dest_write_collection.create_index('listings')
+
+    def get_docs_without_symbols(self, after_id, limit: int) -> list[dict]:
+        query = {'symbols': {'$exists': False}, 'financial_event_with_symbols': {'$exists': True}}
+        if after_id is not None:
+            query['_id'] = {'$gt': after_id}
+
+        return list(
+            self.dest_write_collection
+            .find(query, {'url': 1, 'financial_event_with_symbols': 1})
+            .sort('_id', 1)
+            .limit(limit)
+        )
+
+    def write_symbol_fields(self, symbol_fields_by_id: dict) -> None:
+        if not symbol_fields_by_id:
+            return
+        updated_at = datetime.datetime.now(datetime.timezone.utc)
+        self.dest_write_collection.bulk_write(
+            [
+                UpdateOne({'_id': _id}, {'$set': {**fields, 'updated_at': updated_at}})
+                for _id, fields in symbol_fields_by_id.items()
+            ],
+            ordered=False
+        )
+
+
+class IAsyncRawHtmlReader(abc.ABC):
+    """
+    async variant of IRawHtmlReader for the extractor pipeline, reads don't block in-flight LLM requests
+    """
+
+    async def get_initial_skip_page(
+            self, start_date: datetime.date, end_date_excl: datetime.date,
+            dt_last_saved_url: datetime.datetime) -> int:
+        raise NotImplementedError
+
+    async def read(self, start_date: datetime.date, end_date_excl: datetime.date, skip, limit) -> list[dict]:
+        raise NotImplementedError
+
+    async def read_by_urls(self, urls: list[str]) -> list[dict]:
+        raise NotImplementedError
+
+    async def read_after(self, after_download_time: datetime.datetime, after_url: str, limit) -> list[dict]:
+        raise NotImplementedError
+
+    @property
+    def content_column_name(self) -> str:
+        raise NotImplementedError
+
+    @property
+    def download_time_column_name(self) -> str:
+        raise NotImplementedError
+
+
+class AsyncClickhouseRawHtmlReader(IAsyncRawHtmlReader):
+    """
+    same queries as ClickhouseRawHtmlReader. the async client runs them on its executor threads
+    over its pooled http connections, the client must not use a session so that queries can run concurrently
+    """
+
+    def __init__(self, async_clickhouse_client: "clickhouse_connect.driver.AsyncClient"):
+        self.async_clickhouse_client = async_clickhouse_client
+
+    async def _query_dicts(self, query: str, parameters: dict | None = None) -> list[dict]:
+        query_res = await self.async_clickhouse_client.query(query, parameters=parameters)
+        col_names = [n[0].lower() + n[1:] for n in query_res.column_names]
+        return [dict(zip(col_names, row)) for row in query_res.result_rows]
+
+    async def get_initial_skip_page(self, start_date: datetime.date, end_date_excl: datetime.date,
+                                    dt_last_saved_url: datetime.datetime) -> int:
+        query_res = await self.async_clickhouse_client.query(
+            f"""SELECT COUNT(*) FROM news.articles
+                WHERE DownloadTime >= '{start_date.isoformat()}'
+                  AND DownloadTime < '{dt_last_saved_url.isoformat()}'"""
+        )
+
+        return query_res.result_rows[0][0] if query_res.result_rows else 0
+
+    async def read(self, start_date: datetime.date, end_date_excl: datetime.date, skip, limit) -> list[dict]:
+        return await self._query_dicts(
+            f"""select * from news.articles
+                where DownloadTime >= '{start_date.isoformat()}'
+                  and DownloadTime < '{end_date_excl.isoformat()}'
+                order by DownloadTime
+                limit {limit} offset {skip}""")
+
+    async def read_by_urls(self, urls: list[str]) -> list[dict]:
+        if not urls:
+            return []
+        return await self._query_dicts(
+            """select * from news.articles
+               where url in {urls:Array(String)}""",
+            {'urls': urls})
+
+    async def read_after(self, after_download_time: datetime.datetime, after_url: str, limit) -> list[dict]:
+        return await self._query_dicts(
+            """select * from news.articles
+               where (DownloadTime, url) > ({after_download_time:DateTime64(6)}, {after_url:String})
+               order by DownloadTime, url
+               limit {limit:UInt32}""",
+            {'after_download_time': after_download_time, 'after_url': after_url, 'limit': limit})
+
+    @property
+    def content_column_name(self) -> str:
+        return "htmlContent"
+
+    @property
+    def download_time_column_name(self) -> str:
+        return "downloadTime"
+
+
+class ThreadPoolRawHtmlReader(IAsyncRawHtmlReader):
+    """
+    runs a blocking IRawHtmlReader on a dedicated I/O thread pool, e.g. MongoRawHtmlReader.
+    the wrapped reader's client has to be thread safe for max_workers > 1
+    """
+
+    def __init__(self, raw_html_reader: IRawHtmlReader, max_workers: int = 4):
+        self.raw_html_reader = raw_html_reader
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix="raw-html-io")
+
+    async def _run(self, fn, *args) -> list:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, lambda: list(fn(*args)))
+
+    async def get_initial_skip_page(self, start_date: datetime.date, end_date_excl: datetime.date,
+                                    dt_last_saved_url: datetime.datetime) -> int:
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.raw_html_reader.get_initial_skip_page, start_date, end_date_excl, dt_last_saved_url)
+
+    async def read(self, start_date: datetime.date, end_date_excl: datetime.date, skip, limit) -> list[dict]:
+        return await self._run(self.raw_html_reader.read, start_date, end_date_excl, skip, limit)
+
+    async def read_by_urls(self, urls: list[str]) -> list[dict]:
+        return await self._run(self.raw_html_reader.read_by_urls, urls)
+
+    async def read_after(self, after_download_time: datetime.datetime, after_url: str, limit) -> list[dict]:
+        return await self._run(self.raw_html_reader.read_after, after_download_time, after_url, limit)
+
+    @property
+    def content_column_name(self) -> str:
+        return self.raw_html_reader.content_column_name
+
+    @property
+    def download_time_column_name(self) -> str:
+        return self.raw_html_reader.download_time_column_name
+
+
+class IAsyncFeatureResultRepo(abc.ABC):
+    """
+    async variant of the IFeatureResultRepo methods the extractor pipeline uses
+    """
+
+    async def get_dt_of_last_saved_url(self, start_date: datetime.date,
+                                       end_date_excl: datetime.date) -> datetime.datetime | None:
+        raise NotImplementedError
+
+    async def get_non_saved_urls(self, urls: list[str], exclude_dead_letters: bool = False) -> list[str]:
+        """
+        :param exclude_dead_letters: also leave out dead-lettered urls, they are only retried by replay_dead_letters
+        """
+        raise NotImplementedError
+
+    async def write(self, docs_batch: list) -> None:
+        """
+        inserts docs whose url is not stored yet, docs of already stored urls are ignored
+        """
+        raise NotImplementedError
+
+    async def overwrite(self, docs_batch: list) -> None:
+        """
+        inserts docs, or replaces the stored docs of their urls
+        """
+        raise NotImplementedError
+
+    async def get_saved_urls(self, start_date: datetime.date | None, end_date_excl: datetime.date | None,
+                             after_id, limit: int) -> list[dict]:
+        """
+        :return: arr of dict with keys _id and url, ordered by _id, all dates if start_date or end_date_excl is None
+        """
+        raise NotImplementedError
+
+    async def write_prefilter_decisions(self, decisions: list[dict]) -> None:
+        raise NotImplementedError
+
+    async def get_docs_with_outdated_field_groups(
+            self, field_group_versions: dict[str, int], after_id, limit: int) -> list[dict]:
+        """
+        :return: arr of dict with keys _id, url, field_group_versions (None for legacy docs) and present_fields
+        """
+        raise NotImplementedError
+
+    async def merge_field_groups(self, url: str, extracted_fields: dict, field_group_versions: dict[str, int],
+                                 model_name: str) -> None:
+        raise NotImplementedError
+
+    async def write_dead_letters(self, dead_letters: list[dict]) -> None:
+        raise NotImplementedError
+
+    async def get_dead_letters(self, after_id, limit: int, max_failure_count: int | None = None) -> list[dict]:
+        raise NotImplementedError
+
+    async def delete_dead_letters(self, urls: list[str]) -> None:
+        raise NotImplementedError
+
+
+class AsyncMongoFeatureResultRepo(IAsyncFeatureResultRepo):
+    """
+    same queries as MongoFeatureResultRepo on pymongo's AsyncMongoClient, which pools its connections
+    (maxPoolSize), so concurrent reads and writes don't wait for each other
+    """
+
+    def __init__(self, async_mongo_client: "AsyncMongoClient", dest_collection_name: str = "llm_feature_extract_dest"):
+        self.async_mongo_client = async_mongo_client
+        self.html_downloads_db = self.async_mongo_client["html_downloads"]
+        self.dest_write_collection = self.html_downloads_db[dest_collection_name]
+        self.prefilter_decision_collection = self.html_downloads_db["llm_feature_prefilter"]
+        self.dead_letter_collection = self.html_downloads_db["llm_feature_extract_dead_letters"]
+
+    async def get_dt_of_last_saved_url(self, start_date: datetime.date, end_date_excl: datetime.date):
+        cursor = await self.dest_write_collection.aggregate(_last_saved_url_pipeline(start_date, end_date_excl))
+        res = await cursor.to_list()
+        if not res:
+            return None
+        return res[0]['datetime']
+
+    async def get_non_saved_urls(self, urls: list[str], exclude_dead_letters: bool = False) -> list[str]:
+        existing_urls = set(
+            doc["url"]
+            for doc in await self.dest_write_collection.find({"url": {"$in": urls}}, {"url": 1}).to_list()
+        )
+        if exclude_dead_letters:
+            existing_urls.update(
+                doc["url"]
+                for doc in await self.dead_letter_collection.find({"url": {"$in": urls}}, {"url": 1}).to_list()
+            )
+
+        return [url for url in urls if url not in existing_urls]
+
+    async def write(self, docs_batch: list) -> None:
+        if not docs_batch:
+            return
+        try:
+            await self.dest_write_collection.bulk_write(_insert_new_docs_operations(docs_batch), ordered=False)
+        except BulkWriteError as e:
+            _raise_unless_duplicate_urls(e)
+
+    async def overwrite(self, docs_batch: list) -> None:
+        if not docs_batch:
+            return
+        await self.dest_write_collection.bulk_write(_replace_docs_operations(docs_batch), ordered=False)
+
+    async def get_saved_urls(self, start_date: datetime.date | None, end_date_excl: datetime.date | None,
+                             after_id, limit: int) -> list[dict]:
+        query = _saved_urls_query(start_date, end_date_excl, after_id)
+        return await self.dest_write_collection.find(query, {'url': 1}).sort('_id', 1).limit(limit).to_list()
+
+    async def write_prefilter_decisions(self, decisions: list[dict]) -> None:
+        if not decisions:
+            return
+        await self.prefilter_decision_collection.bulk_write(_prefilter_decision_operations(decisions), ordered=False)
+
+    async def get_docs_with_outdated_field_groups(
+            self, field_group_versions: dict[str, int], after_id, limit: int) -> list[dict]:
+        cursor = await self.dest_write_collection.aggregate(
+            _outdated_field_groups_pipeline(field_group_versions, after_id, limit))
+        return [_with_present_field_set(doc) for doc in await cursor.to_list()]
+
+    async def merge_field_groups(self, url: str, extracted_fields: dict, field_group_versions: dict[str, int],
+                                 model_name: str) -> None:
+        await self.dest_write_collection.update_one(
+            {'url': url},
+            _merge_field_groups_update(extracted_fields, field_group_versions, model_name)
+        )
+
+    async def write_dead_letters(self, dead_letters: list[dict]) -> None:
+        if not dead_letters:
+            return
+        await self.dead_letter_collection.bulk_write(_dead_letter_operations(dead_letters), ordered=False)
+
+    async def get_dead_letters(self, after_id, limit: int, max_failure_count: int | None = None) -> list[dict]:
+        query = _dead_letters_query(after_id, max_failure_count)
+        return await self.dead_letter_collection.find(query).sort('_id', 1).limit(limit).to_list()
+
+    async def delete_dead_letters(self, urls: list[str]) -> None:
+        await self.dead_letter_collection.delete_many({'url': {'$in': urls}})
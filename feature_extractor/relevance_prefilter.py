@@ -0,0 +1,103 @@
+import abc
+import dataclasses
+import html
+import re
+import typing
+from typing import Literal
+
+from feature_extractor.field_structure_definitions import FinancialEvent
+
+PrefilterAction = Literal["extract", "skip"]
+
+_TAG_RE = re.compile(r"<(script|style)\b.*?</\1>|<[^>]+>", re.IGNORECASE | re.DOTALL)
+_CASHTAG_RE = re.compile(r"(?<![\w$])\$([A-Z]{1,5}(?:\.[A-Z])?)\b")
+_EXCHANGE_TICKER_RE = re.compile(
+    r"\b(?:NASDAQ|NYSE|NYSE\s+American|NYSE\s+Arca|AMEX|OTC|OTCQX|OTCQB|TSX|TSXV|CSE|LSE)"
+    r"(?:\s+[A-Za-z]+){0,2}\s*:\s*\"?(?-i:([A-Z]{1,5}(?:\.[A-Z])?))\b",
+    re.IGNORECASE
+)
+_CAMEL_CASE_SPLIT_RE = re.compile(r"[A-Z][a-z]+|[A-Z]+(?![a-z])")
+_WORD_RE = re.compile(r"[a-z]+")
+
+# words from the FinancialEvent vocabulary which carry no financial signal on their own
+_GENERIC_EVENT_WORDS = {
+    "or", "and", "of", "per", "total", "type", "previous", "revised", "future", "long", "term",
+    "count", "change", "update", "updates", "reason", "tags", "relation", "amount", "outcome",
+    "phase", "complete", "early", "final", "block", "threat", "health", "incoming", "outgoing",
+}
+
+_EXTRA_FINANCIAL_KEYWORDS = {
+    "earnings", "eps", "dividend", "guidance", "merger", "acquire", "acquires", "acquired",
+    "buyback", "repurchase", "fda", "sec", "ipo", "downgrade", "upgrade", "outlook",
+    "bankruptcy", "quarter", "quarterly", "shareholders", "stockholders", "shares", "nasdaq", "nyse",
+}
+
+
+def _event_vocabulary() -> set[str]:
+    words = set()
+    for event in typing.get_args(FinancialEvent):
+        for word in _CAMEL_CASE_SPLIT_RE.findall(event):
+            word = word.lower()
+            if len(word) > 2 and word not in _GENERIC_EVENT_WORDS:
+                words.add(word)
+    return words | _EXTRA_FINANCIAL_KEYWORDS
+
+
+@dataclasses.dataclass
+class PrefilterDecision:
+    action: PrefilterAction
+    score: float
+    symbols: list[str]
+    matched_keywords: list[str]
+
+
+class IRelevancePrefilter(abc.ABC):
+
+    @abc.abstractmethod
+    def decide(self, title: str, html_content: str) -> PrefilterDecision:
+        raise NotImplementedError
+
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
+
+class KeywordRelevancePrefilter(IRelevancePrefilter):
+    """
+    CPU-only relevance scoring: ticker / cashtag detection plus keyword hits over the FinancialEvent vocabulary.
+    score is in [0, 1]; articles below extract_threshold are skipped.
+    with the defaults neither signal decides alone: a ticker needs one keyword hit, an article without tickers
+    needs three, so that e.g. a ticker in a sidebar doesn't get an unrelated article extracted
+    """
+
+    def __init__(
+            self,
+            extract_threshold: float = 0.4,
+            symbol_weight: float = 0.3,
+            keyword_saturation: int = 5
+    ):
+        assert 0 <= extract_threshold <= 1, 'extract_threshold must be in [0, 1]'
+        assert symbol_weight < extract_threshold, 'a ticker alone must not decide, keyword hits would be ignored'
+        assert 1 - symbol_weight >= extract_threshold, 'keyword hits alone must be able to reach extract_threshold'
+        self.extract_threshold = extract_threshold
+        self.symbol_weight = symbol_weight
+        self.keyword_saturation = keyword_saturation
+        self.vocabulary = _event_vocabulary()
+
+    def decide(self, title: str, html_content: str) -> PrefilterDecision:
+        text = f"{title or ''}\n{html.unescape(_TAG_RE.sub(' ', html_content or ''))}"
+
+        symbols = sorted(
+            set(s.upper() for s in _CASHTAG_RE.findall(text))
+            | set(s.upper() for s in _EXCHANGE_TICKER_RE.findall(text))
+        )
+        matched_keywords = sorted(set(_WORD_RE.findall(text.lower())) & self.vocabulary)
+
+        score = (
+                (self.symbol_weight if symbols else 0.0)
+                + (1 - self.symbol_weight) * min(1.0, len(matched_keywords) / self.keyword_saturation)
+        )
+
+        action = "extract" if score >= self.extract_threshold else "skip"
+
+        return PrefilterDecision(action, round(score, 4), symbols, matched_keywords)
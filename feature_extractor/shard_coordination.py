@@ -0,0 +1,315 @@
+import abc
+import asyncio
+import contextlib
+import dataclasses
+import datetime
+import logging
+import os
+import socket
+
+from pymongo import MongoClient, UpdateOne, ReturnDocument
+
+from feature_extractor.extractor_pipelines import ExtractorPipeline, WriteFenceError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class ExtractionShard:
+    shard_id: str
+    start_date: datetime.date
+    end_date_excl: datetime.date
+    # the shard's claim count at this claim, a newer claim of the shard invalidates older tokens
+    fencing_token: int = 0
+
+
+def _as_utc(dt: datetime.datetime) -> datetime.datetime:
+    # mongo returns naive UTC datetimes
+    return dt.replace(tzinfo=datetime.timezone.utc) if dt.tzinfo is None else dt
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class IShardCoordinator(abc.ABC):
+
+    @abc.abstractmethod
+    def create_shards(self, start_date: datetime.date, end_date_excl: datetime.date, shard_days: int) -> int:
+        """
+        idempotent, existing shards keep their status
+        :return: number of newly created shards
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def claim_shard(self, worker_id: str, lease_seconds: float) -> ExtractionShard | None:
+        """
+        atomically claims a pending shard, or a leased shard whose lease expired
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def next_claimable_at(self) -> datetime.datetime | None:
+        """
+        :return: earliest time a pending shard's retry backoff or a leased shard's lease ends,
+        None if all shards are done or failed
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def renew_lease(self, shard: ExtractionShard, worker_id: str, lease_seconds: float) -> bool:
+        """
+        :return: False if the worker no longer owns the shard
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def check_lease(self, shard: ExtractionShard, worker_id: str) -> bool:
+        """
+        :return: True if this claim (see ExtractionShard.fencing_token) still holds an unexpired lease
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def complete_shard(self, shard: ExtractionShard, worker_id: str) -> bool:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def release_shard(self, shard: ExtractionShard, worker_id: str) -> None:
+        """
+        gives a failed shard back for a later retry with backoff, or marks it failed after max_claims claims
+        """
+        raise NotImplementedError
+
+
+class MongoShardCoordinator(IShardCoordinator):
+    def __init__(
+            self,
+            mongo_client: MongoClient,
+            max_claims: int = 5,
+            retry_backoff_seconds: float = 60,
+            max_retry_backoff_seconds: float = 3_600
+    ):
+        self.mongo_client = mongo_client
+        self.max_claims = max_claims
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.max_retry_backoff_seconds = max_retry_backoff_seconds
+        self.html_downloads_db = self.mongo_client["html_downloads"]
+        self.shard_collection = self.html_downloads_db["llm_feature_extract_shards"]
+        self.shard_collection.create_index([('status', 1), ('start', 1)])
+
+    def create_shards(self, start_date: datetime.date, end_date_excl: datetime.date, shard_days: int) -> int:
+        operations = []
+        shard_start = start_date
+        while shard_start < end_date_excl:
+            shard_end = min(shard_start + datetime.timedelta(days=shard_days), end_date_excl)
+            operations.append(
+                UpdateOne(
+                    {'_id': f"{shard_start.isoformat()}_{shard_end.isoformat()}"},
+                    {
+                        '$setOnInsert': {
+                            'start': datetime.datetime.combine(shard_start, datetime.datetime.min.time()),
+                            'end_excl': datetime.datetime.combine(shard_end, datetime.datetime.min.time()),
+                            'status': 'pending',
+                            'claim_count': 0,
+                        }
+                    },
+                    upsert=True
+                )
+            )
+            shard_start = shard_end
+
+        if not operations:
+            return 0
+
+        return self.shard_collection.bulk_write(operations, ordered=False).upserted_count
+
+    def claim_shard(self, worker_id: str, lease_seconds: float) -> ExtractionShard | None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        # shards whose workers kept dying without releasing them
+        self.shard_collection.update_many(
+            {'status': 'leased', 'lease_expires_at': {'$lt': now}, 'claim_count': {'$gte': self.max_claims}},
+            {'$set': {'status': 'failed', 'failed_at': now}, '$unset': {'worker_id': '', 'lease_expires_at': ''}}
+        )
+
+        doc = self.shard_collection.find_one_and_update(
+            {
+                '$or': [
+                    {'status': 'pending', 'retry_at': {'$not': {'$gt': now}}},
+                    {'status': 'leased', 'lease_expires_at': {'$lt': now}, 'claim_count': {'$lt': self.max_claims}},
+                ]
+            },
+            {
+                '$set': {
+                    'status': 'leased',
+                    'worker_id': worker_id,
+                    'lease_expires_at': now + datetime.timedelta(seconds=lease_seconds),
+                    'heartbeat_at': now,
+                },
+                '$inc': {'claim_count': 1},
+            },
+            sort=[('start', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+        if doc is None:
+            return None
+
+        return ExtractionShard(doc['_id'], doc['start'].date(), doc['end_excl'].date(), doc['claim_count'])
+
+    def next_claimable_at(self) -> datetime.datetime | None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        claimable_at = []
+
+        pending = self.shard_collection.find_one({'status': 'pending'}, {'retry_at': 1}, sort=[('retry_at', 1)])
+        if pending is not None:
+            # shards without retry_at were never released, they are claimable now
+            claimable_at.append(_as_utc(pending['retry_at']) if pending.get('retry_at') else now)
+
+        leased = self.shard_collection.find_one(
+            {'status': 'leased'}, {'lease_expires_at': 1}, sort=[('lease_expires_at', 1)])
+        if leased is not None:
+            claimable_at.append(_as_utc(leased['lease_expires_at']))
+
+        return min(claimable_at, default=None)
+
+    def _lease_filter(self, shard: ExtractionShard, worker_id: str) -> dict:
+        return {'_id': shard.shard_id, 'worker_id': worker_id, 'status': 'leased', 'claim_count': shard.fencing_token}
+
+    def check_lease(self, shard: ExtractionShard, worker_id: str) -> bool:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return self.shard_collection.count_documents(
+            {**self._lease_filter(shard, worker_id), 'lease_expires_at': {'$gt': now}}, limit=1) == 1
+
+    def renew_lease(self, shard: ExtractionShard, worker_id: str, lease_seconds: float) -> bool:
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        res = self.shard_collection.update_one(
+            {**self._lease_filter(shard, worker_id), 'lease_expires_at': {'$gt': now}},
+            {
+                '$set': {
+                    'lease_expires_at': now + datetime.timedelta(seconds=lease_seconds),
+                    'heartbeat_at': now,
+                }
+            }
+        )
+        return res.matched_count == 1
+
+    def complete_shard(self, shard: ExtractionShard, worker_id: str) -> bool:
+        res = self.shard_collection.update_one(
+            self._lease_filter(shard, worker_id),
+            {
+                '$set': {
+                    'status': 'done',
+                    'completed_at': datetime.datetime.now(datetime.timezone.utc),
+                }
+            }
+        )
+        return res.matched_count == 1
+
+    def release_shard(self, shard: ExtractionShard, worker_id: str) -> None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+        if shard.fencing_token >= self.max_claims:
+            update = {'$set': {'status': 'failed', 'failed_at': now}}
+        else:
+            backoff_seconds = min(
+                self.max_retry_backoff_seconds,
+                self.retry_backoff_seconds * 2 ** (shard.fencing_token - 1)
+            )
+            update = {'$set': {'status': 'pending', 'retry_at': now + datetime.timedelta(seconds=backoff_seconds)}}
+
+        self.shard_collection.update_one(
+            self._lease_filter(shard, worker_id),
+            {**update, '$unset': {'worker_id': '', 'lease_expires_at': ''}}
+        )
+
+
+class ShardedExtractorWorker:
+    """
+    claims shards from the coordinator and runs the extractor pipeline on each, until all shards are done or failed.
+    while shards are only backing off or leased by other (possibly dead) workers, it sleeps until the earliest of them
+    is claimable again, so abandoned shards are reclaimed by the running workers.
+    the lease is renewed every heartbeat_interval_seconds; if it is lost the shard's run is cancelled,
+    since another worker may have reclaimed it.
+    coordinator calls are blocking mongo round trips, they run in a thread to not stall in-flight LLM requests
+    """
+
+    def __init__(
+            self,
+            extractor_pipeline: ExtractorPipeline,
+            shard_coordinator: IShardCoordinator,
+            worker_id: str | None = None,
+            lease_seconds: float = 300,
+            heartbeat_interval_seconds: float = 60,
+            min_idle_sleep_seconds: float = 1
+    ):
+        assert heartbeat_interval_seconds < lease_seconds, 'heartbeat must be more frequent than lease expiry'
+        self.extractor_pipeline = extractor_pipeline
+        self.shard_coordinator = shard_coordinator
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval_seconds = heartbeat_interval_seconds
+        self.min_idle_sleep_seconds = min_idle_sleep_seconds
+
+    async def run(self):
+        while True:
+            shard = await asyncio.to_thread(self.shard_coordinator.claim_shard, self.worker_id, self.lease_seconds)
+            if shard is None:
+                next_claimable_at = await asyncio.to_thread(self.shard_coordinator.next_claimable_at)
+                if next_claimable_at is None:
+                    logger.info(f"Worker {self.worker_id}: no shards left")
+                    break
+
+                sleep_seconds = max(
+                    self.min_idle_sleep_seconds,
+                    (next_claimable_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+                )
+                logger.info(f"Worker {self.worker_id}: no claimable shards, retrying in {sleep_seconds:.0f}s")
+                await asyncio.sleep(sleep_seconds)
+                continue
+
+            logger.info(
+                f"Worker {self.worker_id}: claimed shard [{shard.start_date}, {shard.end_date_excl})")
+
+            # fencing: results are only written while this claim still holds the lease
+            run_task = asyncio.create_task(self.extractor_pipeline.run(
+                shard.start_date, shard.end_date_excl,
+                write_fence=lambda: asyncio.to_thread(self.shard_coordinator.check_lease, shard, self.worker_id)
+            ))
+
+            if not await self._heartbeat_until_done(run_task, shard):
+                logger.warning(f"Worker {self.worker_id}: lost lease on shard {shard.shard_id}, abandoned it")
+                continue
+
+            try:
+                run_task.result()
+            except WriteFenceError:
+                logger.warning(f"Worker {self.worker_id}: lost lease on shard {shard.shard_id}, abandoned it")
+                continue
+            except Exception as e:
+                logger.warning(f"Worker {self.worker_id}: error running shard {shard.shard_id}, releasing it: {e}")
+                await asyncio.to_thread(self.shard_coordinator.release_shard, shard, self.worker_id)
+                continue
+
+            if await asyncio.to_thread(self.shard_coordinator.complete_shard, shard, self.worker_id):
+                logger.info(f"Worker {self.worker_id}: completed shard {shard.shard_id}")
+            else:
+                logger.warning(f"Worker {self.worker_id}: shard {shard.shard_id} was reclaimed before completion")
+
+    async def _heartbeat_until_done(self, run_task: asyncio.Task, shard: ExtractionShard) -> bool:
+        while not run_task.done():
+            await asyncio.wait({run_task}, timeout=self.heartbeat_interval_seconds)
+            if run_task.done():
+                break
+
+            if not await asyncio.to_thread(
+                    self.shard_coordinator.renew_lease, shard, self.worker_id, self.lease_seconds):
+                run_task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await run_task
+                return False
+
+        return True
@@ -0,0 +1,229 @@
+import abc
+import csv
+import dataclasses
+import logging
+import re
+from typing import Literal, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from feature_extractor.raw_html_reading import IFeatureResultRepo
+
+logger = logging.getLogger(__name__)
+
+ResolutionStatus = Literal["exact", "corrected_exchange", "ambiguous_exchange", "unresolved"]
+
+# exchange names, abbreviations and listing codes (nasdaqtrader.com symbol directory) -> canonical exchange
+EXCHANGE_ALIASES = {
+    "NASDAQ": "NASDAQ",
+    "NASDAQGS": "NASDAQ",
+    "NASDAQGM": "NASDAQ",
+    "NASDAQCM": "NASDAQ",
+    "NASDAQ GLOBAL SELECT": "NASDAQ",
+    "NASDAQ GLOBAL MARKET": "NASDAQ",
+    "NASDAQ CAPITAL MARKET": "NASDAQ",
+    "NASDAQ STOCK MARKET": "NASDAQ",
+    "NMS": "NASDAQ",
+    "Q": "NASDAQ",
+    "NYSE": "NYSE",
+    "NEW YORK STOCK EXCHANGE": "NYSE",
+    "N": "NYSE",
+    "NYSE AMERICAN": "NYSE AMERICAN",
+    "NYSE MKT": "NYSE AMERICAN",
+    "NYSEAMERICAN": "NYSE AMERICAN",
+    "AMEX": "NYSE AMERICAN",
+    "A": "NYSE AMERICAN",
+    "NYSE ARCA": "NYSE ARCA",
+    "NYSEARCA": "NYSE ARCA",
+    "ARCA": "NYSE ARCA",
+    "P": "NYSE ARCA",
+    "CBOE": "CBOE",
+    "CBOE BZX": "CBOE",
+    "BATS": "CBOE",
+    "Z": "CBOE",
+    "IEX": "IEX",
+    "V": "IEX",
+    "OTC": "OTC",
+    "OTCQX": "OTC",
+    "OTCQB": "OTC",
+    "OTC MARKETS": "OTC",
+    "PINK": "OTC",
+}
+
+# longer market names are mapped by prefix, e.g. 'NASDAQ GLOBAL SELECT MARKET', longest prefixes first
+_EXCHANGE_PREFIXES = ("NYSE AMERICAN", "NYSE ARCA", "NASDAQ", "NYSE", "OTC")
+
+_SHARE_CLASS_SEPARATOR_RE = re.compile(r"[\s./-]+")
+_EXCHANGE_NOISE_RE = re.compile(r"[^A-Z ]+")
+
+
+def normalize_exchange(exchange: str) -> str:
+    """
+    :return: canonical exchange, or the upper-cased exchange if it's not a known alias
+    """
+    exchange = _EXCHANGE_NOISE_RE.sub(" ", exchange.upper()).strip()
+    exchange = " ".join(exchange.split())
+
+    canonical = EXCHANGE_ALIASES.get(exchange) or EXCHANGE_ALIASES.get(exchange.replace(" ", ""))
+    if canonical is not None:
+        return canonical
+    return next((EXCHANGE_ALIASES[prefix] for prefix in _EXCHANGE_PREFIXES if exchange.startswith(prefix)), exchange)
+
+
+def symbol_key(symbol: str) -> str:
+    """
+    lookup key of a ticker: upper case, without cashtag or exchange prefix, share class separators unified,
+    e.g. '$brk-b', 'NYSE:BRK.B' and 'BRK/B' all give 'BRK.B'
+    """
+    symbol = symbol.strip().upper().lstrip("$")
+    if ":" in symbol:
+        symbol = symbol.rsplit(":", 1)[1]
+    return _SHARE_CLASS_SEPARATOR_RE.sub(".", symbol.strip()).strip(".")
+
+
+@dataclasses.dataclass
+class ResolvedSymbol:
+    symbol: str
+    stock_exchanges: list[str]
+    status: ResolutionStatus
+
+
+class ISymbolResolver(abc.ABC):
+
+    @abc.abstractmethod
+    def resolve(self, symbol: str, stock_exchanges: list[str]) -> ResolvedSymbol:
+        raise NotImplementedError
+
+    @property
+    @abc.abstractmethod
+    def name(self) -> str:
+        raise NotImplementedError
+
+
+class SymbolMasterResolver(ISymbolResolver):
+    """
+    hash index over a local symbol master file, loaded once.
+    the file is a csv (any delimiter, e.g. the pipe separated nasdaqtrader.com symbol directory files)
+    with a symbol column (symbol, act symbol or ticker) and an exchange column (exchange, listing exchange or market).
+    files without an exchange column (nasdaqlisted.txt) need default_exchange
+    """
+
+    SYMBOL_COLUMNS = ("symbol", "act symbol", "ticker")
+    EXCHANGE_COLUMNS = ("exchange", "listing exchange", "market")
+
+    def __init__(self, master_paths: list[str], default_exchange: str | None = None):
+        self.master_paths = master_paths
+        # symbol key (the canonical symbol) -> canonical exchanges it is listed on
+        self.exchanges: dict[str, set[str]] = {}
+
+        for path in master_paths:
+            self._load(path, default_exchange)
+
+        logger.info(f"Loaded {len(self.exchanges)} symbols from {master_paths}")
+
+    def _load(self, path: str, default_exchange: str | None):
+        with open(path, newline="", encoding="utf-8") as f:
+            dialect = csv.Sniffer().sniff(f.read(4_096), delimiters=",|;\t")
+            f.seek(0)
+            reader = csv.DictReader(f, dialect=dialect)
+
+            columns = {column.strip().lower(): column for column in reader.fieldnames or []}
+            symbol_column = next((columns[c] for c in self.SYMBOL_COLUMNS if c in columns), None)
+            exchange_column = next((columns[c] for c in self.EXCHANGE_COLUMNS if c in columns), None)
+            if symbol_column is None:
+                raise ValueError(f"No symbol column in {path}, expected one of {self.SYMBOL_COLUMNS}")
+            if exchange_column is None and default_exchange is None:
+                raise ValueError(f"No exchange column in {path}, expected one of {self.EXCHANGE_COLUMNS}")
+
+            for row in reader:
+                symbol = (row.get(symbol_column) or "").strip()
+                exchange = (row.get(exchange_column) or "").strip() if exchange_column else default_exchange
+                # nasdaqtrader.com files end with a 'File Creation Time: ...' row
+                if not symbol or not exchange or symbol.startswith("File Creation Time"):
+                    continue
+
+                self.exchanges.setdefault(symbol_key(symbol), set()).add(normalize_exchange(exchange))
+
+    @property
+    def name(self) -> str:
+        return "symbol_master"
+
+    def resolve(self, symbol: str, stock_exchanges: list[str]) -> ResolvedSymbol:
+        key = symbol_key(symbol)
+        listed_exchanges = self.exchanges.get(key)
+        if not listed_exchanges:
+            return ResolvedSymbol(symbol, stock_exchanges, "unresolved")
+
+        canonical_symbol = key
+        claimed_exchanges = {normalize_exchange(exchange) for exchange in stock_exchanges}
+
+        matching_exchanges = claimed_exchanges & listed_exchanges
+        if matching_exchanges:
+            return ResolvedSymbol(canonical_symbol, sorted(matching_exchanges), "exact")
+        if len(listed_exchanges) == 1:
+            return ResolvedSymbol(canonical_symbol, sorted(listed_exchanges), "corrected_exchange")
+        return ResolvedSymbol(canonical_symbol, sorted(listed_exchanges), "ambiguous_exchange")
+
+
+def resolve_extracted_symbols(symbol_resolver: ISymbolResolver, extracted_fields: dict) -> dict:
+    """
+    canonicalizes symbol and stock_exchanges of the resolved financial_event_with_symbols in place
+    (unresolved ones are kept as extracted) and builds the flat, indexed symbol fields
+    :return: fields to store next to the extracted fields, empty if they have no financial events
+    """
+    events = extracted_fields.get("financial_event_with_symbols")
+    if events is None:
+        return {}
+
+    symbols, listings, unresolved_symbols = set(), set(), set()
+    for event in events:
+        symbol_lookup = event["symbol"]
+        resolved = symbol_resolver.resolve(symbol_lookup["symbol"], symbol_lookup["stock_exchanges"])
+        if resolved.status == "unresolved":
+            unresolved_symbols.add(symbol_lookup["symbol"])
+            continue
+
+        symbol_lookup["symbol"] = resolved.symbol
+        symbol_lookup["stock_exchanges"] = resolved.stock_exchanges
+        symbols.add(resolved.symbol)
+        listings.update(f"{exchange}:{resolved.symbol}" for exchange in resolved.stock_exchanges)
+
+    return {
+        "symbols": sorted(symbols),
+        "listings": sorted(listings),
+        "unresolved_symbols": sorted(unresolved_symbols),
+        "symbol_resolver": symbol_resolver.name,
+    }
+
+
+def backfill_symbol_fields(
+        symbol_resolver: ISymbolResolver,
+        feature_result_repo: "IFeatureResultRepo",
+        batch_size: int = 1_000
+) -> int:
+    """
+    canonicalizes the events and adds the flat symbol fields of stored docs written without a symbol resolver
+    :return: number of updated docs
+    """
+    feature_result_repo.ensure_symbol_indexes()
+
+    updated_count = 0
+    after_id = None
+    while True:
+        docs = feature_result_repo.get_docs_without_symbols(after_id, batch_size)
+        if not docs:
+            break
+        after_id = docs[-1]["_id"]
+
+        symbol_fields_by_id = {}
+        for doc in docs:
+            symbol_fields = resolve_extracted_symbols(symbol_resolver, doc)
+            symbol_fields_by_id[doc["_id"]] = {
+                "financial_event_with_symbols": doc["financial_event_with_symbols"],
+                **symbol_fields,
+            }
+
+        feature_result_repo.write_symbol_fields(symbol_fields_by_id)
+        updated_count += len(docs)
+        logger.info(f"Resolved symbols of {updated_count} docs")
+
+    return updated_count
@@ -0,0 +1,17 @@
+import abc
+
+import numpy as np
+
+
+class IEmbeddingBackend(abc.ABC):
+
+    @abc.abstractmethod
+    def calc_embeddings(self, texts: list[str]) -> np.ndarray:
+        """
+        :return: float matrix with one row per text, in the order of texts
+        """
+        raise NotImplementedError
+
+    @property
+    def name(self) -> str:
+        return type(self).__name__
@@ -0,0 +1,300 @@
+import datetime as dt
+import json
+import logging
+import os
+import shutil
+from typing import Literal, TYPE_CHECKING
+
+from dateutil.relativedelta import relativedelta
+
+from ohlc_downloader.ohlc_gaps import NY_TZ
+from ohlc_downloader.trading_calendar import ITradingCalendar
+
+if TYPE_CHECKING:
+    import polars as pl
+    from pymongo.collection import Collection
+
+logger = logging.getLogger(__name__)
+
+SessionType = Literal['regular', 'extended']
+
+REGULAR_OPEN = dt.time(9, 30)
+EXTENDED_OPEN = dt.time(4, 0)
+EXTENDED_CLOSE = dt.time(20, 0)
+
+FINGERPRINT_FILE_NAME = '_fingerprint.json'
+
+OHLC_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+
+def _time_to_duration(time: dt.time) -> dt.timedelta:
+    return dt.timedelta(hours=time.hour, minutes=time.minute)
+
+
+def month_bounds(month: dt.date) -> tuple[dt.datetime, dt.datetime]:
+    """
+    :return: NY midnight of the first day of the month and of the next month
+    """
+    month = month.replace(day=1)
+    return (
+        dt.datetime.combine(month, dt.time.min, NY_TZ),
+        dt.datetime.combine(month + relativedelta(months=1), dt.time.min, NY_TZ),
+    )
+
+
+def load_minute_bars(
+        minute_mongo_ohlc_collection: "Collection",
+        symbol: str,
+        start: dt.datetime,
+        end_excl: dt.datetime
+) -> "pl.DataFrame":
+    """
+    :return: minute bars in the schema of convert_to_pl_df (timestamp in America/New_York), sorted by timestamp
+    """
+    return load_minute_bars_for_symbols(minute_mongo_ohlc_collection, [symbol], start, end_excl).drop('symbol')
+
+
+def load_minute_bars_for_symbols(
+        minute_mongo_ohlc_collection: "Collection",
+        symbols: list[str],
+        start: dt.datetime,
+        end_excl: dt.datetime
+) -> "pl.DataFrame":
+    """
+    single query for the minute bars of several symbols
+    :return: minute bars with a symbol column, timestamp in America/New_York, sorted by symbol and timestamp
+    """
+    import polars as pl
+
+    cursor = minute_mongo_ohlc_collection.find(
+        {'symbol': {'$in': symbols}, 'timestamp': {'$gte': start, '$lt': end_excl}},
+        {'_id': 0, 'symbol': 1, **{column: 1 for column in OHLC_COLUMNS}}
+    )
+
+    return (
+        pl.DataFrame(
+            list(cursor),
+            schema={
+                'symbol': pl.String,
+                'timestamp': pl.Datetime('us', 'UTC'),
+                'open': pl.Float64,
+                'high': pl.Float64,
+                'low': pl.Float64,
+                'close': pl.Float64,
+                'volume': pl.Int64,
+            },
+            strict=False
+        )
+        .with_columns(pl.col('timestamp').dt.convert_time_zone('America/New_York'))
+        # overlapping top-up downloads may have stored a bar twice
+        .unique(['symbol', 'timestamp'], keep='last')
+        .sort('symbol', 'timestamp')
+    )
+
+
+def filter_session_bars(
+        minute_df: "pl.DataFrame",
+        trading_calendar: ITradingCalendar,
+        session: SessionType
+) -> "pl.DataFrame":
+    """
+    keeps the bars of exchange sessions, between the open and the (possibly early) close for regular hours,
+    or between the pre-market open and the after-hours close for extended hours
+    """
+    import polars as pl
+
+    if minute_df.is_empty():
+        return minute_df
+
+    dates = minute_df.select(pl.col('timestamp').dt.date().unique()).to_series().to_list()
+    sessions = pl.DataFrame(
+        {
+            'session_date': [date for date in dates if trading_calendar.is_session(date)],
+        },
+        schema={'session_date': pl.Date}
+    ).with_columns(
+        pl.col('session_date').map_elements(
+            lambda date: trading_calendar.session_close(date) if session == 'regular' else EXTENDED_CLOSE,
+            return_dtype=pl.Time
+        ).alias('session_close')
+    )
+
+    session_open = REGULAR_OPEN if session == 'regular' else EXTENDED_OPEN
+
+    return (
+        minute_df
+        .with_columns(pl.col('timestamp').dt.date().alias('session_date'))
+        .join(sessions, on='session_date', how='inner')
+        .filter(
+            (pl.col('timestamp').dt.time() >= session_open)
+            & (pl.col('timestamp').dt.time() < pl.col('session_close'))
+        )
+        .drop('session_date', 'session_close')
+    )
+
+
+def resample_bars(
+        minute_df: "pl.DataFrame",
+        trading_calendar: ITradingCalendar,
+        every: str,
+        session: SessionType = 'regular'
+) -> "pl.DataFrame":
+    """
+    aggregates minute bars (optionally with a symbol column) into bars of a polars duration (5m, 15m, 1h, 1d, ...).
+    windows are aligned to the session open in America/New_York, e.g. 1h regular bars start at 9:30, 10:30, ...
+    and the last one is cut at the close. 1d gives one bar per session.
+    bars are labelled with their window start, vwap weights the minute typical price by volume
+    """
+    import polars as pl
+
+    session_open = _time_to_duration(REGULAR_OPEN if session == 'regular' else EXTENDED_OPEN)
+    group_by = ['symbol'] if 'symbol' in minute_df.columns else None
+
+    session_df = filter_session_bars(minute_df, trading_calendar, session)
+
+    # shifting the wall clock time by the session open lets group_by_dynamic align windows to the open,
+    # naive wall clock times keep windows the same length across DST changes
+    shifted_df = (
+        session_df
+        .with_columns(
+            (pl.col('timestamp').dt.replace_time_zone(None) - session_open).alias('session_clock'),
+            ((pl.col('high') + pl.col('low') + pl.col('close')) / 3 * pl.col('volume')).alias('_price_volume'),
+        )
+        .sort([*(group_by or []), 'session_clock'])
+    )
+
+    return (
+        shifted_df
+        .group_by_dynamic(
+            'session_clock', every=every, closed='left', label='left', start_by='window', group_by=group_by
+        )
+        .agg(
+            pl.col('open').first(),
+            pl.col('high').max(),
+            pl.col('low').min(),
+            pl.col('close').last(),
+            pl.col('volume').sum(),
+            (pl.col('_price_volume').sum() / pl.col('volume').sum()).alias('vwap'),
+            pl.len().alias('bar_count'),
+        )
+        .with_columns(
+            (pl.col('session_clock') + session_open)
+            .dt.replace_time_zone('America/New_York', ambiguous='earliest')
+            .alias('timestamp'),
+            # bars without volume have no vwap rather than NaN
+            pl.when(pl.col('volume') > 0).then(pl.col('vwap')).alias('vwap'),
+        )
+        .select([*(group_by or []), 'timestamp', 'open', 'high', 'low', 'close', 'volume', 'vwap', 'bar_count'])
+    )
+
+
+class ResampledBarCache:
+    """
+    parquet cache of resampled bars per symbol/month, {root}/{symbol}/{YYYY-MM}/{session}-{every}.parquet.
+    a fingerprint of the stored minute bars (count and last timestamp) is kept per symbol/month,
+    when new minute data lands the fingerprint changes and all cached timeframes of that month are recomputed.
+    the minute bars are read once per symbol/month for all missing timeframes
+    """
+
+    def __init__(
+            self,
+            root_dir: str,
+            minute_mongo_ohlc_collection: "Collection",
+            trading_calendar: ITradingCalendar
+    ):
+        self.root_dir = root_dir
+        self.minute_mongo_ohlc_collection = minute_mongo_ohlc_collection
+        self.trading_calendar = trading_calendar
+
+    def _month_dir(self, symbol: str, month: dt.date) -> str:
+        return os.path.join(self.root_dir, symbol, month.strftime('%Y-%m'))
+
+    def minute_data_fingerprint(self, symbol: str, month: dt.date) -> dict:
+        start, end_excl = month_bounds(month)
+        docs = list(self.minute_mongo_ohlc_collection.aggregate([
+            {'$match': {'symbol': symbol, 'timestamp': {'$gte': start, '$lt': end_excl}}},
+            {'$group': {'_id': None, 'bar_count': {'$sum': 1}, 'last_timestamp': {'$max': '$timestamp'}}},
+        ]))
+        if not docs:
+            return {'bar_count': 0, 'last_timestamp': None}
+        return {'bar_count': docs[0]['bar_count'], 'last_timestamp': docs[0]['last_timestamp'].isoformat()}
+
+    def _read_fingerprint(self, month_dir: str) -> dict | None:
+        path = os.path.join(month_dir, FINGERPRINT_FILE_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_fingerprint(self, month_dir: str, fingerprint: dict):
+        path = os.path.join(month_dir, FINGERPRINT_FILE_NAME)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(fingerprint, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def get_bars(
+            self,
+            symbol: str,
+            month: dt.date,
+            timeframes: list[tuple[str, SessionType]]
+    ) -> dict[tuple[str, SessionType], "pl.DataFrame"]:
+        """
+        :param timeframes: list of (every, session), e.g. [('5m', 'regular'), ('1d', 'extended')]
+        :return: (every, session) -> resampled bars of the symbol/month
+        """
+        import polars as pl
+
+        month = month.replace(day=1)
+        month_dir = self._month_dir(symbol, month)
+
+        fingerprint = self.minute_data_fingerprint(symbol, month)
+        if self._read_fingerprint(month_dir) != fingerprint and os.path.exists(month_dir):
+            logger.info(f'Minute data of [{symbol}, {month}] changed, invalidating cached bars')
+            shutil.rmtree(month_dir)
+
+        results = {}
+        missing_timeframes = []
+        for every, session in timeframes:
+            path = os.path.join(month_dir, f'{session}-{every}.parquet')
+            if os.path.exists(path):
+                results[(every, session)] = pl.read_parquet(path)
+            else:
+                missing_timeframes.append((every, session))
+
+        if not missing_timeframes:
+            return results
+
+        minute_df = load_minute_bars(self.minute_mongo_ohlc_collection, symbol, *month_bounds(month))
+        os.makedirs(month_dir, exist_ok=True)
+
+        for every, session in missing_timeframes:
+            bars_df = resample_bars(minute_df, self.trading_calendar, every, session)
+            bars_df.write_parquet(os.path.join(month_dir, f'{session}-{every}.parquet'))
+            results[(every, session)] = bars_df
+
+        self._write_fingerprint(month_dir, fingerprint)
+        logger.info(f'Resampled [{symbol}, {month}] to {missing_timeframes}')
+
+        return results
+
+    def get_bars_range(
+            self,
+            symbol: str,
+            start_month: dt.date,
+            end_month: dt.date,
+            every: str,
+            session: SessionType = 'regular'
+    ) -> "pl.DataFrame":
+        """
+        resampled bars of the months start_month..end_month (inclusive) concatenated
+        """
+        import polars as pl
+
+        frames = []
+        month = start_month.replace(day=1)
+        while month <= end_month:
+            frames.append(self.get_bars(symbol, month, [(every, session)])[(every, session)])
+            month += relativedelta(months=1)
+
+        return pl.concat(frames)
@@ -3,11 +3,14 @@ import dataclasses
 import io
 
 import datetime as dt
-import polars as pl
 import logging
+from typing import TYPE_CHECKING
 
 from interfaces.ohlc_downloader import IOhlcDownloader
 
+if TYPE_CHECKING:
+    import polars as pl
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,10 +26,32 @@ class OhlcDownloadResult:
     symbol: str
     start_dt: dt.date
     end_dt: dt.date
-    df: pl.DataFrame
+    df: "pl.DataFrame"
+
+
+def _ohlc_schema() -> dict:
+    import polars as pl
+
+    return {
+        'timestamp': pl.Datetime,
+        'day_of_month': pl.Int8,
+        'open': pl.Float64,
+        'high': pl.Float64,
+        'low': pl.Float64,
+        'close': pl.Float64,
+        'volume': pl.Int64
+    }
+
+
+def empty_ohlc_df() -> "pl.DataFrame":
+    import polars as pl
+
+    return pl.DataFrame(schema={**_ohlc_schema(), 'timestamp': pl.Datetime(time_zone='America/New_York')})
 
 
 def convert_to_pl_df(barchart_ohlc_data: str):
+    import polars as pl
+
     if barchart_ohlc_data.strip() == '':
         raise ValueError('No data')
 
@@ -38,16 +63,8 @@ def convert_to_pl_df(barchart_ohlc_data: str):
         data_io,
         has_header=False,
         try_parse_dates=True,
-        new_columns=[ts_column_name, 'day_of_month', 'open', 'high', 'low', 'close', 'volume'],
-        schema={
-            ts_column_name: pl.Datetime,
-            'day_of_month': pl.Int8,
-            'open': pl.Float64,
-            'high': pl.Float64,
-            'low': pl.Float64,
-            'close': pl.Float64,
-            'volume': pl.Int64
-        }
+        new_columns=list(_ohlc_schema()),
+        schema=_ohlc_schema()
     ).with_columns(
         pl.col(ts_column_name).dt.replace_time_zone('America/New_York'),
     )
@@ -82,6 +99,13 @@ class BarchartBatchDownloader(IBatchDownloader):
             if ohlc_val.strip() == '':
                 logger.info(
                     f'No data for {ohlc_download_request.symbol}, {ohlc_download_request.start_dt}, {ohlc_download_request.end_dt}')
+                # an empty result still tells that the span has no bars, see record_covered_sessions
+                results.append(OhlcDownloadResult(
+                    symbol=ohlc_download_request.symbol,
+                    start_dt=ohlc_download_request.start_dt,
+                    end_dt=ohlc_download_request.end_dt,
+                    df=empty_ohlc_df()
+                ))
                 continue
 
             if len(ohlc_val) < 100 and 'error' in ohlc_val.lower():
@@ -0,0 +1,212 @@
+import datetime as dt
+import logging
+from zoneinfo import ZoneInfo
+
+from pymongo import UpdateOne
+
+from ohlc_downloader.ohlc_downloaders import OhlcDownloadRequest, OhlcDownloadResult
+from ohlc_downloader.trading_calendar import ITradingCalendar
+
+logger = logging.getLogger(__name__)
+
+NY_TZ = ZoneInfo('America/New_York')
+
+# a session is only recorded as covered this long after its close, the vendor may still be adding its last bars
+COVERAGE_SETTLE_DELAY = dt.timedelta(hours=1)
+
+
+def get_stored_sessions(
+        minute_mongo_ohlc_dest_collection,
+        symbol_ranges: list[tuple[str, dt.date, dt.date]]
+) -> dict[str, dict[dt.date, dt.datetime]]:
+    """
+    single aggregation over the stored bars of several (symbol, start_date, end_date_excl) ranges
+    :return: symbol -> NY session date -> NY time of the session's last stored bar
+    """
+    if not symbol_ranges:
+        return {}
+
+    pipeline = [
+        {
+            '$match': {
+                '$or': [
+                    {
+                        'symbol': symbol,
+                        'timestamp': {
+                            '$gte': dt.datetime.combine(start_date, dt.time.min, NY_TZ),
+                            '$lt': dt.datetime.combine(end_date_excl, dt.time.min, NY_TZ),
+                        }
+                    }
+                    for symbol, start_date, end_date_excl in symbol_ranges
+                ]
+            }
+        },
+        {
+            '$group': {
+                '_id': {
+                    'symbol': '$symbol',
+                    'date': {
+                        '$dateToString': {'date': '$timestamp', 'format': '%Y-%m-%d', 'timezone': 'America/New_York'}
+                    },
+                },
+                'last_bar': {'$max': '$timestamp'},
+            }
+        },
+    ]
+
+    stored_sessions = {}
+    for doc in minute_mongo_ohlc_dest_collection.aggregate(pipeline, allowDiskUse=True):
+        last_bar = doc['last_bar'].replace(tzinfo=dt.timezone.utc).astimezone(NY_TZ)
+        stored_sessions.setdefault(doc['_id']['symbol'], {})[dt.date.fromisoformat(doc['_id']['date'])] = last_bar
+
+    return stored_sessions
+
+
+def _session_range_query(symbol_ranges: list[tuple[str, dt.date, dt.date]]) -> dict:
+    return {
+        '$or': [
+            {
+                'symbol': symbol,
+                'session': {
+                    '$gte': dt.datetime.combine(start_date, dt.time.min),
+                    '$lt': dt.datetime.combine(end_date_excl, dt.time.min),
+                }
+            }
+            for symbol, start_date, end_date_excl in symbol_ranges
+        ]
+    }
+
+
+def get_covered_sessions(
+        ohlc_coverage_collection,
+        symbol_ranges: list[tuple[str, dt.date, dt.date]]
+) -> dict[str, set[dt.date]]:
+    """
+    sessions which were downloaded after their close but have no or only some bars, see record_covered_sessions
+    :return: symbol -> NY session dates
+    """
+    if not symbol_ranges:
+        return {}
+
+    covered_sessions = {}
+    for doc in ohlc_coverage_collection.find(_session_range_query(symbol_ranges), {'symbol': 1, 'session': 1}):
+        covered_sessions.setdefault(doc['symbol'], set()).add(doc['session'].date())
+
+    return covered_sessions
+
+
+def record_covered_sessions(
+        ohlc_coverage_collection,
+        trading_calendar: ITradingCalendar,
+        download_results: list[OhlcDownloadResult],
+        now: dt.datetime | None = None
+) -> int:
+    """
+    records the closed sessions of successful downloads which came back without bars or ending before the close,
+    e.g. before a listing, after a delisting or halted, so that find_missing_spans doesn't request them forever
+    :return: number of recorded sessions
+    """
+    import polars as pl
+
+    now = now or dt.datetime.now(dt.timezone.utc)
+    now_ny = now.astimezone(NY_TZ)
+
+    operations = []
+    for result in download_results:
+        last_bars = dict(
+            result.df
+            .group_by(pl.col('timestamp').dt.date().alias('session'))
+            .agg(pl.col('timestamp').max())
+            .iter_rows()
+        )
+
+        for session in trading_calendar.sessions(result.start_dt, result.end_dt):
+            session_close = dt.datetime.combine(session, trading_calendar.session_close(session), NY_TZ)
+            if now_ny < session_close + COVERAGE_SETTLE_DELAY:
+                continue
+            last_bar = last_bars.get(session)
+            # the last minute bar of a full session is stamped one minute before the close
+            if last_bar is not None and last_bar >= session_close - dt.timedelta(minutes=1):
+                continue
+
+            operations.append(
+                UpdateOne(
+                    {'symbol': result.symbol, 'session': dt.datetime.combine(session, dt.time.min)},
+                    {'$set': {'last_bar': last_bar, 'checked_at': now}},
+                    upsert=True
+                )
+            )
+
+    if operations:
+        ohlc_coverage_collection.bulk_write(operations, ordered=False)
+
+    return len(operations)
+
+
+def find_missing_spans(
+        trading_calendar: ITradingCalendar,
+        start_date: dt.date,
+        end_date_excl: dt.date,
+        stored_last_bars: dict[dt.date, dt.datetime],
+        now: dt.datetime,
+        covered_sessions: set[dt.date] = frozenset()
+) -> list[tuple[dt.date, dt.date]]:
+    """
+    sessions without stored bars, plus the latest stored session when its last bar is before the close
+    (a partially downloaded or intraday topped-up session), except covered sessions, which the vendor has no
+    (more) bars for. consecutive sessions are coalesced into spans
+    :return: list of (first session, day after the last session)
+    """
+    now_ny = now.astimezone(NY_TZ)
+    sessions = trading_calendar.sessions(start_date, min(end_date_excl, now_ny.date() + dt.timedelta(days=1)))
+
+    incomplete_session = None
+    if stored_last_bars:
+        latest_stored_session = max(stored_last_bars)
+        session_close = dt.datetime.combine(
+            latest_stored_session, trading_calendar.session_close(latest_stored_session), NY_TZ)
+        # the last minute bar of a full session is stamped one minute before the close
+        if stored_last_bars[latest_stored_session] < session_close - dt.timedelta(minutes=1):
+            incomplete_session = latest_stored_session
+
+    spans = []
+    span_start = previous_session = None
+    for session in sessions:
+        missing = (
+                (session not in stored_last_bars or session == incomplete_session)
+                and session not in covered_sessions
+        )
+        if missing and span_start is None:
+            span_start = session
+        elif not missing and span_start is not None:
+            spans.append((span_start, previous_session + dt.timedelta(days=1)))
+            span_start = None
+        previous_session = session
+
+    if span_start is not None:
+        spans.append((span_start, previous_session + dt.timedelta(days=1)))
+
+    return spans
+
+
+def build_gap_download_requests(
+        minute_mongo_ohlc_dest_collection,
+        trading_calendar: ITradingCalendar,
+        symbol_ranges: list[tuple[str, dt.date, dt.date]],
+        now: dt.datetime | None = None,
+        ohlc_coverage_collection=None
+) -> list[OhlcDownloadRequest]:
+    now = now or dt.datetime.now(dt.timezone.utc)
+    stored_sessions = get_stored_sessions(minute_mongo_ohlc_dest_collection, symbol_ranges)
+    covered_sessions = (
+        get_covered_sessions(ohlc_coverage_collection, symbol_ranges) if ohlc_coverage_collection is not None else {}
+    )
+
+    requests = []
+    for symbol, start_date, end_date_excl in symbol_ranges:
+        for span_start, span_end_excl in find_missing_spans(
+                trading_calendar, start_date, end_date_excl, stored_sessions.get(symbol, {}), now,
+                covered_sessions.get(symbol, set())):
+            requests.append(OhlcDownloadRequest(symbol, span_start, span_end_excl))
+
+    return requests
@@ -0,0 +1,128 @@
+import abc
+import datetime as dt
+import functools
+
+
+class ITradingCalendar(abc.ABC):
+
+    @abc.abstractmethod
+    def is_session(self, date: dt.date) -> bool:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def session_close(self, date: dt.date) -> dt.time:
+        """
+        exchange local close time of a session
+        """
+        raise NotImplementedError
+
+    def sessions(self, start_date: dt.date, end_date_excl: dt.date) -> list[dt.date]:
+        sessions = []
+        date = start_date
+        while date < end_date_excl:
+            if self.is_session(date):
+                sessions.append(date)
+            date += dt.timedelta(days=1)
+        return sessions
+
+
+def _easter_sunday(year: int) -> dt.date:
+    # anonymous gregorian algorithm
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return dt.date(year, month, day + 1)
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> dt.date:
+    first = dt.date(year, month, 1)
+    return first + dt.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+
+
+def _last_weekday(year: int, month: int, weekday: int) -> dt.date:
+    next_month_first = dt.date(year + month // 12, month % 12 + 1, 1)
+    last = next_month_first - dt.timedelta(days=1)
+    return last - dt.timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(date: dt.date) -> dt.date:
+    # saturday holidays are observed on friday, sunday holidays on monday
+    if date.weekday() == 5:
+        return date - dt.timedelta(days=1)
+    if date.weekday() == 6:
+        return date + dt.timedelta(days=1)
+    return date
+
+
+class NyseTradingCalendar(ITradingCalendar):
+    """
+    NYSE / NASDAQ sessions from the exchange holiday rules, plus the unscheduled closures since 2010
+    """
+
+    REGULAR_CLOSE = dt.time(16, 0)
+    EARLY_CLOSE = dt.time(13, 0)
+
+    UNSCHEDULED_CLOSURES = {
+        dt.date(2012, 10, 29),  # hurricane sandy
+        dt.date(2012, 10, 30),
+        dt.date(2018, 12, 5),  # national day of mourning, george h. w. bush
+        dt.date(2025, 1, 9),  # national day of mourning, jimmy carter
+    }
+
+    @staticmethod
+    @functools.cache
+    def holidays(year: int) -> frozenset[dt.date]:
+        holidays = {
+            _nth_weekday(year, 1, 0, 3),  # martin luther king jr. day
+            _nth_weekday(year, 2, 0, 3),  # washington's birthday
+            _easter_sunday(year) - dt.timedelta(days=2),  # good friday
+            _last_weekday(year, 5, 0),  # memorial day
+            _observed(dt.date(year, 7, 4)),  # independence day
+            _nth_weekday(year, 9, 0, 1),  # labor day
+            _nth_weekday(year, 11, 3, 4),  # thanksgiving
+            _observed(dt.date(year, 12, 25)),  # christmas
+        }
+
+        # new year's day on a saturday is not observed on the friday before, which is in the previous year
+        new_years_day = dt.date(year, 1, 1)
+        if new_years_day.weekday() != 5:
+            holidays.add(_observed(new_years_day))
+
+        if year >= 2022:
+            holidays.add(_observed(dt.date(year, 6, 19)))  # juneteenth
+
+        return frozenset(holidays)
+
+    @staticmethod
+    @functools.cache
+    def early_closes(year: int) -> frozenset[dt.date]:
+        early_closes = {
+            _nth_weekday(year, 11, 3, 4) + dt.timedelta(days=1),  # day after thanksgiving
+        }
+
+        independence_day_eve = dt.date(year, 7, 3)
+        if independence_day_eve.weekday() < 5 and dt.date(year, 7, 4).weekday() < 5:
+            early_closes.add(independence_day_eve)
+
+        christmas_eve = dt.date(year, 12, 24)
+        if christmas_eve.weekday() < 5:
+            early_closes.add(christmas_eve)
+
+        return frozenset(early_closes)
+
+    def is_session(self, date: dt.date) -> bool:
+        return (
+                date.weekday() < 5
+                and date not in self.holidays(date.year)
+                and date not in self.UNSCHEDULED_CLOSURES
+        )
+
+    def session_close(self, date: dt.date) -> dt.time:
+        return self.EARLY_CLOSE if date in self.early_closes(date.year) else self.REGULAR_CLOSE
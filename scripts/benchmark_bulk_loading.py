@@ -0,0 +1,129 @@
+import argparse
+import datetime
+import random
+import sys
+import time
+
+import more_itertools
+
+from feature_export.bulk_loading import ExtractedDataBulkLoader
+from feature_export.parquet_mirror import docs_to_df, feature_mirror_schema
+from feature_extractor.field_structure_definitions import FinancialNewsExtractedData
+
+
+def synthetic_docs(count: int, seed: int = 0) -> list[dict]:
+    """
+    docs shaped like stored extraction results, with list lengths typical of real articles
+    """
+    rng = random.Random(seed)
+    words = [f'word{i}' for i in range(1_000)]
+
+    def text(n: int) -> str:
+        return ' '.join(rng.choices(words, k=n))
+
+    docs = []
+    for i in range(count):
+        docs.append({
+            '_id': f'{i:024x}',
+            'url': f'https://example.com/{i}',
+            'download_time': datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=i),
+            'publish_time': datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=i),
+            'article_title': text(10),
+            'summary': text(80),
+            'main_company': text(2),
+            'article_language': 'en',
+            'financial_event_with_symbols': [
+                {
+                    'financial_event': 'StockBuyback',
+                    'symbol': {'symbol': text(1).upper()[:4], 'stock_exchanges': ['NASDAQ']},
+                }
+                for _ in range(rng.randint(0, 4))
+            ],
+            'keywords': [{'keyword': text(1), 'keyword_score': rng.random() * 100} for _ in range(10)],
+            'sentiments': [
+                {
+                    'sentiment': 'positive',
+                    'sentiment_confidence': rng.random(),
+                    'sentiment_score': rng.random() * 200 - 100,
+                    'chain_of_thought_reasoning': text(40),
+                }
+                for _ in range(2)
+            ],
+            'external_links': [
+                {'url': f'https://example.com/l{j}', 'link_text': text(3), 'type': 'article', 'metadata': []}
+                for j in range(rng.randint(0, 3))
+            ],
+            'entities': [
+                {'entity': text(2), 'entity_type': 'company', 'entity_description': text(12)} for _ in range(8)
+            ],
+            'relationships': [
+                {
+                    'source_entity': text(2),
+                    'relationship_descriptions': [text(4)],
+                    'relationship_descriptions_condensed': [text(1)],
+                    'target_entity': text(2),
+                    'relationship_strength': rng.random(),
+                }
+                for _ in range(5)
+            ],
+            'model_name': 'benchmark',
+        })
+    return docs
+
+
+def records_per_second(label: str, count: int, fn) -> float:
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<40} {count / elapsed:>12,.0f} records/s')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='records/s of per-doc model validation, batched TypeAdapter validation, unvalidated '
+                    'model construction and the columnar path')
+    parser.add_argument('--count', type=int, default=20_000, help='number of synthetic docs')
+    parser.add_argument('--batch-size', type=int, default=5_000)
+    parser.add_argument('--parquet-root', help='also benchmark reading the parquet feature mirror')
+    args = parser.parse_args()
+
+    docs = synthetic_docs(args.count)
+    loader = ExtractedDataBulkLoader(batch_size=args.batch_size)
+    schema = feature_mirror_schema()
+
+    print(f'{args.count} synthetic docs, batches of {args.batch_size}')
+
+    records_per_second(
+        'per-doc model_validate', len(docs),
+        lambda: [FinancialNewsExtractedData.model_validate(doc) for doc in docs]
+    )
+    records_per_second(
+        'batched TypeAdapter(list[...])', len(docs),
+        lambda: [loader.validate_batch(batch) for batch in more_itertools.chunked(docs, args.batch_size)]
+    )
+    records_per_second(
+        'batched model_construct, no validation', len(docs),
+        lambda: [loader.construct_batch(batch) for batch in more_itertools.chunked(docs, args.batch_size)]
+    )
+    records_per_second(
+        'columnar, no validation', len(docs),
+        lambda: [docs_to_df(batch, schema) for batch in more_itertools.chunked(docs, args.batch_size)]
+    )
+
+    if args.parquet_root:
+        parquet_count = sum(len(df) for df in loader.iter_parquet_columnar(args.parquet_root))
+        if not parquet_count:
+            sys.exit(f'no rows in {args.parquet_root}')
+        records_per_second(
+            'parquet mirror, batched validation', parquet_count,
+            lambda: list(loader.iter_parquet(args.parquet_root))
+        )
+        records_per_second(
+            'parquet mirror, columnar', parquet_count,
+            lambda: list(loader.iter_parquet_columnar(args.parquet_root))
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import json
+import sys
+import time
+
+import zstandard as zstd
+
+from cli.config import load_config
+from cli.train_zstd_dict import sample_summaries
+from embeddings.embedding_calc import ZstdCodec, train_zstd_dictionary
+
+
+def benchmark(codec: ZstdCodec, batches: list[bytes], repeat: int) -> tuple[float, float]:
+    """
+    :return: (compression ratio, CPU ms per batch)
+    """
+    compressed_size = sum(len(codec.compress(batch)) for batch in batches)
+
+    start = time.process_time()
+    for _ in range(repeat):
+        for batch in batches:
+            codec.compress(batch)
+    cpu_ms_per_batch = (time.process_time() - start) * 1_000 / (repeat * len(batches))
+
+    return sum(len(batch) for batch in batches) / compressed_size, cpu_ms_per_batch
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='compression ratio and CPU time per embedding request batch, by level and dictionary')
+    parser.add_argument('--config')
+    parser.add_argument('--summaries-file', help='json list of summaries, instead of sampling them from mongo')
+    parser.add_argument('--sample-size', type=int, default=20_000)
+    parser.add_argument('--batch-size', type=int, default=1_000)
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 3, 6, 9, 12, 19])
+    parser.add_argument('--dict-size', type=int, default=112_640)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.summaries_file:
+        with open(args.summaries_file) as f:
+            summaries = json.load(f)
+    else:
+        summaries = sample_summaries(load_config(args.config), args.sample_size)
+
+    # the dictionary is trained on a different half of the sample than it is benchmarked on
+    train_summaries, benchmark_summaries = summaries[::2], summaries[1::2]
+    dictionary = zstd.ZstdCompressionDict(train_zstd_dictionary(train_summaries, args.dict_size))
+
+    batches = [
+        json.dumps(benchmark_summaries[i:i + args.batch_size]).encode('utf-8')
+        for i in range(0, len(benchmark_summaries), args.batch_size)
+    ]
+    if not batches:
+        sys.exit('no summaries to benchmark')
+
+    print(f'{len(batches)} batches of up to {args.batch_size} summaries, '
+          f'{sum(len(b) for b in batches) / len(batches) / 1_000:.1f} KB per batch')
+    print(f"{'level':>5} {'dictionary':>10} {'ratio':>7} {'cpu ms/batch':>13}")
+
+    for level in args.levels:
+        for use_dictionary in (False, True):
+            codec = ZstdCodec(level, zstd.ZstdCompressionDict(dictionary.as_bytes()) if use_dictionary else None)
+            ratio, cpu_ms_per_batch = benchmark(codec, batches, args.repeat)
+            print(f'{level:>5} {str(use_dictionary):>10} {ratio:>7.2f} {cpu_ms_per_batch:>13.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# modules which must only be imported by a command's run, never at cli startup
+HEAVY_MODULES = [
+    'instructor',
+    'google.generativeai',
+    'vertexai',
+    'trafilatura',
+    'sentence_transformers',
+    'torch',
+    'transformers',
+    'polars',
+    'duckdb',
+    'grpc',
+    'clickhouse_connect',
+    'pymongo',
+    'numpy',
+]
+
+DEFAULT_BUDGET_MS = 150
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_TIME_LINE_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def measure_import_time(cli_args: list[str]) -> tuple[float, set[str]]:
+    """
+    :return: (cumulative import time of top level imports in ms, imported module names)
+    """
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'cli', *cli_args],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=REPO_ROOT
+    )
+
+    total_us = 0
+    imported_modules = set()
+    for line in completed.stderr.splitlines():
+        match = IMPORT_TIME_LINE_RE.match(line)
+        if not match:
+            continue
+        _, cumulative_us, indent, module_name = match.groups()
+        imported_modules.add(module_name)
+        # nested imports are indented, their time is already part of the top level import's cumulative time
+        if len(indent) == 1:
+            total_us += int(cumulative_us)
+
+    return total_us / 1_000, imported_modules
+
+
+def cli_arg_lists() -> list[list[str]]:
+    """
+    --help of the cli and of every command
+    """
+    from cli.main import COMMANDS
+
+    command_names = [command.__name__.rsplit('.', 1)[-1].replace('_', '-') for command in COMMANDS]
+    return [['--help'], *([command_name, '--help'] for command_name in command_names)]
+
+
+def heavy_imports(imported_modules: set[str]) -> list[str]:
+    return sorted(
+        module
+        for module in imported_modules
+        if any(module == heavy or module.startswith(heavy + '.') for heavy in HEAVY_MODULES)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='checks cli startup import time against a budget')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args()
+
+    failed = False
+    for cli_args in cli_arg_lists():
+        import_time_ms, imported_modules = measure_import_time(cli_args)
+        heavy_imported = heavy_imports(imported_modules)
+
+        ok = import_time_ms <= args.budget_ms and not heavy_imported
+        failed = failed or not ok
+
+        print(
+            f"{'OK  ' if ok else 'FAIL'} {' '.join(cli_args):<28} {import_time_ms:8.1f} ms"
+            + (f"  heavy imports: {', '.join(heavy_imported)}" if heavy_imported else '')
+        )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
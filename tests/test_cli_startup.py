@@ -0,0 +1,12 @@
+import pytest
+
+from scripts.measure_cli_startup import DEFAULT_BUDGET_MS, cli_arg_lists, heavy_imports, measure_import_time
+
+
+@pytest.mark.parametrize('cli_args', cli_arg_lists(), ids=' '.join)
+def test_cli_startup(cli_args: list[str]):
+    import_time_ms, imported_modules = measure_import_time(cli_args)
+
+    # heavy modules must only be imported by a command's run
+    assert heavy_imports(imported_modules) == []
+    assert import_time_ms <= DEFAULT_BUDGET_MS